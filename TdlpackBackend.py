@@ -2,6 +2,8 @@
 # TdlpackBackend is a backend entrypoint for decoding sequential tdlpack files with the engine 'tdlpack'
 # TdlpackBackend is pre-release and the API is subject to change without backward compatability
 from pathlib import Path
+import functools
+import os
 import shutil
 import datetime
 import numbers
@@ -10,6 +12,7 @@ import typing
 from copy import copy
 from abc import ABC, abstractmethod
 from itertools import product
+from concurrent.futures import ProcessPoolExecutor
 import logging
 import numpy as np
 import pandas as pd
@@ -21,13 +24,15 @@ from xarray.backends.common import (
     BackendEntrypoint,
 )
 from xarray.core import indexing
-from xarray.backends.locks import SerializableLock
+from xarray.backends.file_manager import CachingFileManager
 import pytdlpack
+from pytdlpack._pytdlpack import latlon_cache, _compute_latlons
 import TdlpackIO
 
 logger = logging.getLogger(__name__)
 
-LOCK = SerializableLock()
+# default target size in bytes of the chunks advertised as preferred_chunks
+PREFERRED_CHUNK_BYTES = 64 * 2**20
 
 class TdlpackBackendEntrypoint(BackendEntrypoint):
     ''' xarray backend engine entrypoint for opening and  decoding sequential tdlpack files.
@@ -48,6 +53,9 @@ class TdlpackBackendEntrypoint(BackendEntrypoint):
         applies whitelist filters to select data of interest; often useful for reducing data
         down to a non-sparse selection
         The tdlpack is considered not sparse when variables built have the same shape.
+    preferred_chunk_bytes: int, optional
+        target size in bytes of the preferred chunks, used when opening with chunks={};
+        chunks always hold whole records and group records along the other dimensions
     '''
     def open_dataset(
         self,
@@ -56,58 +64,202 @@ class TdlpackBackendEntrypoint(BackendEntrypoint):
         drop_variables = None,
         name_scheme: list = ['ccc','fff'],
         filters: typing.Mapping[str, any] = None,
+        preferred_chunk_bytes: int = PREFERRED_CHUNK_BYTES,
     ):
 
-        # read and parse metadata from tdlpack file
-        f = TdlpackIO.open(filename)
-        file_index = pd.DataFrame(f._index)
+        # read and parse metadata from tdlpack file; the file is indexed once and the file
+        # manager opens it with that index, as TdlpackCatalog does, so the open file is
+        # reused to load chunks and a pickled dataset reopens the file without indexing it;
+        # the manager holds a lock per file for opening and closing it
+        with TdlpackIO.open(filename, mode='r') as f:
+            index = f._index
+        manager = CachingFileManager(functools.partial(TdlpackIO.open, index=index), filename, mode='r')
+        f = manager.acquire()
+        file_index = index_to_components(f._index, filters)
+
+        return build_dataset(file_index, name_scheme, filters, f, manager, preferred_chunk_bytes)
+
+
+def index_to_components(file_index, filters, record_offset=0):
+    ''' dataframe of the parsed metadata of the data records of a TdlpackIO index;
+        filters on id components, date and lead are applied to the raw index before the
+        dataframe of records is built; record_offset is added to the record numbers '''
+    records = filter_records(file_index, filters)
+    df = pd.DataFrame({k: [v[n] for n in records] for k, v in file_index.items()}, index=records)
+    df = parse_tdlpackio_index_to_components(df)
+    if record_offset:
+        linked = df.linked_station_id_record.to_numpy(dtype='int64')
+        df = df.assign(record=df.record + record_offset,
+                       linked_station_id_record=np.where(linked > 0, linked + record_offset, 0))
+    return df
+
+def build_dataset(file_index, name_scheme, filters, f, manager, preferred_chunk_bytes=PREFERRED_CHUNK_BYTES) -> xr.Dataset:
+    ''' build the lazily loaded dataset of the records in file_index, read from f through manager '''
+    # divide up records by variable based on name scheme and filters
+    filters = copy(filters)
+    frames, cube, extra_geo, one_sta_list, is2, station_maps = make_variables(file_index, name_scheme, filters, f)
+    # return empty dataset if no data
+    if frames is None:
+        manager.close()
+        return xr.Dataset()
+
+    # create dataframe and add datarrays without any coords
+    ds = xr.Dataset()
+    for var_df in frames:
+        da = build_da_without_coords(var_df, cube, f, one_sta_list, manager, station_maps, preferred_chunk_bytes)
+        da.encoding['tdlp_is2'] = is2
+#        da.encoding['tdlp_datset_name_scheme'] = name_scheme
+        ds[da.name] = da
+
+    # assign coords from the cube; the cube prevents datarrays with different shapes
+    ds = ds.assign_coords(cube.coords())
+    # assign extra geo coords
+    ds = ds.assign_coords(extra_geo)
+    ds.set_close(manager.close)
+
+    return ds
+
+
+# record numbers of a catalog are file number * CATALOG_RECORD_STRIDE + record number in the file
+CATALOG_RECORD_STRIDE = 2**32
+
+def index_file(filename) -> dict:
+    ''' TdlpackIO index of a file; run in worker processes by open_catalog '''
+    with TdlpackIO.open(filename) as f:
+        return f._index
+
+class TdlpackCatalog:
+    ''' records of many tdlpack files addressed by catalog record numbers
+
+    The files are opened with the index built by open_catalog, through one CachingFileManager
+    per file, so they are not indexed again when chunks are loaded.  The catalog is its own
+    file manager: acquire returns the catalog. '''
 
-        file_index = parse_tdlpackio_index_to_components(file_index)
+    def __init__(self, filenames, indexes):
+        self.name = list(filenames)
+        self.managers = [CachingFileManager(functools.partial(TdlpackIO.open, index=index), filename, mode='r')
+                         for filename, index in zip(filenames, indexes)]
 
-        # divide up records by variable based on name scheme and filters
-        filters = copy(filters)
-        frames, cube, extra_geo, one_sta_list, is2 = make_variables(file_index, name_scheme, filters, f)
-        # return empty dataset if no data
-        if frames is None:
-            return xr.Dataset()
+    def acquire(self, needs_lock=True):
+        return self
 
-        # create dataframe and add datarrays without any coords
-        ds = xr.Dataset()
-        for var_df in frames:
-            da = build_da_without_coords(var_df, cube, f, one_sta_list)
-            da.encoding['tdlp_is2'] = is2
-#            da.encoding['tdlp_datset_name_scheme'] = name_scheme
-            ds[da.name] = da
+    def _file(self, rec):
+        n, rec = divmod(int(rec), CATALOG_RECORD_STRIDE)
+        return self.managers[n].acquire(), rec
 
-        # assign coords from the cube; the cube prevents datarrays with different shapes
-        ds = ds.assign_coords(cube.coords())
-        # assign extra geo coords
-        ds = ds.assign_coords(extra_geo)
+    def get_record(self, rec, unpack=True):
+        f, rec = self._file(rec)
+        return f.get_record(rec, unpack)
 
-        return ds
+    def __getitem__(self, rec):
+        return self.get_record(rec)
+
+    def _get_station_list(self, rec):
+        f, rec = self._file(rec)
+        return f._get_station_list(rec)
+
+    def close(self):
+        for manager in self.managers:
+            manager.close()
+
+def open_catalog(filenames, *, name_scheme: list = ['ccc','fff'], filters: typing.Mapping[str, any] = None,
+                 workers: int = None, preferred_chunk_bytes: int = PREFERRED_CHUNK_BYTES, chunks: dict = None) -> xr.Dataset:
+    ''' open many sequential tdlpack files (e.g. an archive of daily files) as one lazily loaded dataset
+
+    The files are indexed in parallel by a process pool and their indexes are merged into a
+    single cube description, so no per-file datasets are built and concatenated; each chunk
+    reads its records directly from the files that hold them. A record (same variable, date,
+    lead and other dimensions) that is found in more than one file raises a ValueError.
+
+    Parameters
+    __________
+
+    filenames: list of str or Path
+        sequential tdlpack files to be opened
+    name_scheme: list of strings with tdlpack metadata, optional
+        as for open_dataset
+    filters: dict, optional
+        as for open_dataset; applied to the index of each file
+    workers: int, optional
+        number of processes indexing files; the default is the number of CPUs
+    preferred_chunk_bytes: int, optional
+        as for open_dataset
+    chunks: dict, optional
+        dask chunks of the variables; dims that are not given use the preferred chunks, so {}
+        gives record aligned chunks as with open_dataset(..., chunks={})
+    '''
+    filenames = [str(filename) for filename in filenames]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(min(workers, len(filenames)), 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            indexes = list(executor.map(index_file, filenames))
+    else:
+        indexes = [index_file(filename) for filename in filenames]
+
+    frames = [index_to_components(index, filters, n * CATALOG_RECORD_STRIDE) for n, index in enumerate(indexes)]
+    file_index = pd.concat(frames).reset_index(drop=True) if frames else pd.DataFrame()
+    catalog = TdlpackCatalog(filenames, indexes)
+    if file_index.empty:
+        catalog.close()
+        return xr.Dataset()
+    ds = build_dataset(file_index, name_scheme, filters, catalog, catalog, preferred_chunk_bytes)
+    if chunks is not None:
+        preferred = dict()
+        for da in ds.data_vars.values():
+            preferred.update(da.encoding.get('preferred_chunks', {}))
+        ds = ds.chunk({**preferred, **chunks})
+    return ds
 
 
 class TdlpackBackendArray(BackendArray):
 
-    def __init__(self, array, lock):
+    def __init__(self, array):
         self.array = array
         self.shape = array.shape
         self.dtype = np.dtype(array.dtype)
-        self.lock = lock
 
 
     def __getitem__(self, key: xr.core.indexing.ExplicitIndexer) -> np.typing.ArrayLike:
         return xr.core.indexing.explicit_indexing_adapter(
             key,
             self.shape,
-            indexing.IndexingSupport.BASIC,
+            indexing.IndexingSupport.OUTER,
             self._raw_getitem,
         )
 
     def _raw_getitem(self, key: tuple):
-        # thread safe method implementing access to data on disk
-        with self.lock:
-            return self.array[key]
+        # thread safe method implementing access to data on disk; records are read with
+        # positioned reads that do not share a file position, so no lock is held
+        return self.array[key]
+
+
+class LatLonBackendArray(BackendArray):
+    ''' latitude or longitude (y, x) of a grid; computed on first access, longitude positive east '''
+
+    def __init__(self, grid_def, name):
+        self.grid_def = grid_def
+        self.name = name
+        self.shape = (int(grid_def['ny']), int(grid_def['nx']))
+        self.dtype = np.dtype('float32')
+
+    def __getitem__(self, key: xr.core.indexing.ExplicitIndexer) -> np.typing.ArrayLike:
+        return xr.core.indexing.explicit_indexing_adapter(
+            key,
+            self.shape,
+            indexing.IndexingSupport.OUTER,
+            self._raw_getitem,
+        )
+
+    def _raw_getitem(self, key: tuple):
+        lats, lons = latlon_cache.get(self.grid_def, _compute_latlons)
+        outer_key = tuple([slice(i, i+1) if isinstance(i, (int, np.integer)) else i for i in key])
+        if self.name == 'latitude':
+            array = np.array(outer_index(lats.transpose(), outer_key))
+        else:
+            array = outer_index(lons.transpose(), outer_key) * -1
+        return array[tuple([0 if isinstance(i, (int, np.integer)) else slice(None) for i in key])]
 
 
 def exclusive_slice_to_inclusive(item):
@@ -218,6 +370,8 @@ class OnDiskArray:
     index: pd.DataFrame = field(repr=False)
     cube: TdlpCube = field(repr=False)
     one_station_list_and_ordered: bool = field(repr=False)
+    manager: CachingFileManager = field(default=None, repr=False)
+    station_maps: dict = field(default=None, repr=False)
     shape: typing.Tuple[int, ...] = field(init=False)
     ndim: int = field(init=False)
     geo_ndim: int = field(init=False)
@@ -227,39 +381,52 @@ class OnDiskArray:
         if not self.cube.station is None:
             geo_shape = (len(self.cube.station),) # for stations, the record may not actually be this shape, but is converted to this shape
         else:
-            geo_shape = self.index.iloc[0].record_shape  # multiple grids not allowed so can just use first
+            geo_shape = record_shape(self.index.iloc[0])  # multiple grids not allowed so can just use first
 
         self.geo_shape = geo_shape
         self.geo_ndim = len(geo_shape)
 
-        if self.index.index.nlevels == 1:
-            self.shape = (len(self.index),) + geo_shape
+        # chunk plan: record number (0 where there is no record) and linked station record
+        # number for each cell of the cube of records
+        mi = self.index.index
+        if isinstance(mi, pd.MultiIndex):
+            cube_shape = tuple([len(i) for i in mi.levels])
+            cells = tuple([np.asarray(c) for c in mi.codes])
         else:
-            self.shape = tuple([len(i) for i in self.index.index.levels]) + geo_shape
+            cube_shape = (len(self.index),)
+            cells = (np.arange(len(self.index)),)
+        self.records = np.zeros(cube_shape, dtype=np.int64)
+        self.records[cells] = self.index.record.to_numpy()
+        self.station_records = np.zeros(cube_shape, dtype=np.int64)
+        self.station_records[cells] = self.index.linked_station_id_record.to_numpy()
+
+        self.shape = cube_shape + geo_shape
         self.ndim = len(self.shape)
 
 
     def __getitem__(self, item) -> np.array:
         # dimensions not in index are internal to tdlpack records; 2 dims for grids; 1 dim for stations
-        f = TdlpackIO.open(self.file_name)
-
-        index_slicer = item[:-self.geo_ndim]
-        index_slicer = tuple([[i] if isinstance(i, int) else i for i in index_slicer]) # maintain all multindex levels
-        # pandas loc slicing is inclusive, therefore convert slices into explicit lists
-        index_slicer_inclusive = tuple([ exclusive_slice_to_inclusive(i) if isinstance(i, slice) else i for i in index_slicer])
-
-        # get records selected by item in new index dataframe
-        index = self.index.loc[index_slicer_inclusive, :]
-        index = index.set_index(index.index)
-
-        # reset miloc to new relative locations in sub array
-        index['miloc'] = list(zip(*[index.index.unique(level=dim).get_indexer(index.index.get_level_values(dim)) for dim in index.index.names]))
-        array_field_shape = index.index.levshape + self.geo_shape
-
-        array_field = np.full(array_field_shape, fill_value=np.nan, dtype="float32")
-
-        for key, row in index.iterrows():
-            record = f[row['record']]
+        # the open file and its index are shared by all chunks; the manager reopens the file
+        # if it was closed or the array was pickled to another process
+        if self.manager is None:
+            self.manager = CachingFileManager(TdlpackIO.open, self.file_name, mode='r')
+        f = self.manager.acquire()
+
+        # integers are taken as length one slices to maintain all dimensions until the end;
+        # keys are outer indexers so each dimension is indexed separately
+        key = tuple([slice(i, i+1) if isinstance(i, (int, np.integer)) else i for i in item])
+        cube_key = key[:-self.geo_ndim]
+        geo_key = key[-self.geo_ndim:]
+        records = outer_index(self.records, cube_key)
+        station_records = outer_index(self.station_records, cube_key)
+
+        geo_shape = outer_index(np.empty(self.geo_shape, dtype='bool'), geo_key).shape
+        array_field = np.full(records.shape + geo_shape, fill_value=np.nan, dtype="float32")
+        cells = array_field.reshape((-1,) + geo_shape)
+
+        # only the records of the selected cells are read and decoded
+        for n in np.flatnonzero(records):
+            record = f.get_record(int(records.flat[n]))
             logger.debug(f'unpacking and loading data, {record.reference_date}, {record.id}')
             record.unpack(data=True)
             if not self.cube.x is None: # grid
@@ -269,96 +436,130 @@ class OnDiskArray:
                     logger.debug(f'taking fast path for retrieving station record')
                     values = record.data
                 else:
-                    rec_stations = f[row['linked_station_id_record']].stations
-                    rec_series = pd.Series(record.data, name='data', index=pd.Series(rec_stations, name='station'))
-                    arr_series = pd.Series(np.nan, name='data', index=self.cube.station)
-                    arr_series.update(rec_series)
-                    values = arr_series.values
-
-
-            array_field[row.miloc] = values
-
-        # handle geo dim slicing
-        array_field = array_field[(Ellipsis,) + item[-self.geo_ndim :]]
+                    values = np.full(self.geo_shape, fill_value=np.nan, dtype="float32")
+                    values[self.station_maps[int(station_records.flat[n])]] = record.data
+            cells[n] = outer_index(values, geo_key)
 
         # squeeze array dimensions expressed as integer
-        for i, it in reversed(list(enumerate(item[: -self.geo_ndim]))):
-            if isinstance(it, int):
-                array_field = array_field[(slice(None, None, None),) * i + (0,)]
-        f.close()
+        array_field = array_field[tuple([0 if isinstance(i, (int, np.integer)) else slice(None) for i in item])]
         array_field[array_field==9999.0] = np.nan
         return array_field
 
 
-def dims_to_shape(d) -> tuple:
-    if 'nx' in d:
-        t = (d['ny'],d['nx'])
-    else:
-        t = (d['nsta'],)
-    return t
-
-def parse_tdlpackio_index_to_components(df, decode_time=True, decode_thresh=True, decode_lead=True, ttt='hours'):
-    df = df[df.type != 'trailer']
-    record = df.index + 1
-    df = df.assign(record=record)
-
-    ccc = (df.id1 // 1_000_000).astype('int32')
-    fff = (df.id1 % 1_000_000 // 1000).astype('int32')
-    cccfff = (df.id1 // 1000).astype('int32')
-    b = (df.id1 % 1000 // 100).astype('int32')
-    dd = (df.id1 % 100).astype('int32')
-
-    v = (df.id2 // 100_000_000).astype('int32')
-    llll = (df.id2 % 100_000_000 // 10_000).astype('int32')
-    uuuu = (df.id2 % 10_000).astype('int32')
-
-    t = (df.id3 // 100_000_000).astype('int32')
+def outer_index(array, key) -> np.array:
+    ''' index the leading dimensions of array with an outer indexer of integer slices and arrays;
+        unlike numpy fancy indexing, each array selects along its own dimension '''
+    for dim, k in enumerate(key):
+        if not (isinstance(k, slice) and k == slice(None)):
+            array = array[(slice(None),) * dim + (k,)]
+    return array
+
+
+def record_shape(row) -> tuple:
+    ''' geographic shape of a record from its ny, nx and nsta index columns; order as yx '''
+    if row.nx > 0:
+        return (int(row.ny), int(row.nx))
+    return (int(row.nsta),)
+
+def dims_to_columns(dims) -> dict:
+    ''' ny, nx and nsta integer columns from the TdlpackIO dims of data records; 0 where a
+        dimension does not apply '''
+    dims = list(dims)
+    n = len(dims)
+    return {k: np.fromiter((d.get(k, 0) for d in dims), dtype='int64', count=n) for k in ('ny', 'nx', 'nsta')}
+
+def decode_id_words(id1, id2, id3, id4) -> dict:
+    ''' decode the MOS-2000 id word arrays into arrays of the id components '''
+    ccc = (id1 // 1_000_000).astype('int32')
+    fff = (id1 % 1_000_000 // 1000).astype('int32')
+    cccfff = (id1 // 1000).astype('int32')
+    b = (id1 % 1000 // 100).astype('int32')
+    dd = (id1 % 100).astype('int32')
+
+    v = (id2 // 100_000_000).astype('int32')
+    llll = (id2 % 100_000_000 // 10_000).astype('int32')
+    uuuu = (id2 % 10_000).astype('int32')
+
+    t = (id3 // 100_000_000).astype('int32')
     # rr is modifier on date
-    o = (df.id3 % 1_000_000 // 100_000).astype('int32')
+    o = (id3 % 1_000_000 // 100_000).astype('int32')
     # hh should always be zero (not read)
     # ttt is lead
-    #df['ttt'] = df.id3 % 1_000
 
-    w = (df.id4 // 1_000_000_000).astype('int32')
-    thresh_sign = w.apply(lambda x: -1 if x == 1 else 1)
-    xxxx = (df.id4 % 1_000_000_000 // 100_000).astype('int32')
-    yy = (df.id4 % 100_000 // 1000).astype('int32')
-    yy[yy>=50] = (yy - 50) * -1
+    w = (id4 // 1_000_000_000).astype('int32')
+    thresh_sign = np.where(w == 1, -1, 1)
+    xxxx = (id4 % 1_000_000_000 // 100_000).astype('int32')
+    yy = (id4 % 100_000 // 1000).astype('int32')
+    yy = np.where(yy >= 50, (yy - 50) * -1, yy)
     thresh = (xxxx/10000 * 10.0**yy * thresh_sign).astype('float')
 
-    i = (df.id4 % 1000 // 100).astype('int32')
-    s = (df.id4 % 100 // 10).astype('int32')
-    g = (df.id4 % 10).astype('int32')
-
-    rr = (df.id3 % 100_000_000 // 1_000_000).astype('int')
-    date = pd.to_datetime(df.date, format='%Y%m%d%H', errors='coerce')
-    lead = pd.to_timedelta(df.lead, unit='hours')
-
-    # parse dims to shape tuple
-    # order as yx
-    df = df[df.type == 'data']
-    record_shape = df.dims.apply(dims_to_shape)
+    i = (id4 % 1000 // 100).astype('int32')
+    s = (id4 % 100 // 10).astype('int32')
+    g = (id4 % 10).astype('int32')
 
-    df = df.assign(ccc=ccc, fff=fff, cccfff=cccfff, b=b, dd=dd,
+    return dict(ccc=ccc, fff=fff, cccfff=cccfff, b=b, dd=dd,
             v=v, llll=llll, uuuu=uuuu,
             t=t, o=o,
             thresh=thresh,
-            i=i, s=s, g=g,
-            date=date, lead=lead,
-            record_shape=record_shape)
+            i=i, s=s, g=g)
+
+def decode_dates(date) -> np.ndarray:
+    ''' decode an array of YYYYMMDDHH integer dates into datetime64; NaT where invalid '''
+    return pd.to_datetime(dict(year=date // 1_000_000, month=date % 1_000_000 // 10_000,
+                               day=date % 10_000 // 100, hour=date % 100), errors='coerce').to_numpy()
+
+def filter_records(file_index, filters) -> np.ndarray:
+    ''' apply filters on id components, date and lead directly to the TdlpackIO index lists
+        and return the (0-based) positions of the data records that pass
+
+        Each filter is evaluated once on the distinct values of its component with
+        apply_filters, so it selects exactly as in make_variables, and then applied to all
+        records as an integer isin on the raw id and date words.  Filters on other keys are
+        left to make_variables. '''
+    types = np.asarray(file_index['type'])
+    keep = np.flatnonzero(types == 'data')
+    words = {k: np.asarray([file_index[k][n] for n in keep], dtype='int64') for k in ('id1', 'id2', 'id3', 'id4', 'date', 'lead')}
+    components = decode_id_words(words['id1'], words['id2'], words['id3'], words['id4'])
+
+    mask = np.ones(len(keep), dtype='bool')
+    for k, v in (filters or {}).items():
+        if k in components:
+            raw = components[k]
+            values = np.unique(raw)
+            labels = values
+        elif k == 'date':
+            raw = words['date']
+            values = np.unique(raw)
+            labels = decode_dates(values)
+        elif k == 'lead':
+            raw = words['lead']
+            values = np.unique(raw)
+            labels = pd.to_timedelta(values, unit='hours')
+        else:
+            continue
+        selected = apply_filters(pd.DataFrame({k: labels, 'raw': values}), {k: v})
+        mask &= np.isin(raw, selected.raw.to_numpy())
+    return keep[mask]
 
-    df = df.drop(['id1', 'id2', 'id3', 'id4', 'dims'], axis = 1)
+def parse_tdlpackio_index_to_components(df, decode_time=True, decode_thresh=True, decode_lead=True, ttt='hours'):
+    # only data records are decoded; record is the record number on file
+    df = df.assign(record=df.index + 1)
+    df = df[df.type == 'data']
+    id1 = df.id1.to_numpy(dtype='int64')
+    id2 = df.id2.to_numpy(dtype='int64')
+    id3 = df.id3.to_numpy(dtype='int64')
+    id4 = df.id4.to_numpy(dtype='int64')
 
-    # remove any records with 1-9 stations as they are causing problems at the moment
-  # df = df[df.record_shape != (1,)]
-  # df = df[df.record_shape != (2,)]
-  # df = df[df.record_shape != (3,)]
-  # df = df[df.record_shape != (4,)]
-  # df = df[df.record_shape != (5,)]
-  # df = df[df.record_shape != (6,)]
-  # df = df[df.record_shape != (7,)]
-  # df = df[df.record_shape != (8,)]
-  # df = df[df.record_shape != (9,)]
+    components = decode_id_words(id1, id2, id3, id4)
+    date = decode_dates(df.date.to_numpy(dtype='int64'))
+    lead = pd.to_timedelta(df.lead.to_numpy(dtype='int64'), unit='hours')
+
+    # parse dims to integer shape columns
+    shape = dims_to_columns(df.dims)
+
+    df = df.assign(**components, date=date, lead=lead, **shape)
+
+    df = df.drop(['id1', 'id2', 'id3', 'id4', 'dims'], axis = 1)
 
     return df
 
@@ -378,21 +579,19 @@ meta_formats = {
         'thresh' : '{d}',
         }
 
-def build_da_without_coords(index, cube, file, one_sorted_station_list:bool) -> xr.DataArray:
+def build_da_without_coords(index, cube, file, one_sorted_station_list:bool, manager=None, station_maps=None,
+                            preferred_chunk_bytes=PREFERRED_CHUNK_BYTES) -> xr.DataArray:
     dim_names = [k for k in cube.__dataclass_fields__.keys() if cube[k] is not None]
     constant_meta_names = [k for k in cube.__dataclass_fields__.keys() if cube[k] is None]
     dims = {k: len(cube[k]) for k in dim_names}
 
-    data = OnDiskArray(file.name, index, cube, one_sorted_station_list)
-    lock = LOCK
-    data = TdlpackBackendArray(data, lock)
+    data = OnDiskArray(file.name, index, cube, one_sorted_station_list, manager, station_maps)
+    data = TdlpackBackendArray(data)
     data = indexing.LazilyIndexedArray(data)
     da = xr.DataArray(data, dims=dim_names)
 
-    if 'station' in da.dims:
-        da.encoding['preffered_chunks'] = {'station':-1}
-    else:
-        da.encoding['preffered_chunks'] = {'y':-1, 'x':-1}
+    da.encoding['preferred_chunks'] = preferred_chunks(da.dims, da.shape, data.array.array.geo_ndim,
+                                                       np.dtype(da.dtype).itemsize, preferred_chunk_bytes)
 
     da.name = index.name.iloc[0]
     for meta_name in constant_meta_names:
@@ -402,6 +601,19 @@ def build_da_without_coords(index, cube, file, one_sorted_station_list:bool) ->
 
     return da
 
+def preferred_chunks(dims, shape, geo_ndim, itemsize, target_bytes) -> dict:
+    ''' chunk sizes holding whole records (all of the geographic dims) and as many records as
+        fit in target_bytes, filling the innermost record dims first; chunks never split a
+        record, so each record is decoded once '''
+    chunks = {d: n for d, n in zip(dims[-geo_ndim:], shape[-geo_ndim:])}
+    nrecords = max(target_bytes // (int(np.prod(shape[-geo_ndim:])) * itemsize), 1)
+    for d, n in reversed(list(zip(dims[:-geo_ndim], shape[:-geo_ndim]))):
+        # balance the chunks along the dim; e.g. 12 records in at most 11 gives 2 chunks of 6
+        nchunks = -(-n // max(min(n, nrecords), 1))
+        chunks[d] = max(-(-n // nchunks), 1)
+        nrecords = max(nrecords // n, 1)
+    return {d: chunks[d] for d in dims}
+
 zfil = {
         'cccfff' : 6,
         'ccc' : 3,
@@ -433,55 +645,57 @@ def _asarray_tuplesafe(values):
 
     return result
 
+def apply_filters(index, filters):
+    ''' apply whitelist filters to a dataframe of records; adopts parts of xarray's sel logic
+        so that filters behave similarly; allowed to filter to nothing '''
+    for k, v in filters.items():
+        if isinstance(v, slice):
+            index = index.set_index(k)
+            index = index.loc[v]
+            index = index.reset_index()
+        else:
+            label = (
+                v
+                if getattr(v, "ndim", 1) > 1  # vectorized-indexing
+                else _asarray_tuplesafe(v)
+                )
+            if label.ndim == 0:
+                label_value = label[()] if label.dtype.kind in "mM" else label.item() # see https://github.com/pydata/xarray/pull/4292 for details
+                try:
+                    indexer = pd.Index(index[k]).get_loc(label_value)
+                    if isinstance(indexer, int):
+                        index = index.iloc[[indexer]]
+                    else:
+                        index = index.iloc[indexer]
+                except KeyError:
+                    index = index.iloc[[]]
+            else:
+                indexer = pd.Index(index[k]).get_indexer_for(np.ravel(v))
+                index = index.iloc[indexer[indexer >= 0]]
+    return index
+
 def make_variables(index, name_scheme, filters, f):
     ''' from index as dataframe, separate by variable
         create an individual dataframe index and cube for each variable'''
 
     # let nam determine the variables
     #index['name'] = index[name_scheme].apply(lambda row: '_'.join(row.values.astype(str), axis=1)
-    index.loc[:,'name'] = index[name_scheme].astype(str).apply(lambda col: col.str.zfill(zfil[col.name])).apply(lambda row: '_'.join(row), axis=1)
+    # names are formatted once per distinct combination of the name scheme and stored as categorical
+    codes = index.groupby(name_scheme, sort=False).ngroup().to_numpy()
+    combos = index[name_scheme].iloc[np.unique(codes, return_index=True)[1]]
+    names = combos.astype(str).apply(lambda col: col.str.zfill(zfil[col.name])).agg('_'.join, axis=1)
+    index = index.assign(name=pd.Categorical.from_codes(codes, categories=pd.Index(names).unique()) if len(index) else pd.Categorical([]))
 
     # adopt parts of xarray's sel logic  so that filters behave similarly
     # allowed to filter to nothing to make empty dataset
     if filters:
-        for k, v in filters.items():
-            if isinstance(v, slice):
-                index = index.set_index(k)
-                index = index.loc[v]
-                index = index.reset_index()
-            else:
-                label = (
-                    v
-                    if getattr(v, "ndim", 1) > 1  # vectorized-indexing
-                    else _asarray_tuplesafe(v)
-                    )
-                if label.ndim == 0:
-                    label_value = label[()] if label.dtype.kind in "mM" else label.item() # see https://github.com/pydata/xarray/pull/4292 for details
-                    try:
-                        indexer = pd.Index(index[k]).get_loc(label_value)
-                        if isinstance(indexer, int):
-                            index = index.iloc[[indexer]]
-                        else:
-                            index = index.iloc[indexer]
-                    except KeyError:
-                        index = index.iloc[[]]
-                else:
-                    indexer = pd.Index(index[k]).get_indexer_for(np.ravel(v))
-                    index = index.iloc[indexer[indexer >= 0]]
-    #      if isinstance(v, list):
-    #          v = [int(k) if isinstance(v, str) else k for k in v]
-    #      elif isinstance(v, str):
-    #          v = [int(v)]
-    #      elif isinstance(v, int):
-    #          v = [v]
-    #      filters[k] = index[k].isin(v)
-    #   index = index[pd.DataFrame(filters).all(axis=1)]
+        index = apply_filters(index, filters)
 
     # set the index to the names components
     index = index.set_index(name_scheme).sort_index()
     # return nothing if no data
     if index.empty:
-        return None,None,None,None,None
+        return None,None,None,None,None,None
 
 
     ordered_meta = TdlpCube.__dataclass_fields__.keys()
@@ -512,6 +726,12 @@ def make_variables(index, name_scheme, filters, f):
             if frame[dim].value_counts().nunique() > 1:
                 raise ValueError(f'un-even numer of records associated with dimension: {dim}\n unique values for {dim}: {frame[dim].unique()} ')
 
+        # records with the same metadata (e.g. the same record in two files of a catalog)
+        # would fill the same cell of the cube; fail rather than silently keep one of them
+        duplicated = frame.duplicated(dims)
+        if duplicated.any():
+            raise ValueError(f'duplicate records for variable {key}:\n {frame.loc[duplicated, dims].drop_duplicates().to_dict("records")} ')
+
         frame = frame.sort_values(dims)
         frame = frame.set_index(dims)
 
@@ -534,50 +754,25 @@ def make_variables(index, name_scheme, filters, f):
         cube = TdlpCube()
 
     # check geography of data and assign to cube
-    one_station_list = True
-    record_shapes = index.record_shape.unique()
+    station_maps = None
+    record_shapes = index[['ny', 'nx', 'nsta']].drop_duplicates()
     if len(record_shapes) > 1:
         # records on file have multiple shapes
-        if len(record_shapes[0]) == 1:
+        if len(record_shape(record_shapes.iloc[0])) == 1:
             # station records; check if the multiple station id records are identical
             station_id_records = index.linked_station_id_record.unique()
             if 0 in station_id_records:
                 raise ValueError('tdlp file has a mix of station and gridded records; cannot read')
-            if len(station_id_records) > 1:
-                station = pd.Series(f[int(station_id_records[0])].stations, name='station')
-                for station_record in station_id_records[1:]:
-                    sta = pd.Series(f[int(station_record)].stations, name='station')
-                    if not station.equals(sta):
-                        # station lists on file are not all the same
-                        logger.warning(f'station lists on file are not identical; loading of data will be less efficient')
-                        one_station_list = False
-                        station = pd.merge(station, sta, how='outer').station
-            if station.is_monotonic_increasing:
-                cube.station = station
-                if one_station_list:
-                    one_station_list_and_ordered = True
-                else:
-                    one_station_list_and_ordered = False
-            else:
-                logger.warning(f'station list(s) are not ordered; loading of data will be less efficient')
-                one_station_list_and_ordered = False
-                cube.station = station.sort_values()
+            cube.station, one_station_list_and_ordered, station_maps = make_station_maps(f, station_id_records)
         else:
             raise ValueError('multiple grids not accommodated')
     elif len(record_shapes) == 1:  # data records exist and have same shape
-        if len(record_shapes[0]) == 1:
-            rec = f[int(index.linked_station_id_record.iloc[0])]
-            station_series = pd.Series(rec.stations, name='station')
-            if station_series.is_monotonic_increasing:
-                cube.station = station_series
-                one_station_list_and_ordered = True
-            else:
-                logger.warning(f'station list(s) are not ordered; loading of data will be less efficient')
-                cube.station = station_series.sort_values()
-                one_station_list_and_ordered = False
+        if len(record_shape(record_shapes.iloc[0])) == 1:
+            station_id_records = index.linked_station_id_record.unique()
+            cube.station, one_station_list_and_ordered, station_maps = make_station_maps(f, station_id_records)
         else:
-            cube.y = range(index.record_shape.iloc[0][0])
-            cube.x = range(index.record_shape.iloc[0][1])
+            cube.y = range(index.ny.iloc[0])
+            cube.x = range(index.nx.iloc[0])
 
     extra_geo = None
     rec = f[int(ordered_frames[0].record.iloc[0])]
@@ -585,14 +780,52 @@ def make_variables(index, name_scheme, filters, f):
     if cube.x is not None:
         # we want the lat lons; make them via accessing a record; we are asuming all records are the same grid because they have the same shape;
         # may want a unique grid identifier from tdlpackio to avoid assuming this
-        latitude, longitude = rec.latlons()
-        latitude = xr.DataArray(latitude.transpose(), dims=['y','x'])
-        latitude.attrs['standard_name'] = 'latitude'
-        longitude = xr.DataArray(longitude.transpose() * -1, dims=['y','x'])
-        longitude.attrs['standard_name'] = 'longitude'
+        # the coordinates are computed on first access from the lat/lon cache of pytdlpack,
+        # which is keyed by grid, so files on the same grid share them
+        latitude = xr.Variable(['y','x'], indexing.LazilyIndexedArray(LatLonBackendArray(rec.grid_def, 'latitude')),
+                               attrs=dict(standard_name='latitude'))
+        longitude = xr.Variable(['y','x'], indexing.LazilyIndexedArray(LatLonBackendArray(rec.grid_def, 'longitude')),
+                                attrs=dict(standard_name='longitude'))
         extra_geo = dict(latitude=latitude, longitude=longitude)
         one_station_list_and_ordered = None
-    return ordered_frames, cube, extra_geo, one_station_list_and_ordered, is2
+    return ordered_frames, cube, extra_geo, one_station_list_and_ordered, is2, station_maps
+
+
+def make_station_maps(f, station_id_records):
+    ''' from the station id records linked to data records, build the station coordinate and
+        the position of each station of each station list in it
+
+        Identical station lists are interned by pytdlpack, so each distinct list is handled once.
+        Returns the station coordinate, whether the records hold the stations of the coordinate
+        in order, and a dict of station id record number to integer positions in the coordinate
+        (None when the records hold the stations in order)'''
+    distinct = dict()
+    for station_record in station_id_records:
+        stations = f._get_station_list(int(station_record))
+        distinct.setdefault(id(stations), (stations, list()))[1].append(int(station_record))
+    lists = list(distinct.values())
+
+    if len(lists) == 1:
+        calls = lists[0][0].calls
+        if np.all(calls[:-1] <= calls[1:]):
+            return pd.Series(lists[0][0].tolist(), name='station'), True, None
+        logger.warning(f'station list(s) are not ordered; loading of data will be less efficient')
+        station = np.sort(calls, kind='stable')
+    else:
+        # station lists on file are not all the same
+        logger.warning(f'station lists on file are not identical; loading of data will be less efficient')
+        station = lists[0][0].calls
+        for stations, _ in lists[1:]:
+            station = np.union1d(station, stations.calls)
+    station = pytdlpack.StationList(station)
+
+    # one scatter map per distinct station list
+    station_maps = dict()
+    for stations, station_records in lists:
+        positions = station.positions(stations)
+        for station_record in station_records:
+            station_maps[station_record] = positions
+    return pd.Series(station.tolist(), name='station'), False, station_maps
 
 
 class Validator(ABC):
@@ -10,18 +10,25 @@ This indexing allow the user to access a TDLPACK sequential file in a random-acc
 For example if a users wants to read the 500th record in the file, the first 499 records in
 their entirety do not need to be read.
 """
+import collections
+import hashlib
+import heapq
 import logging
 import numpy as np
 import os
 import pdb
 import pytdlpack
+from pytdlpack._ra_tools import _TRAILER_RECORD, _is_trailer
 import struct
 import sys  
+import tempfile
+import threading
 import warnings
 
 __version__ = pytdlpack.__version__ # Share the version number
 
 _IS_PYTHON3 = sys.version_info.major >= 3
+_HAS_PREAD = hasattr(os,'pread')
 
 if _IS_PYTHON3:
     import builtins
@@ -29,9 +36,20 @@ else:
     import __builtin__ as builtins
 
 ONE_MB = 1048576
+COPY_CHUNK_SIZE = 16*ONE_MB
+
+# Files smaller than this are indexed by a single process (see open).  Byte ranges indexed
+# by worker processes are at least PARALLEL_INDEX_SHARD_MIN_SIZE bytes.
+PARALLEL_INDEX_MIN_SIZE = 64*ONE_MB
+PARALLEL_INDEX_SHARD_MIN_SIZE = 4*ONE_MB
+
+# merge reads the sorted runs of record keys MERGE_BLOCK_ROWS rows at a time and keeps at
+# most MERGE_MAX_OPEN_FILES source files open while copying records.
+MERGE_BLOCK_ROWS = 4096
+MERGE_MAX_OPEN_FILES = 64
 
 class open(object):
-    def __init__(self,filename,mode='r'):
+    def __init__(self,filename,mode='r',workers=1,index=None):
         """
         Class Constructor
 
@@ -45,6 +63,16 @@ class open(object):
         **`mode : str, optional, default = 'r'`**
 
         File handle mode.  The default is open for reading ('r').
+
+        **`workers : int, optional, default = 1`**
+
+        Number of processes used to index the file.  Files smaller than
+        `PARALLEL_INDEX_MIN_SIZE` are always indexed by a single process.
+
+        **`index : dict, optional`**
+
+        Index of the file built by a previous open of the same file (the `_index`
+        attribute), e.g. in another process.  The file is then not indexed again.
         """
         if mode == 'r' or mode == 'w':
             mode = mode+'b'
@@ -53,6 +81,9 @@ class open(object):
         self._filehandle = builtins.open(filename,mode=mode,buffering=ONE_MB)
         self._hasindex = False
         self._index = {}
+        self._station_lists = {} # Station lists of this file keyed by record number.
+        self._lock = threading.Lock() # Serializes positioned reads where os.pread is not available.
+        self._workers = workers
         self.mode = mode
         self.name = os.path.abspath(filename)
         self.records = 0
@@ -60,7 +91,7 @@ class open(object):
         self.size = os.path.getsize(self.name)
         # Perform indexing on read
         if 'r' in self.mode:
-            self._get_index()
+            self._get_index(index)
 
     def __enter__(self):
         """
@@ -109,124 +140,62 @@ class open(object):
         else:
             raise KeyError('Key must be an integer record number or a slice')
 
-    def _get_index(self):
+    def _get_index(self,index=None):
         """
-        Perform indexing of data records.
+        Perform indexing of data records, unless an index is given.
         """
-        #pdb.set_trace()
-        # Initialize index dictionary
-        self._index['offset'] = []
-        self._index['size'] = []
-        self._index['type'] = []
-        self._index['date'] = []
-        self._index['lead'] = []
-        self._index['id1'] = []
-        self._index['id2'] = []
-        self._index['id3'] = []
-        self._index['id4'] = []
-        self._index['dims'] = []
-        self._index['linked_station_id_record'] = []
-        _last_station_id_record = 0
-
-        # Iterate
-        while True:
-            try:
-                # First read 4-byte Fortran record header, then read the next
-                # 44 bytes which provides enough information to catalog the
-                # data record.
-                pos = self._filehandle.tell()
-                fortran_header = struct.unpack('>i',self._filehandle.read(4))[0]
-                if fortran_header >= 132:
-                    bytes_to_read = 132
-                else:
-                    bytes_to_read = fortran_header
-                temp = np.frombuffer(self._filehandle.read(bytes_to_read),dtype='>i4')
-                _header = struct.unpack('>4s',temp[2])[0].decode()
-
-                # Check to first 4 bytes of the data record to determine the data
-                # record type.
-                if _header == 'PLDT':
-                    # TDLPACK data record
-                    # Here we create a dimension dictionary per TDLPACK record and store in
-                    # the index.
-                    _dimdict = {}
-                    _pos = 16+temp.tobytes()[16]
-                    if bool(int(bin(temp.tobytes()[17])[-1])):
-                        # Grid
-                        _dimdict['nx'] = struct.unpack('>h',temp.tobytes()[_pos+2:_pos+4])[0]
-                        _dimdict['ny'] = struct.unpack('>h',temp.tobytes()[_pos+4:_pos+6])[0]
-                    else:
-                        # Vector
-                        _dimdict['nsta'] = struct.unpack('>i',temp.tobytes()[_pos+4:_pos+8])[0]
-                    self._index['size'].append(temp[1])
-                    self._index['type'].append('data')
-                    self._index['date'].append(temp[6])
-                    self._index['lead'].append(int(str(temp[9])[-3:]))
-                    self._index['id1'].append(temp[7])
-                    self._index['id2'].append(temp[8])
-                    self._index['id3'].append(temp[9])
-                    self._index['id4'].append(temp[10])
-                    self._index['dims'].append(_dimdict)
-                    self._index['linked_station_id_record'].append(_last_station_id_record)
-                else:
-                    if temp[1] == 24 and temp[6] == 9999:
-                        # Trailer record
-                        self._index['size'].append(temp[1])
-                        self._index['type'].append('trailer')
-                        self._index['date'].append(None)
-                        self._index['lead'].append(None)
-                        self._index['id1'].append(None)
-                        self._index['id2'].append(None)
-                        self._index['id3'].append(None)
-                        self._index['id4'].append(None)
-                        self._index['dims'].append(None)
-                        self._index['linked_station_id_record'].append(_last_station_id_record)
-                    else:
-                        # Station ID record
-                        self._index['size'].append(temp[1])
-                        self._index['type'].append('station')
-                        self._index['date'].append(None)
-                        self._index['lead'].append(None)
-                        self._index['id1'].append(400001000)
-                        self._index['id2'].append(0)  
-                        self._index['id3'].append(0)
-                        self._index['id4'].append(0)
-                        self._index['dims'].append(None)
-                        self._index['linked_station_id_record'].append(_last_station_id_record)
-
-                # At this point we have successfully identified a TDLPACK record from
-                # the file. Increment self.records and position the file pointer to
-                # now read the Fortran trailer.
-                self.records += 1 # Includes trailer records
-                self._filehandle.seek(fortran_header-bytes_to_read,1)
-                fortran_trailer = struct.unpack('>i',self._filehandle.read(4))[0]
-
-                # Check Fortran header and trailer for the record.
-                if fortran_header != fortran_trailer:
-                    raise IOError('Bad Fortran record.')
-
-                # NOTE: The 'offset' key contains the byte position in the file of where
-                # data record begins. A value of 12 is added to consider a 4-byte Fortran
-                # header, 4-byte "trash", and 4-byte ioctet value (already) stored on index.
-                self._index['offset'].append(pos+12) # 4-byte header + 4-byte trash + 4-byte ioctet
-
-                # Hold the record number of the last station ID record
-                if self._index['type'][-1] == 'station':
-                    _last_station_id_record = self.records # This should be OK.
-
-            except(struct.error):
-                self._filehandle.seek(0)
-                break
-
+        if index is not None:
+            self._index = index
+        elif self._workers > 1 and self.size >= PARALLEL_INDEX_MIN_SIZE:
+            self._index = _index_parallel(self.name,self.size,self._workers)
+        else:
+            self._index = _new_index()
+            _index_records(self._filehandle,self._index,0,None,0)
+            self._filehandle.seek(0)
+        self.records = len(self._index['offset']) # Includes trailer records
         self._hasindex = True
         self.dates = tuple(sorted(set(list(filter(None,self._index['date'])))))
         self.leadtimes = tuple(sorted(set(list(filter(None,self._index['lead'])))))
 
+    def _get_station_list(self,recnum):
+        """
+        Return the station list of station record number recnum.  The station record is
+        read if it has not been read yet.  The current file position is not changed.
+        """
+        if recnum == 0:
+            return None
+        if recnum not in self._station_lists:
+            ioctet = self._index['size'][recnum-1]
+            ipack = np.frombuffer(self._pread(recnum-1),dtype='>i4')
+            rec = pytdlpack.TdlpackStationRecord(ipack=ipack,ioctet=ioctet,
+                  number_of_stations=np.int32(ioctet/pytdlpack.NCHAR))
+            rec.unpack()
+            self._station_lists[recnum] = rec.stations
+        return self._station_lists[recnum]
+
+    def _pread(self,nn):
+        """
+        Return the bytes of the packed record at index position nn (0-based) without
+        changing the file position.  os.pread is used where available, so records can be
+        read by several threads at the same time.
+        """
+        offset = self._index['offset'][nn]
+        size = self._index['size'][nn]
+        if _HAS_PREAD:
+            return os.pread(self._filehandle.fileno(),size,offset)
+        with self._lock:
+            pos = self._filehandle.tell()
+            self._filehandle.seek(offset)
+            buf = self._filehandle.read(size)
+            self._filehandle.seek(pos)
+        return buf
+
     def close(self):
         """
         Close the file handle
         """
         self._filehandle.close()
+        self._station_lists.clear()
 
     def read(self,num=None,unpack=True):
         """
@@ -242,25 +211,34 @@ class open(object):
             reclist = list(range(self.recordnumber+1,self.recordnumber+1+num))
         for n in reclist:
             nn = n-1 # Use this for the self._index referencing
-            kwargs = {}
             self.seek(n)
-            kwargs['ioctet'] = self._index['size'][nn]
-            kwargs['ipack'] = np.frombuffer(self._filehandle.read(self._index['size'][nn]),dtype='>i4')
-            if self._index['type'][nn] == 'data':
-                kwargs['reference_date'] = self._index['date'][nn]
-                rec = pytdlpack.TdlpackRecord(**kwargs)
-                if unpack: rec.unpack()
-                recs.append(rec)
-            elif self._index['type'][nn] == 'station':
-                kwargs['ipack'] = kwargs['ipack'].byteswap()
-                kwargs['number_of_stations'] = np.int32(kwargs['ioctet']/pytdlpack.NCHAR)
-                rec = pytdlpack.TdlpackStationRecord(**kwargs)
-                if unpack: rec.unpack()
-                recs.append(rec)
-            elif self._index['type'][nn] == 'trailer':
-                recs.append(pytdlpack.TdlpackTrailerRecord(**kwargs))
+            ipack = np.frombuffer(self._filehandle.read(self._index['size'][nn]),dtype='>i4')
+            recs.append(self._new_record(nn,ipack,unpack))
             self.recordnumber = n
         return recs
+
+    def _new_record(self,nn,ipack,unpack=True):
+        """
+        Return the record object for the packed record ipack at index position nn (0-based).
+        """
+        kwargs = {}
+        kwargs['ioctet'] = self._index['size'][nn]
+        kwargs['ipack'] = ipack
+        if self._index['type'][nn] == 'data':
+            kwargs['reference_date'] = self._index['date'][nn]
+            if 'nsta' in self._index['dims'][nn]:
+                kwargs['_stations'] = self._get_station_list(self._index['linked_station_id_record'][nn])
+            rec = pytdlpack.TdlpackRecord(**kwargs)
+            if unpack: rec.unpack()
+            return rec
+        elif self._index['type'][nn] == 'station':
+            kwargs['number_of_stations'] = np.int32(kwargs['ioctet']/pytdlpack.NCHAR)
+            rec = pytdlpack.TdlpackStationRecord(**kwargs)
+            rec.unpack()
+            self._station_lists[nn+1] = rec.stations
+            return rec
+        elif self._index['type'][nn] == 'trailer':
+            return pytdlpack.TdlpackTrailerRecord(**kwargs)
     
     def record(self,rec,unpack=True):
         """
@@ -279,6 +257,21 @@ class open(object):
             self.seek(rec) # Use the actual record number here.
             return self.read(1,unpack=unpack)[0]
 
+    def get_record(self,rec,unpack=True):
+        """
+        Read the N-th record without changing the file position.  Several threads can read
+        records from the same file at the same time.
+        """
+        if rec is None:
+            return None
+        if rec <= 0:
+            warnings.warn("Record numbers begin at 1.")
+            return None
+        elif rec > self.records:
+            warnings.warn("Not that many records in the file.")
+            return None
+        return self._new_record(rec-1,np.frombuffer(self._pread(rec-1),dtype='>i4'),unpack)
+
     def seek(self,offset):
         """
         Set the position within the file in units of data records.
@@ -297,8 +290,18 @@ class open(object):
         Fetch TDLPACK data record by means of date, lead time, id or any combination
         thereof.
         """
-        #pdb.set_trace()
         recs = []
+        # Now we iterate over the matching index values and build the list of
+        # records.
+        for i in self._query(date=date,id=id,lead=lead):
+            recs.append(self.record(i+1,unpack=unpack))
+        return recs
+
+    def _query(self,date=None,id=None,lead=None):
+        """
+        Return the index values (record number - 1) of records matching date, lead time,
+        id or any combination thereof.
+        """
         idx = None
         match_count = 0
 
@@ -369,16 +372,476 @@ class open(object):
         # Now determine the count of unique index values.  The count needs to match the
         # value of match_count.  Where this occurs, the index values are extracted.
         vals,cnts = np.unique(idx,return_counts=True)
-        idx = vals[np.where(cnts==match_count)[0]]
-
-        # Now we iterate over the matching index values and build the list of
-        # records.
-        for i in idx:
-            recs.append(self.record(i+1,unpack=unpack))
-        return recs
+        return vals[np.where(cnts==match_count)[0]]
     
+    def copy_records(self,dest,records=None,date=None,id=None,lead=None,mode='w'):
+        """
+        Copy records to a new sequential file without unpacking them.
+
+        The Fortran records are copied byte-for-byte.  The station call letter record
+        each station data record is linked to is copied before it, and a trailer record
+        is written at the end of the file and before each station call letter record
+        that follows data records.
+
+        Parameters
+        ----------
+
+        **`dest : str`**
+
+        Name of the new file.
+
+        **`records : list of int, optional`**
+
+        Record numbers to copy.  Records are copied in file order.
+
+        **`date, id, lead : optional`**
+
+        Select the records to copy as with `fetch`.  Ignored if `records` is given.
+
+        **`mode : {'w', 'x', 'a'}, optional`**
+
+        `'w'` overwrites an existing file; `'x'` raises an error if the file exists;
+        `'a'` appends to an existing file.
+
+        Returns
+        -------
+
+        **`int`**
+
+        Number of records written, including station call letter and trailer records.
+        """
+        if records is None:
+            records = self._query(date=date,id=id,lead=lead)+1
+        records = sorted(set(int(r) for r in records))
+        if records and (records[0] < 1 or records[-1] > self.records):
+            raise ValueError('Record numbers must be between 1 and '+str(self.records))
+
+        # Build the list of records to write; None is a trailer record.
+        plan = []
+        station = 0
+        has_data = False
+        for n in records:
+            rtype = self._index['type'][n-1]
+            if rtype == 'trailer':
+                continue
+            if rtype == 'station':
+                linked = n
+            elif 'nsta' in self._index['dims'][n-1]:
+                linked = self._index['linked_station_id_record'][n-1]
+            else:
+                # Grid records are not linked to a station call letter record.
+                linked = 0
+            if linked != station and linked != 0:
+                if has_data: plan.append(None)
+                plan.append(linked)
+                station = linked
+                has_data = False
+            if rtype == 'data':
+                plan.append(n)
+                has_data = True
+        if plan: plan.append(None)
+
+        pos = self._filehandle.tell()
+        with builtins.open(dest,mode=mode+'b') as out:
+            _copy_plan(out,[None if n is None else (self._filehandle,)+self._record_bytes(n)
+                            for n in plan])
+        self._filehandle.seek(pos)
+        return len(plan)
+
+    def _record_bytes(self,n):
+        """
+        Return the byte range in the file of the Fortran record of record number n.
+        """
+        # 4-byte header + 4-byte trash + 4-byte ioctet + data + 4-byte trailer
+        start = self._index['offset'][n-1]-12
+        return (start,start+self._index['size'][n-1]+16)
+
     def tell(self):
         """
         Return the position in units of records.
         """
         return self.recordnumber
+
+def _new_index():
+    """
+    Return an empty index dictionary.
+    """
+    return {'offset':[],'size':[],'type':[],'date':[],'lead':[],'id1':[],'id2':[],
+            'id3':[],'id4':[],'dims':[],'linked_station_id_record':[]}
+
+def _index_records(filehandle,index,start,end,last_station):
+    """
+    Index the records of a sequential file that begin at byte position start and before
+    byte position end (None for the end of the file).  Record numbers stored in
+    linked_station_id_record are counted from the first record indexed; last_station is
+    stored for records that come before the first station record.
+    """
+    filehandle.seek(start)
+    nrecords = 0
+    _last_station_id_record = last_station
+
+    # Iterate
+    while True:
+        try:
+            # First read 4-byte Fortran record header, then read the next
+            # 44 bytes which provides enough information to catalog the
+            # data record.
+            pos = filehandle.tell()
+            if end is not None and pos >= end:
+                break
+            fortran_header = struct.unpack('>i',filehandle.read(4))[0]
+            if fortran_header >= 132:
+                bytes_to_read = 132
+            else:
+                bytes_to_read = fortran_header
+            temp = np.frombuffer(filehandle.read(bytes_to_read),dtype='>i4')
+            _header = struct.unpack('>4s',temp[2])[0].decode()
+
+            # Check to first 4 bytes of the data record to determine the data
+            # record type.
+            if _header == 'PLDT':
+                # TDLPACK data record
+                # Here we create a dimension dictionary per TDLPACK record and store in
+                # the index.
+                _dimdict = {}
+                _pos = 16+temp.tobytes()[16]
+                if bool(int(bin(temp.tobytes()[17])[-1])):
+                    # Grid
+                    _dimdict['nx'] = struct.unpack('>h',temp.tobytes()[_pos+2:_pos+4])[0]
+                    _dimdict['ny'] = struct.unpack('>h',temp.tobytes()[_pos+4:_pos+6])[0]
+                else:
+                    # Vector
+                    _dimdict['nsta'] = struct.unpack('>i',temp.tobytes()[_pos+4:_pos+8])[0]
+                index['size'].append(temp[1])
+                index['type'].append('data')
+                index['date'].append(temp[6])
+                index['lead'].append(int(str(temp[9])[-3:]))
+                index['id1'].append(temp[7])
+                index['id2'].append(temp[8])
+                index['id3'].append(temp[9])
+                index['id4'].append(temp[10])
+                index['dims'].append(_dimdict)
+                index['linked_station_id_record'].append(_last_station_id_record)
+            else:
+                if _is_trailer(temp[2:],temp[1]):
+                    # Trailer record
+                    index['size'].append(temp[1])
+                    index['type'].append('trailer')
+                    index['date'].append(None)
+                    index['lead'].append(None)
+                    index['id1'].append(None)
+                    index['id2'].append(None)
+                    index['id3'].append(None)
+                    index['id4'].append(None)
+                    index['dims'].append(None)
+                    index['linked_station_id_record'].append(_last_station_id_record)
+                else:
+                    # Station ID record
+                    index['size'].append(temp[1])
+                    index['type'].append('station')
+                    index['date'].append(None)
+                    index['lead'].append(None)
+                    index['id1'].append(400001000)
+                    index['id2'].append(0)  
+                    index['id3'].append(0)
+                    index['id4'].append(0)
+                    index['dims'].append(None)
+                    index['linked_station_id_record'].append(_last_station_id_record)
+
+            # At this point we have successfully identified a TDLPACK record from
+            # the file. Increment nrecords and position the file pointer to
+            # now read the Fortran trailer.
+            nrecords += 1 # Includes trailer records
+            filehandle.seek(fortran_header-bytes_to_read,1)
+            fortran_trailer = struct.unpack('>i',filehandle.read(4))[0]
+
+            # Check Fortran header and trailer for the record.
+            if fortran_header != fortran_trailer:
+                raise IOError('Bad Fortran record.')
+
+            # NOTE: The 'offset' key contains the byte position in the file of where
+            # data record begins. A value of 12 is added to consider a 4-byte Fortran
+            # header, 4-byte "trash", and 4-byte ioctet value (already) stored on index.
+            index['offset'].append(pos+12) # 4-byte header + 4-byte trash + 4-byte ioctet
+
+            # Hold the record number of the last station ID record
+            if index['type'][-1] == 'station':
+                _last_station_id_record = nrecords
+
+        except(struct.error):
+            break
+
+def _find_record_boundary(filehandle,start,size):
+    """
+    Return the byte position of the first Fortran record that begins at or after byte
+    position start, or size if there is none.  A position is a record boundary if the
+    4-byte Fortran record header there is followed by the 4-byte "trash" word, the ioctet
+    value (8 less than the header) and, after the record, a matching Fortran trailer that
+    is followed by the header of the next record or the end of the file.
+    """
+    pos = ((start+3)//4)*4
+    while pos < size:
+        filehandle.seek(pos)
+        buf = filehandle.read(min(ONE_MB,size-pos)+8)
+        words = np.frombuffer(buf[0:len(buf)//4*4],dtype='>i4')
+        nwords = words.shape[0]
+        if nwords < 3:
+            break
+        candidates = np.flatnonzero((words[0:nwords-2] > 8) & (words[1:nwords-1] == 0) &
+                                    (words[2:nwords] == words[0:nwords-2]-8))
+        for i in candidates:
+            if i*4 >= len(buf)-8:
+                break
+            if _is_record_boundary(filehandle,pos+int(i)*4,size):
+                return pos+int(i)*4
+        pos += max(len(buf)-8,4)
+    return size
+
+def _is_record_boundary(filehandle,pos,size):
+    """
+    Check the Fortran record starting at byte position pos, and the header of the next
+    record, for a matching header and trailer.
+    """
+    filehandle.seek(pos)
+    header = struct.unpack('>i',filehandle.read(4))[0]
+    end = pos+header+8
+    if end > size:
+        return False
+    filehandle.seek(pos+header+4)
+    if struct.unpack('>i',filehandle.read(4))[0] != header:
+        return False
+    if end == size:
+        return True
+    if end+12 > size:
+        return False
+    filehandle.seek(end)
+    nexthead,ntrash,ioctet = struct.unpack('>3i',filehandle.read(12))
+    return ntrash == 0 and ioctet == nexthead-8 and end+nexthead+8 <= size
+
+def _index_shard(name,start,end):
+    """
+    Index the records of sequential file name that begin in byte range [start,end).  The
+    first record of the shard is found by scanning for a Fortran record boundary.  Record
+    numbers in linked_station_id_record are relative to the shard; -1 marks records that
+    are linked to a station record of a previous shard.
+    """
+    size = os.path.getsize(name)
+    index = _new_index()
+    with builtins.open(name,mode='rb',buffering=ONE_MB) as filehandle:
+        if start > 0:
+            start = _find_record_boundary(filehandle,start,size)
+        if start < end:
+            _index_records(filehandle,index,start,end,-1)
+    return index
+
+def _index_parallel(name,size,workers):
+    """
+    Index sequential file name by splitting it into byte ranges that are indexed by
+    worker processes.  The shard indexes are concatenated and the station record links
+    are converted to record numbers of the file.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    nshards = min(workers*4,max(size//PARALLEL_INDEX_SHARD_MIN_SIZE,1))
+    bounds = [(size*n)//nshards for n in range(nshards+1)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        shards = list(executor.map(_index_shard,[name]*nshards,bounds[:-1],bounds[1:]))
+    index = _new_index()
+    last_station = 0
+    for shard in shards:
+        nprevious = len(index['offset'])
+        for k in index:
+            if k != 'linked_station_id_record':
+                index[k].extend(shard[k])
+        for n in shard['linked_station_id_record']:
+            index['linked_station_id_record'].append(last_station if n == -1 else n+nprevious)
+        stations = [n for n,t in enumerate(shard['type']) if t == 'station']
+        if stations:
+            last_station = stations[-1]+1+nprevious
+    return index
+
+def _copy_plan(out,plan):
+    """
+    Write Fortran records to file object out.  plan is a list of (file object,start,end)
+    byte ranges of records to copy, or None for a trailer record.  Consecutive byte
+    ranges of the same file are copied as one.
+    """
+    current = None
+    start = end = None
+    for item in plan:
+        if item is not None:
+            if item[0] is current and item[1] == end:
+                end = item[2]
+                continue
+        if current is not None:
+            _copy_bytes(current,out,start,end)
+            current = None
+        if item is None:
+            out.write(_TRAILER_RECORD)
+        else:
+            current,start,end = item
+    if current is not None:
+        _copy_bytes(current,out,start,end)
+
+def _copy_bytes(filehandle,out,start,end):
+    """
+    Copy bytes start to end of filehandle to file object out.
+    """
+    filehandle.seek(start)
+    while start < end:
+        chunk = filehandle.read(min(COPY_CHUNK_SIZE,end-start))
+        out.write(chunk)
+        start += len(chunk)
+
+def merge(filenames,dest,mode='w'):
+    """
+    Merge TDLPACK sequential files into one file sorted by date, MOS-2000 ID and lead
+    time, without unpacking records.
+
+    The files are opened one at a time.  The sort keys and byte ranges of the data
+    records of each file are sorted (files that are already sorted are not sorted again)
+    and saved as a run of int64 rows to a temporary file, and the file is closed.  The
+    runs are then combined with a k-way merge of memory-mapped arrays and the Fortran
+    records are copied byte-for-byte from the source files, which are reopened without
+    indexing.  Memory use depends on the number of records of the largest file and not
+    on the total size of the files.
+
+    Station call letter records are written before the first station data record and
+    whenever the station list changes.  A trailer record is written before each station
+    call letter record that follows data records and at the end of the file.  Trailer
+    records of the source files are not copied.
+
+    Parameters
+    ----------
+
+    **`filenames : list of str`**
+
+    Sequential files to merge.
+
+    **`dest : str`**
+
+    Name of the new file.
+
+    **`mode : {'w', 'x', 'a'}, optional`**
+
+    `'w'` overwrites an existing file; `'x'` raises an error if the file exists;
+    `'a'` appends to an existing file.
+
+    Returns
+    -------
+
+    **`int`**
+
+    Number of records written, including station call letter and trailer records.
+    """
+    stations = {}
+    nrecords = 0
+    with tempfile.TemporaryDirectory() as tmpdir:
+        runs = []
+        for k,name in enumerate(filenames):
+            with open(name) as f:
+                keys = _sorted_keys(k,f,stations)
+            runs.append(os.path.join(tmpdir,str(k)+'.npy'))
+            np.save(runs[-1],keys)
+            del keys
+        runs = [np.load(run,mmap_mode='r') for run in runs]
+
+        sources = collections.OrderedDict()
+        plan = []
+        def source(k):
+            if k in sources:
+                sources.move_to_end(k)
+            else:
+                if len(sources) >= MERGE_MAX_OPEN_FILES:
+                    # Records of the file to close may be waiting to be copied.
+                    _copy_plan(out,plan)
+                    del plan[:]
+                    sources.popitem(last=False)[1].close()
+                sources[k] = builtins.open(filenames[k],mode='rb')
+            return sources[k]
+
+        try:
+            with builtins.open(dest,mode=mode+'b') as out:
+                station = -1
+                has_data = False
+                for key in heapq.merge(*[_iter_run(run) for run in runs]):
+                    k,start,end,digest,sta_start,sta_end = key[6:]
+                    if digest >= 0 and digest != station:
+                        if has_data:
+                            plan.append(None)
+                            nrecords += 1
+                        plan.append((source(k),sta_start,sta_end))
+                        nrecords += 1
+                        station = digest
+                    plan.append((source(k),start,end))
+                    nrecords += 1
+                    has_data = True
+                    if len(plan) >= 1024:
+                        _copy_plan(out,plan)
+                        del plan[:]
+                if has_data:
+                    plan.append(None)
+                    nrecords += 1
+                _copy_plan(out,plan)
+        finally:
+            for fh in sources.values():
+                fh.close()
+            del runs
+    return nrecords
+
+def _sorted_keys(k,f,stations):
+    """
+    Return the rows (date, id1, id2, id3, id4, lead, k, start, end, station, station
+    start, station end) of the data records of file f in sorted order as an int64 array.
+    start and end are the byte range of the Fortran record.  station is the number of
+    the station list of a station data record in dict stations, which maps the digests
+    of station lists to numbers, or -1 for other records.
+    """
+    index = f._index
+    n = np.array([i for i,t in enumerate(index['type']) if t == 'data'],dtype=np.int64)
+    keys = np.zeros((n.shape[0],12),dtype=np.int64)
+    for col,name in enumerate(('date','id1','id2','id3','id4','lead')):
+        keys[:,col] = [index[name][i] for i in n.tolist()]
+    keys[:,6] = k
+    offset = np.asarray(index['offset'],dtype=np.int64)
+    size = np.asarray(index['size'],dtype=np.int64)
+    keys[:,7] = offset[n]-12
+    keys[:,8] = offset[n]+size[n]+4
+    keys[:,9] = -1
+    numbers = {}
+    for row,i in enumerate(n.tolist()):
+        linked = index['linked_station_id_record'][i]
+        if 'nsta' in index['dims'][i] and linked > 0:
+            if linked not in numbers:
+                numbers[linked] = stations.setdefault(_station_digest(f,linked),len(stations))
+            keys[row,9] = numbers[linked]
+            keys[row,10] = offset[linked-1]-12
+            keys[row,11] = offset[linked-1]+size[linked-1]+4
+    if not _is_sorted(keys[:,0:8]):
+        keys = keys[np.lexsort(keys[:,7::-1].T)]
+    return keys
+
+def _is_sorted(keys):
+    """
+    Return True if the rows of 2-D array keys are in lexicographic order.
+    """
+    if keys.shape[0] < 2:
+        return True
+    diff = np.sign(keys[1:]-keys[:-1])
+    first = np.argmax(diff != 0,axis=1)
+    return bool(np.all(diff[np.arange(diff.shape[0]),first] >= 0))
+
+def _iter_run(run):
+    """
+    Iterate over the rows of a sorted run as tuples, reading MERGE_BLOCK_ROWS rows at a
+    time.
+    """
+    for i in range(0,run.shape[0],MERGE_BLOCK_ROWS):
+        for row in run[i:i+MERGE_BLOCK_ROWS].tolist():
+            yield tuple(row)
+
+def _station_digest(f,n):
+    """
+    Return the digest of the station call letters of station record n of file f.  Equal
+    station lists of different files have the same digest.
+    """
+    return hashlib.sha1(f._pread(n-1)).digest()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Chunk-load throughput of the xarray TDLPACK backend with the dask threaded scheduler.
+
+A multi-variable grid file is opened with one chunk per record and every chunk is loaded
+with 1, 2, 4, ... threads.  Records are read with positioned reads (os.pread) and no lock is
+shared between chunks, so the reads of concurrent chunk loads are not serialized.  Decoding
+with the f2py unpack routine holds the GIL, so any speedup is bounded by the share of time
+spent reading; no speedup has been measured so far (only a 1-CPU host was available).
+
+Usage: python benchmarks/backend_threads.py [filename] [--threads 1 2 4 8] [--repeat 3]
+"""
+import argparse
+import os
+import time
+
+import dask
+import xarray as xr
+
+
+_SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','sampledata',
+                       'gfspkd47.2017020100.sq')
+# Variables of the sample file that share the same cube (12 isobaric levels).
+_SAMPLE_FILTERS = dict(cccfff=[1000,2000,3000,4000,4100,5000])
+
+def chunk_load_rate(filename,filters,threads,repeat):
+    """
+    Return the best number of chunks loaded per second over repeat loads.
+    """
+    best = 0.
+    for _ in range(repeat):
+        ds = xr.open_dataset(filename,engine='tdlpack',filters=filters,
+                             chunks={d:1 for d in ('date','lead','uuuu')})
+        arrays = [ds[v].data for v in ds.data_vars]
+        nchunks = sum(a.npartitions for a in arrays)
+        t0 = time.perf_counter()
+        dask.compute(*arrays,scheduler='threads',num_workers=threads)
+        best = max(best,nchunks/(time.perf_counter()-t0))
+        ds.close()
+    return nchunks,best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('filename',nargs='?',default=_SAMPLE)
+    parser.add_argument('--threads',nargs='+',type=int,default=[1,2,4,8])
+    parser.add_argument('--repeat',type=int,default=3)
+    args = parser.parse_args()
+    filters = _SAMPLE_FILTERS if args.filename == _SAMPLE else None
+
+    base = None
+    for threads in args.threads:
+        nchunks,rate = chunk_load_rate(args.filename,filters,threads,args.repeat)
+        base = rate if base is None else base
+        print('threads %3d  chunks %5d  %9.1f chunks/s  speedup %5.2f'%(threads,nchunks,rate,rate/base))
+
+if __name__ == '__main__':
+    main()
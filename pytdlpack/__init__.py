@@ -7,4 +7,8 @@ from ._grid_definitions import grids
 from .version import version as __version__
 
 __all__ = ['__version__','TdlpackFile','TdlpackRecord','TdlpackStationRecord','TdlpackTrailerRecord',
-           'open','create_grid_definition','grids']
+           'open','create_grid_definition','grids','configure_latlon_cache','clear_latlon_cache',
+           'grid_to_latlon','latlon_to_grid','StationSampler',
+           'GridRemapper','StationList','configure_ra_files','ra_file_stats',
+           'RandomAccessWriter','compact_ra_file','sequential_to_ra',
+           'ra_to_sequential']
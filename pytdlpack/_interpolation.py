@@ -0,0 +1,514 @@
+"""
+Interpolation of gridded TDLPACK data to station locations and to other grids.
+
+Interpolation weights are computed once for a source grid and a set of target locations
+(stations or the points of another grid) and then applied to any number of fields with a
+single vectorized gather.  Grid-to-grid weights can also be cached on disk.
+"""
+import collections
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from ._latlon_cache import grid_fingerprint, latlon_cache
+from ._projections import _as_griddict, latlon_to_grid, grid_latlons
+
+DEFAULT_MISSING_VALUE = np.float32(9999.0)
+
+# Points within this distance (in grid lengths) outside of the grid are considered to be
+# on the edge of the grid.
+EDGE_TOLERANCE = 0.01
+
+REMAP_CACHE_DIR_ENV = 'PYTDLPACK_REMAP_CACHE_DIR'
+REMAP_CACHE_MAX_ENTRIES = 4
+
+class StationSampler(object):
+    """
+    Samples gridded data at station locations using precomputed interpolation weights.
+
+    Attributes
+    ----------
+
+    **`grid : dict`**
+
+    Grid definition dictionary.
+
+    **`method : {'nearest', 'bilinear'}`**
+
+    Interpolation method.
+
+    **`nsta : int`**
+
+    Number of stations.
+
+    **`i,j : array_like`**
+
+    Fractional 1-based grid coordinates of the stations.
+
+    **`inside : array_like`**
+
+    Boolean array that is True for stations inside the grid.
+
+    **`ii,jj : array_like`**
+
+    0-based grid indices of shape (npts, nsta) of the grid points used for each station,
+    where npts is 1 for nearest neighbor and 4 for bilinear interpolation.
+
+    **`weights : array_like`**
+
+    Numpy.float32 array of shape (npts, nsta) of interpolation weights.  Weights of
+    stations outside the grid are 0.
+    """
+    def __init__(self,grid,lats,lons,method='nearest'):
+        """
+        Constructor
+
+        Parameters
+        ----------
+
+        **`grid : dict or str`**
+
+        Grid definition dictionary (see `pytdlpack.create_grid_definition`) or name of a
+        grid in `pytdlpack.grids`.
+
+        **`lats,lons : array_like`**
+
+        Station latitudes and longitudes (degrees West).
+
+        **`method : {'nearest', 'bilinear'}, optional`**
+
+        Interpolation method.  The default is 'nearest'.
+        """
+        if method not in ('nearest','bilinear'):
+            raise ValueError("Unsupported interpolation method: "+str(method))
+        self.grid = _as_griddict(grid)
+        self.method = method
+        lats = np.asarray(lats,dtype=np.float64).ravel()
+        lons = np.asarray(lons,dtype=np.float64).ravel()
+        if lats.shape != lons.shape:
+            raise ValueError("lats and lons must have the same number of values")
+        self.nsta = lats.shape[0]
+        self.i,self.j = latlon_to_grid(self.grid,lats,lons)
+        self.ii,self.jj,self.weights,self.inside = _weights(self.grid,self.i,self.j,method)
+        self._index = self.ii*int(self.grid['ny'])+self.jj
+
+    def __repr__(self):
+        return 'StationSampler(method=%s, nsta=%d, nx=%d, ny=%d)'%(self.method,self.nsta,
+               self.grid['nx'],self.grid['ny'])
+
+    def __call__(self,data,missing_value=DEFAULT_MISSING_VALUE):
+        """
+        Sample gridded data at the station locations.
+
+        Parameters
+        ----------
+
+        **`data : array_like`**
+
+        Array of shape (nx,ny) or (N,nx,ny) of gridded data.
+
+        **`missing_value : float, optional`**
+
+        Grid points with this value (or NaN) are not used and stations without any
+        valid grid point are set to this value.  The default is 9999.
+
+        Returns
+        -------
+
+        **`array_like`**
+
+        Numpy.float32 array of shape (nsta,) or (N,nsta) of station values.
+        """
+        data = np.asarray(data)
+        if data.shape[-2:] != (self.grid['nx'],self.grid['ny']):
+            raise ValueError("data shape %s does not match grid (%d, %d)"%
+                             (data.shape,self.grid['nx'],self.grid['ny']))
+        return _apply(data,self._index,self.weights,self.inside,missing_value)
+
+    def sample(self,records,missing_value=None):
+        """
+        Sample gridded TDLPACK records at the station locations.
+
+        Parameters
+        ----------
+
+        **`records : TdlpackRecord or list of TdlpackRecord`**
+
+        Gridded TDLPACK records on the grid of this sampler.  Data are unpacked if
+        necessary.
+
+        **`missing_value : float, optional`**
+
+        Value assigned to stations without valid data.  The default is the primary
+        missing value of each record, or 9999. if the record has none.
+
+        Returns
+        -------
+
+        **`array_like`**
+
+        Numpy.float32 array of shape (nsta,) for a single record or (N,nsta) for a list
+        of records.
+        """
+        single = not isinstance(records,(list,tuple))
+        if single: records = [records]
+        fields = np.empty((len(records),self.grid['nx'],self.grid['ny']),dtype=np.float32)
+        missing = np.empty(len(records),dtype=np.float32)
+        for n,rec in enumerate(records):
+            _check_record(rec,self.grid)
+            fields[n] = rec.data
+            missing[n] = _missing_value(rec)
+        values = _apply(fields,self._index,self.weights,self.inside,missing)
+        if missing_value is not None:
+            values = np.where(values == missing[:,np.newaxis],np.float32(missing_value),values)
+        return values[0] if single else values
+
+    def sample_record(self,record,id=None,plain=None):
+        """
+        Sample a gridded TDLPACK record at the station locations and return a station
+        TDLPACK record ready to be packed.
+
+        Parameters
+        ----------
+
+        **`record : TdlpackRecord`**
+
+        Gridded TDLPACK record on the grid of this sampler.
+
+        **`id : list or 1-D array, optional`**
+
+        4-word MOS-2000 ID of the station record.  The default is the ID of `record`.
+
+        **`plain : str, optional`**
+
+        Plain language descriptor.  The default is the descriptor of `record`.
+
+        Returns
+        -------
+
+        **`TdlpackRecord`**
+
+        Station TDLPACK record.  Stations without valid data are set to the primary
+        missing value of `record` (9999. if it has none).
+        """
+        values = self.sample(record)
+        return _new_record(record,values,id=id,plain=plain)
+
+class GridRemapper(object):
+    """
+    Remaps data between two TDLPACK grids using precomputed interpolation weights.
+
+    Weight tables are sparse: only destination grid points inside of the source grid are
+    stored, each with the flat indices and weights of its k source grid points.  Tables
+    are kept in memory for the most recently used grid pairs and, if a cache directory is
+    given, stored on disk keyed by the fingerprints of both grids and the interpolation
+    method.
+
+    Attributes
+    ----------
+
+    **`src,dst : dict`**
+
+    Source and destination grid definition dictionaries.
+
+    **`method : {'nearest', 'bilinear'}`**
+
+    Interpolation method.
+
+    **`points : array_like`**
+
+    Numpy.int32 array of shape (npts,) of the flat (C-order) indices of the destination
+    grid points inside of the source grid.
+
+    **`index : array_like`**
+
+    Numpy.int32 array of shape (npts,k) of the flat (C-order) indices of the source grid
+    points used for each destination grid point, where k is 1 for nearest neighbor and 4
+    for bilinear interpolation.
+
+    **`weights : array_like`**
+
+    Numpy.float32 array of shape (npts,k) of interpolation weights.
+
+    **`inside : array_like`**
+
+    Boolean array of shape (nx,ny) that is True for destination grid points inside of
+    the source grid.  Destination grid points outside of the source grid are missing.
+    """
+    def __init__(self,src,dst,method='nearest',directory=None):
+        """
+        Constructor
+
+        Parameters
+        ----------
+
+        **`src,dst : dict or str`**
+
+        Source and destination grid definition dictionaries (see
+        `pytdlpack.create_grid_definition`) or names of grids in `pytdlpack.grids`.
+
+        **`method : {'nearest', 'bilinear'}, optional`**
+
+        Interpolation method.  The default is 'nearest'.
+
+        **`directory : str, optional`**
+
+        Directory of the on-disk weight cache.  The default can be set with the
+        environment variable `PYTDLPACK_REMAP_CACHE_DIR`.  If neither is set, weights
+        are only cached in memory.
+        """
+        if method not in ('nearest','bilinear'):
+            raise ValueError("Unsupported interpolation method: "+str(method))
+        self.src = _as_griddict(src)
+        self.dst = _as_griddict(dst)
+        self.method = method
+        if directory is None:
+            directory = os.environ.get(REMAP_CACHE_DIR_ENV)
+        self.points,self.index,self.weights = _remap_weights(self.src,self.dst,method,directory)
+
+    def __repr__(self):
+        return 'GridRemapper(method=%s, src=(%d, %d), dst=(%d, %d))'%(self.method,
+               self.src['nx'],self.src['ny'],self.dst['nx'],self.dst['ny'])
+
+    @property
+    def inside(self):
+        inside = np.zeros(int(self.dst['nx'])*int(self.dst['ny']),dtype=bool)
+        inside[self.points] = True
+        return inside.reshape(self.dst['nx'],self.dst['ny'])
+
+    def __call__(self,data,missing_value=DEFAULT_MISSING_VALUE):
+        """
+        Remap gridded data to the destination grid.
+
+        Parameters
+        ----------
+
+        **`data : array_like`**
+
+        Array of shape (nx,ny) or (N,nx,ny) of data on the source grid.
+
+        **`missing_value : float, optional`**
+
+        Source grid points with this value (or NaN) are not used and destination grid
+        points without any valid source grid point are set to this value.  The default
+        is 9999.
+
+        Returns
+        -------
+
+        **`array_like`**
+
+        Numpy.float32 array of shape (nx,ny) or (N,nx,ny) of data on the destination grid.
+        """
+        data = np.asarray(data)
+        if data.shape[-2:] != (self.src['nx'],self.src['ny']):
+            raise ValueError("data shape %s does not match grid (%d, %d)"%
+                             (data.shape,self.src['nx'],self.src['ny']))
+        return self._remap(data,missing_value)
+
+    def remap(self,records):
+        """
+        Remap gridded TDLPACK records to the destination grid.
+
+        Parameters
+        ----------
+
+        **`records : TdlpackRecord or list of TdlpackRecord`**
+
+        Gridded TDLPACK records on the source grid.  Data are unpacked if necessary.
+
+        Returns
+        -------
+
+        **`TdlpackRecord or list of TdlpackRecord`**
+
+        New TDLPACK records on the destination grid, ready to be packed.  Points without
+        valid data are set to the primary missing value of the source record (9999. if it
+        has none).
+        """
+        single = not isinstance(records,(list,tuple))
+        if single: records = [records]
+        fields = np.empty((len(records),self.src['nx'],self.src['ny']),dtype=np.float32)
+        missing = np.empty(len(records),dtype=np.float32)
+        for n,rec in enumerate(records):
+            _check_record(rec,self.src)
+            fields[n] = rec.data
+            missing[n] = _missing_value(rec)
+        values = self._remap(fields,missing)
+        new = [_new_record(rec,np.asfortranarray(v),grid=self.dst) for rec,v in zip(records,values)]
+        return new[0] if single else new
+
+    def _remap(self,data,missing_value):
+        """
+        Apply the weights to data of shape (...,nx,ny) on the source grid and scatter the
+        values to the destination grid points inside of the source grid.
+        """
+        missing_value = np.asarray(missing_value,dtype=np.float32)
+        values = _apply(data,self.index.T,self.weights.T,np.ones(1,dtype=bool),missing_value)
+        fill = missing_value.reshape(missing_value.shape+(1,)) if missing_value.ndim > 0 else missing_value
+        out = np.empty(values.shape[:-1]+(int(self.dst['nx'])*int(self.dst['ny']),),dtype=np.float32)
+        out[...] = fill
+        out[...,self.points] = values
+        return out.reshape(values.shape[:-1]+(self.dst['nx'],self.dst['ny']))
+
+_remap_cache = collections.OrderedDict()
+_remap_cache_lock = threading.Lock()
+
+def _remap_weights(src,dst,method,directory):
+    """
+    Return the sparse table (points, index, weights) for remapping from grid src to grid
+    dst (see `GridRemapper`).  Tables are looked up in memory, then on disk, before being
+    computed.
+    """
+    key = (grid_fingerprint(src),grid_fingerprint(dst),method)
+    with _remap_cache_lock:
+        if key in _remap_cache:
+            _remap_cache.move_to_end(key)
+            return _remap_cache[key]
+
+    path = None
+    table = None
+    if directory is not None:
+        name = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        path = os.path.join(directory,'remap_'+name+'.npz')
+        try:
+            with np.load(path) as npz:
+                table = (npz['points'],npz['index'],npz['weights'])
+        except(IOError,ValueError,KeyError):
+            table = None
+
+    if table is None:
+        lats,lons = latlon_cache.get(dst,grid_latlons)
+        i,j = latlon_to_grid(src,lats.astype(np.float64),lons.astype(np.float64))
+        ii,jj,weights,inside = _weights(src,i,j,method)
+        points = np.flatnonzero(inside)
+        index = ii.reshape(ii.shape[0],-1)[:,points]*int(src['ny'])+jj.reshape(jj.shape[0],-1)[:,points]
+        table = (points.astype(np.int32),np.ascontiguousarray(index.T,dtype=np.int32),
+                 np.ascontiguousarray(weights.reshape(weights.shape[0],-1)[:,points].T))
+        if path is not None:
+            os.makedirs(directory,exist_ok=True)
+            # Write to a temporary file and rename so that concurrent readers never see
+            # a partially written file.
+            tmp = path+'.'+str(os.getpid())+'.tmp'
+            with open(tmp,'wb') as f:
+                np.savez(f,points=table[0],index=table[1],weights=table[2])
+            os.replace(tmp,path)
+
+    with _remap_cache_lock:
+        _remap_cache[key] = table
+        while len(_remap_cache) > REMAP_CACHE_MAX_ENTRIES:
+            _remap_cache.popitem(last=False)
+    return table
+
+def _check_record(rec,grid):
+    """
+    Unpack a record if necessary and check that it is on grid.
+    """
+    if not rec._metadata_unpacked: rec.unpack()
+    if rec.type != 'grid' or not _same_grid(rec.grid_def,grid):
+        raise ValueError("Record is not on grid (proj=%d, nx=%d, ny=%d)"%
+                         (grid['proj'],grid['nx'],grid['ny']))
+    if not rec._data_unpacked: rec.unpack(data=True)
+
+def _same_grid(a,b):
+    """
+    Return True if grid definitions a and b describe the same grid.  Grid definitions
+    unpacked from records may differ slightly from those in `pytdlpack.grids` (e.g. a lower
+    left longitude of 150.0 instead of 150.0003), so a small tolerance is allowed.
+    """
+    if (int(a['proj']),int(a['nx']),int(a['ny'])) != (int(b['proj']),int(b['nx']),int(b['ny'])):
+        return False
+    for k in ('latll','lonll','orientlon','stdlat'):
+        if abs(a[k]-b[k]) > 1.e-3:
+            return False
+    return abs(a['meshlength']-b['meshlength']) < 1.
+
+def _missing_value(rec):
+    return rec.primary_missing_value if rec.primary_missing_value != 0 else DEFAULT_MISSING_VALUE
+
+def _new_record(rec,values,grid=None,id=None,plain=None):
+    """
+    Return a new TdlpackRecord with the metadata of rec and the given data values.
+    """
+    from ._pytdlpack import TdlpackRecord
+    new = TdlpackRecord(date=int(rec.reference_date),
+                        id=list(rec.id) if id is None else id,
+                        lead=int(rec.lead_time),
+                        plain=rec.plain if plain is None else plain,
+                        grid=grid,data=values,
+                        missing_value=float(_missing_value(rec)))
+    if grid is not None:
+        new.grid_def = dict(grid)
+    return new
+
+def _weights(grid,i,j,method):
+    """
+    Compute 0-based grid indices and weights of the grid points surrounding fractional
+    1-based grid coordinates (i,j).
+    """
+    nx = int(grid['nx'])
+    ny = int(grid['ny'])
+    x = np.asarray(i,dtype=np.float64)-1.
+    y = np.asarray(j,dtype=np.float64)-1.
+    inside = (x >= -EDGE_TOLERANCE) & (x <= nx-1+EDGE_TOLERANCE) & \
+             (y >= -EDGE_TOLERANCE) & (y <= ny-1+EDGE_TOLERANCE)
+    x = np.where(inside,np.clip(x,0.,nx-1),0.)
+    y = np.where(inside,np.clip(y,0.,ny-1),0.)
+    if method == 'nearest':
+        ii = np.rint(x).astype(np.intp)[np.newaxis]
+        jj = np.rint(y).astype(np.intp)[np.newaxis]
+        weights = inside.astype(np.float32)[np.newaxis]
+    else:
+        # Points on the last row or column use the cell below/left of them.
+        i0 = np.minimum(np.floor(x),max(nx-2,0)).astype(np.intp)
+        j0 = np.minimum(np.floor(y),max(ny-2,0)).astype(np.intp)
+        i1 = np.minimum(i0+1,nx-1)
+        j1 = np.minimum(j0+1,ny-1)
+        dx = x-i0
+        dy = y-j0
+        ii = np.stack([i0,i1,i0,i1])
+        jj = np.stack([j0,j0,j1,j1])
+        weights = np.stack([(1.-dx)*(1.-dy),dx*(1.-dy),(1.-dx)*dy,dx*dy])
+        weights = (weights*inside).astype(np.float32)
+    return ii,jj,weights,inside
+
+def _apply(data,index,weights,inside,missing_value):
+    """
+    Apply interpolation weights to data of shape (...,nx,ny).  index and weights have
+    shape (npts,...) and index holds flat (C-order) indices into the last two dimensions
+    of data.  Grid points that are missing are excluded and the weights of the remaining
+    points are renormalized.  Target points that are not inside the grid are set to
+    missing_value, which is a scalar or a 1-D array with one value per field.
+    """
+    data = np.asarray(data,dtype=np.float32)
+    flat = data.reshape(data.shape[:-2]+(-1,))
+    missing_value = np.asarray(missing_value,dtype=np.float32)
+    if missing_value.ndim > 0:
+        missing_value = missing_value.reshape(missing_value.shape+(1,)*(index.ndim-1))
+    mv = missing_value.reshape(missing_value.shape[:flat.ndim-1]+(1,)) if missing_value.ndim > 0 else missing_value
+    has_missing = np.any((flat == mv) | np.isnan(flat))
+
+    # Accumulate one interpolation point at a time; this is faster and uses less memory
+    # than gathering all points at once.
+    out = np.zeros(flat.shape[:-1]+index.shape[1:],dtype=np.float32)
+    wsum = np.zeros(out.shape,dtype=np.float32) if has_missing else None
+    for k in range(index.shape[0]):
+        vals = flat.take(index[k],axis=-1)
+        if has_missing:
+            valid = (vals != missing_value) & ~np.isnan(vals)
+            w = np.where(valid,weights[k],np.float32(0.))
+            vals[~valid] = 0.
+            wsum += w
+        else:
+            w = weights[k]
+        vals *= w
+        out += vals
+    if has_missing:
+        with np.errstate(invalid='ignore',divide='ignore'):
+            out /= wsum
+        out = np.where(wsum > 0.,out,missing_value).astype(np.float32)
+    elif not inside.all():
+        out = np.where(inside,out,missing_value).astype(np.float32)
+    return out
@@ -0,0 +1,218 @@
+"""
+Process-wide cache of grid latitude and longitude arrays.
+
+Computing the latitude and longitude of every grid point is expensive for large grids
+(e.g. the NBM CONUS grid has ~3.7M points), yet the result only depends on the grid
+definition.  Arrays are cached in memory keyed by a fingerprint of the grid definition
+and the cache is bounded by the total number of bytes held.  Optionally, arrays can also
+be stored on disk as `.npy` files that are memory-mapped when loaded.
+
+Arrays returned from the cache are shared between all callers and are read-only.
+"""
+import collections
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_LATLON_CACHE_MAX_BYTES = 268435456 # 256 MB
+LATLON_CACHE_DIR_ENV = 'PYTDLPACK_LATLON_CACHE_DIR'
+
+def grid_fingerprint(griddict):
+    """
+    Returns a hashable fingerprint of a grid definition.
+
+    Grid parameters are scaled to integers the same way they are stored in TDLPACK
+    Section 2 so that grid definitions created from a packed record and from
+    `pytdlpack.create_grid_definition` produce the same fingerprint.
+
+    Parameters
+    ----------
+
+    **`griddict : dict`**
+
+    Dictionary of TDLPACK grid definition parameters.
+
+    Returns
+    -------
+
+    **`tuple`**
+
+    Tuple of integers (proj, nx, ny, latll, lonll, orientlon, stdlat, meshlength).
+    """
+    return (int(griddict['proj']),
+            int(griddict['nx']),
+            int(griddict['ny']),
+            int(round(griddict['latll']*10000)),
+            int(round(griddict['lonll']*10000)),
+            int(round(griddict['orientlon']*10000)),
+            int(round(griddict['stdlat']*10000)),
+            int(round(griddict['meshlength']*1000)))
+
+class LatLonCache(object):
+    """
+    LRU cache of (lats, lons) array pairs keyed by grid fingerprint.
+
+    Attributes
+    ----------
+
+    **`max_bytes : int`**
+
+    Upper bound of the total size in bytes of arrays held in memory.
+
+    **`directory : str`**
+
+    Directory of the on-disk `.npy` store.  If None, arrays are only cached in memory.
+
+    **`nbytes : int`**
+
+    Total size in bytes of arrays held in memory.
+
+    **`hits : int`**
+
+    Number of lookups served from memory or disk.
+
+    **`misses : int`**
+
+    Number of lookups that required computing the arrays.
+    """
+    def __init__(self,max_bytes=DEFAULT_LATLON_CACHE_MAX_BYTES,directory=None):
+        """Contructor"""
+        self.max_bytes = int(max_bytes)
+        self.directory = directory
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self,key):
+        return key in self._entries
+
+    def clear(self):
+        """
+        Remove all arrays held in memory.  The on-disk store is not modified.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def get(self,griddict,compute):
+        """
+        Return the cached (lats, lons) for a grid, computing them if necessary.
+
+        Parameters
+        ----------
+
+        **`griddict : dict`**
+
+        Dictionary of TDLPACK grid definition parameters.
+
+        **`compute : callable`**
+
+        Function that accepts `griddict` and returns a tuple of (lats, lons) arrays.
+
+        Returns
+        -------
+
+        **`lats,lons : array_like`**
+
+        Read-only arrays of grid latitudes and longitudes.
+        """
+        key = grid_fingerprint(griddict)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        latlons = self._load(key)
+        if latlons is None:
+            lats,lons = compute(griddict)
+            latlons = (_readonly(lats),_readonly(lons))
+            self._store(key,latlons)
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.hits += 1
+
+        with self._lock:
+            if key in self._entries:
+                # Another thread filled this entry while we were computing.
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self._entries[key] = latlons
+            self.nbytes += latlons[0].nbytes+latlons[1].nbytes
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                _,(lats,lons) = self._entries.popitem(last=False)
+                self.nbytes -= lats.nbytes+lons.nbytes
+        return latlons
+
+    def _paths(self,key):
+        name = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        return (os.path.join(self.directory,'latlons_'+name+'.lats.npy'),
+                os.path.join(self.directory,'latlons_'+name+'.lons.npy'))
+
+    def _load(self,key):
+        if self.directory is None:
+            return None
+        latfile,lonfile = self._paths(key)
+        try:
+            lats = np.load(latfile,mmap_mode='r')
+            lons = np.load(lonfile,mmap_mode='r')
+        except(IOError,ValueError):
+            return None
+        return (lats,lons)
+
+    def _store(self,key,latlons):
+        if self.directory is None:
+            return
+        os.makedirs(self.directory,exist_ok=True)
+        for path,arr in zip(self._paths(key),latlons):
+            # Write to a temporary file and rename so that concurrent readers never
+            # see a partially written array.
+            tmp = path+'.'+str(os.getpid())+'.tmp'
+            with open(tmp,'wb') as f:
+                np.save(f,arr)
+            os.replace(tmp,path)
+
+def _readonly(arr):
+    arr = np.asarray(arr)
+    arr.flags.writeable = False
+    return arr
+
+latlon_cache = LatLonCache(directory=os.environ.get(LATLON_CACHE_DIR_ENV))
+
+def configure_latlon_cache(max_bytes=None,directory=None):
+    """
+    Configure the process-wide latitude/longitude cache.
+
+    Parameters
+    ----------
+
+    **`max_bytes : int, optional`**
+
+    Upper bound of the total size in bytes of arrays held in memory.  Least recently
+    used arrays are evicted first.
+
+    **`directory : str, optional`**
+
+    Directory used to store arrays as `.npy` files.  Stored arrays are memory-mapped
+    when loaded.  Pass an empty string to disable the on-disk store.  The default can
+    also be set with the environment variable `PYTDLPACK_LATLON_CACHE_DIR`.
+    """
+    if max_bytes is not None:
+        latlon_cache.max_bytes = int(max_bytes)
+    if directory is not None:
+        latlon_cache.directory = directory if directory else None
+
+def clear_latlon_cache():
+    """
+    Remove all latitude/longitude arrays held in memory.
+    """
+    latlon_cache.clear()
@@ -0,0 +1,296 @@
+"""
+Vectorized MOS-2000 map projections.
+
+These functions are NumPy implementations of the MOS-2000 subroutines LMIJLL/LMLLIJ
+(Lambert Conformal), PSIJLL/PSLLIJ (Polar Stereographic) and MCIJLL/MCLLIJ (Mercator).
+They operate on whole arrays at once instead of one point per call.
+
+MOS-2000 conventions are followed: grid coordinates (i,j) are 1-based with (1,1) at the
+lower left grid point, and longitudes are in degrees West (0-360).  The projection
+constants (earth radius and the value of pi) are those used by MOS-2000 so results
+agree with the Fortran routines.
+"""
+import math
+
+import numpy as np
+
+PI = 3.14159
+RERTH = 6371200.
+RADPDG = PI/180.
+DEGPRA = 180./PI
+
+LAMBERT_CONFORMAL = 3
+POLAR_STEREOGRAPHIC = 5
+MERCATOR = 7
+
+MISSING_LATLON = 9999.
+
+def _as_griddict(grid):
+    """
+    Return a grid definition dictionary.  grid can be a dict or the name of a grid
+    in `pytdlpack.grids`.
+    """
+    if isinstance(grid,str):
+        from ._grid_definitions import grids
+        return grids[grid]
+    return grid
+
+def grid_to_latlon(grid,i,j):
+    """
+    Convert grid coordinates to latitude and longitude.
+
+    Parameters
+    ----------
+
+    **`grid : dict or str`**
+
+    Grid definition dictionary (see `pytdlpack.create_grid_definition`) or name of a
+    grid in `pytdlpack.grids`.
+
+    **`i,j : array_like`**
+
+    1-based grid coordinates in the x and y directions.  Fractional values are allowed.
+    The arrays are broadcast against each other.
+
+    Returns
+    -------
+
+    **`lats,lons : array_like`**
+
+    Arrays of latitudes and longitudes (degrees West).  The arrays are numpy.float32 if
+    both `i` and `j` are numpy.float32, otherwise numpy.float64.  For Lambert Conformal
+    grids, points that cannot be projected are set to 9999.
+    """
+    g = _as_griddict(grid)
+    xi,yj,shape = _as_float_arrays(i,j)
+    proj = int(g['proj'])
+    if proj == LAMBERT_CONFORMAL:
+        lats,lons = _lambert_ij_to_ll(g,xi,yj)
+    elif proj == POLAR_STEREOGRAPHIC:
+        lats,lons = _polar_ij_to_ll(g,xi,yj)
+    elif proj == MERCATOR:
+        lats,lons = _mercator_ij_to_ll(g,xi,yj)
+    else:
+        raise ValueError("Unsupported map projection: "+str(proj))
+    return (_broadcast(lats,shape),_broadcast(lons,shape))
+
+def latlon_to_grid(grid,lat,lon):
+    """
+    Convert latitude and longitude to grid coordinates.
+
+    Parameters
+    ----------
+
+    **`grid : dict or str`**
+
+    Grid definition dictionary (see `pytdlpack.create_grid_definition`) or name of a
+    grid in `pytdlpack.grids`.
+
+    **`lat,lon : array_like`**
+
+    Latitudes and longitudes (degrees West) of the points.  The arrays are broadcast
+    against each other.
+
+    Returns
+    -------
+
+    **`i,j : array_like`**
+
+    Arrays of fractional 1-based grid coordinates.  The arrays are numpy.float32 if both
+    `lat` and `lon` are numpy.float32, otherwise numpy.float64.
+    """
+    g = _as_griddict(grid)
+    alat,alon,shape = _as_float_arrays(lat,lon)
+    proj = int(g['proj'])
+    if proj == LAMBERT_CONFORMAL:
+        xi,yj = _lambert_ll_to_ij(g,alat,alon)
+    elif proj == POLAR_STEREOGRAPHIC:
+        xi,yj = _polar_ll_to_ij(g,alat,alon)
+    elif proj == MERCATOR:
+        xi,yj = _mercator_ll_to_ij(g,alat,alon)
+    else:
+        raise ValueError("Unsupported map projection: "+str(proj))
+    return (_broadcast(xi,shape),_broadcast(yj,shape))
+
+def grid_latlons(grid):
+    """
+    Compute latitudes and longitudes of every point of a grid.
+
+    Parameters
+    ----------
+
+    **`grid : dict or str`**
+
+    Grid definition dictionary or name of a grid in `pytdlpack.grids`.
+
+    Returns
+    -------
+
+    **`lats,lons : array_like`**
+
+    Numpy.float32 arrays of shape (nx,ny) of grid latitudes and longitudes.
+    """
+    g = _as_griddict(grid)
+    nx = int(g['nx'])
+    ny = int(g['ny'])
+    i = np.arange(1,nx+1,dtype=np.float32)
+    j = np.arange(1,ny+1,dtype=np.float32)
+    # Arrays are computed with shape (ny,nx) so that the transpose is the Fortran-ordered
+    # (nx,ny) array returned by the Fortran routine gridij_to_latlon.
+    lats,lons = grid_to_latlon(g,i[np.newaxis,:],j[:,np.newaxis])
+    return (lats.T,lons.T)
+
+def _as_float_arrays(a,b):
+    """
+    Return a and b as floating point arrays of at least 1 dimension and the shape
+    the results should be broadcast to.
+    """
+    a = np.asarray(a)
+    b = np.asarray(b)
+    shape = np.broadcast(a,b).shape
+    dtype = np.float32 if a.dtype == np.float32 and b.dtype == np.float32 else np.float64
+    return (np.atleast_1d(a.astype(dtype,copy=False)),np.atleast_1d(b.astype(dtype,copy=False)),shape)
+
+def _broadcast(arr,shape):
+    """
+    Return arr with the given shape.  Results that only depend on one of the inputs
+    (e.g. Mercator latitude only depends on j) are expanded to the full shape.
+    """
+    if arr.size == 1:
+        arr = arr.reshape(shape) if shape == () else np.full(shape,arr.item(),dtype=arr.dtype)
+    elif arr.shape != shape:
+        arr = np.ascontiguousarray(np.broadcast_to(arr,shape))
+    return arr
+
+def _lambert_constants(g):
+    rebydx = RERTH/g['meshlength']
+    alatn1 = g['stdlat']*RADPDG
+    an = math.sin(alatn1)
+    cosltn = math.cos(alatn1)
+    elon1 = 360.-g['lonll']
+    elonv = 360.-g['orientlon']
+    elon1l = elon1
+    if (elon1-elonv) > 180.: elon1l = elon1-360.
+    if (elon1-elonv) < -180.: elon1l = elon1+360.
+    elonvr = elonv*RADPDG
+    ala1 = g['latll']*RADPDG
+    rmll = rebydx*((cosltn**(1.-an))*(1.+an)**an)*(((math.cos(ala1))/(1.+math.sin(ala1)))**an)/an
+    arg = an*(elon1l*RADPDG-elonvr)
+    polei = 1.-rmll*math.sin(arg)
+    polej = 1.+rmll*math.cos(arg)
+    return rebydx,an,cosltn,elonv,elonvr,polei,polej
+
+def _lambert_ij_to_ll(g,xi,yj):
+    rebydx,an,cosltn,elonv,elonvr,polei,polej = _lambert_constants(g)
+    xx = xi-polei
+    yy = polej-yj
+    r2 = xx*xx
+    r2 = r2+yy*yy
+    pole = r2 == 0.
+    phi = np.arctan2(xx,yy)
+    # Points on the far side of the cut from the pole cannot be projected.  This
+    # is the test ABS(ATAN2(XX,-YY)).LE.PI*(1.-AN) in LMIJLL.
+    bad = np.abs(phi) >= math.pi-PI*(1.-an)
+
+    # Longitude; equivalent to ALON = 360.-AMOD(ELONV+DEGPRD*ATAN2(XX,YY)/AN+360.,360.)
+    elon = phi
+    elon *= (180./PI)/an
+    elon += elonv+360.
+    elon -= 360.*np.floor(elon/360.)
+    alon = np.subtract(360.,elon,out=elon)
+
+    # Latitude
+    aninv = 1./an
+    thing = ((an/rebydx)**aninv)/((cosltn**((1.-an)*aninv))*(1.+an))
+    alat = np.power(r2,aninv/2.,out=r2)
+    alat *= thing
+    np.arctan(alat,out=alat)
+    alat *= -2.*(180./PI)
+    alat += (PI/2.)*(180./PI)
+
+    if np.any(pole):
+        alat = np.where(pole,90.,alat).astype(alat.dtype)
+        alon = np.where(pole,g['orientlon'],alon).astype(alon.dtype)
+    if np.any(bad):
+        alat = np.where(bad,MISSING_LATLON,alat).astype(alat.dtype)
+        alon = np.where(bad,MISSING_LATLON,alon).astype(alon.dtype)
+    return (alat,alon)
+
+def _lambert_ll_to_ij(g,alat,alon):
+    rebydx,an,cosltn,elonv,elonvr,polei,polej = _lambert_constants(g)
+    elon = 360.-alon
+    elonl = np.where((elon-elonv) > 180.,elon-360.,elon)
+    elonl = np.where((elon-elonv) < -180.,elon+360.,elonl)
+    ala = alat*RADPDG
+    # Latitudes beyond the pole cannot be projected and give NaN.
+    with np.errstate(invalid='ignore',divide='ignore'):
+        rm = (rebydx*((cosltn**(1.-an))*(1.+an)**an)/an)*((np.cos(ala)/(1.+np.sin(ala)))**an)
+    arg = an*(elonl*RADPDG-elonvr)
+    xi = polei+rm*np.sin(arg)
+    yj = polej-rm*np.cos(arg)
+    return (xi,yj)
+
+def _polar_constants(g):
+    rebydx = RERTH/g['meshlength']
+    rxlat = g['stdlat']*RADPDG
+    rlatll = g['latll']*RADPDG
+    rmll = rebydx*math.cos(rlatll)*(1.+math.sin(rxlat))/(1.+math.sin(rlatll))
+    rlonll = (g['orientlon']-g['lonll']+270.)*RADPDG
+    polei = 1.-rmll*math.cos(rlonll)
+    polej = 1.-rmll*math.sin(rlonll)
+    return rebydx,rxlat,polei,polej
+
+def _polar_ij_to_ll(g,xi,yj):
+    rebydx,rxlat,polei,polej = _polar_constants(g)
+    reflon = 90.-g['orientlon']
+    # ACOS(XX/SQRT(R2)) is ill-conditioned where XX/SQRT(R2) is close to +/-1 and loses
+    # up to 3e-3 degrees of longitude in single precision, so numpy.float32 input is
+    # computed in double precision and only the result is rounded.
+    dtype = xi.dtype
+    xx = xi.astype(np.float64)-polei
+    yy = yj.astype(np.float64)-polej
+    r2 = xx*xx
+    r2 = r2+yy*yy
+    pole = r2 == 0.
+    gi2 = (rebydx*(1.+math.sin(rxlat)))**2
+    with np.errstate(divide='ignore',invalid='ignore'):
+        alat = np.arcsin((gi2-r2)/(gi2+r2))
+        alat *= DEGPRA
+        dlon = xx/np.sqrt(r2)
+        np.clip(dlon,-1.,1.,out=dlon)
+        np.arccos(dlon,out=dlon)
+        dlon *= DEGPRA
+    # ALON = REFLON +/- DLON; then ALON = 360.-ALON after adding 360 to negative values.
+    dlon *= np.where(yy > 0.,1.,-1.).astype(dlon.dtype)
+    alon = np.subtract(360.-reflon,dlon,out=dlon)
+    alon -= 360.*(alon > 360.)
+    if np.any(pole):
+        alat = np.where(pole,90.,alat)
+        alon = np.where(pole,360.,alon)
+    return (alat.astype(dtype,copy=False),alon.astype(dtype,copy=False))
+
+def _polar_ll_to_ij(g,alat,alon):
+    rebydx,rxlat,polei,polej = _polar_constants(g)
+    rlat = alat*RADPDG
+    rm = (rebydx*(1.+math.sin(rxlat)))*(np.cos(rlat)/(1.+np.sin(rlat)))
+    rlon = (g['orientlon']+270.-alon)*RADPDG
+    return (polei+rm*np.cos(rlon),polej+rm*np.sin(rlon))
+
+def _mercator_constants(g):
+    dellon = g['meshlength']/(RERTH*math.cos(RADPDG*g['stdlat']))
+    djeo = 0.
+    if g['latll'] != 0.:
+        djeo = math.log(math.tan(0.5*((g['latll']+90.0)*RADPDG)))/dellon
+    return dellon,djeo
+
+def _mercator_ij_to_ll(g,xi,yj):
+    dellon,djeo = _mercator_constants(g)
+    alat = 2.0*np.arctan(np.exp(dellon*(djeo-1.)+dellon*yj))*DEGPRA-90.0
+    alon = (g['lonll']+dellon*DEGPRA)-xi*(dellon*DEGPRA)
+    return (alat,alon)
+
+def _mercator_ll_to_ij(g,alat,alon):
+    dellon,djeo = _mercator_constants(g)
+    xi = 1.-((alon-g['lonll'])/(dellon*DEGPRA))
+    yj = (1.-djeo)+np.log(np.tan((0.5*RADPDG)*(alat+90.)))/dellon
+    return (xi,yj)
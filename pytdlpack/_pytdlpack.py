@@ -309,6 +309,14 @@ except ImportError:
 
 __pdoc__ = {}
 
+from ._latlon_cache import latlon_cache, configure_latlon_cache, clear_latlon_cache
+from ._projections import grid_to_latlon, latlon_to_grid, grid_latlons
+from ._interpolation import StationSampler, GridRemapper
+from ._stations import StationList, station_list_registry
+from ._units import lun_pool, ra_file_cache, configure_ra_files, ra_file_stats
+from ._ra_writer import RandomAccessWriter
+from ._ra_tools import compact_ra_file, sequential_to_ra, ra_to_sequential
+
 _DEFAULT_L3264B = np.int32(32)
 _DEFAULT_MINPK = np.int32(21)
 _DEFAULT_ND5 = np.int32(5242880)
@@ -327,7 +335,10 @@ ND5_META_MAX = np.int32(32)
 ND7 = _DEFAULT_ND7
 NBYPWD = np.int32(L3264B/8)
 
-_starecdict = {} # Dictionary to store station lists.  Key is the Fortran LUN where list came from.
+_STATION_ID = 400001000
+_RA_INDEX_DTYPE = np.dtype([('id1',np.int32),('id2',np.int32),('id3',np.int32),
+                            ('id4',np.int32),('record',np.int32),('nvalue',np.int32)])
+
 _ccall = []
 _ier = np.int32(0)
 _lx = np.int32(0)
@@ -399,6 +410,12 @@ class TdlpackFile(object):
         self.name = ''
         self.position = np.int32(0)
         self.ra_master_key = None
+        self._stations = None # Station list of the last station record read.
+        self._ra_filehandle = None
+        self._ra_index = None # Key index of random-access files opened for reading.
+        self._ra_recl = 0
+        self._ra_lookup = None
+        self._ra_dates = None
         for k, v in kwargs.items():
             setattr(self,k,v)
 
@@ -424,6 +441,12 @@ class TdlpackFile(object):
         """
         return self
 
+    def __contains__(self,id):
+        """
+        True if a record with MOS-2000 ID id is in a random-access file.
+        """
+        return _id_key(id) in self._get_ra_index()[1]
+
     def __next__(self):
         """
         """
@@ -454,8 +477,7 @@ class TdlpackFile(object):
                 kwargs['id'] = deepcopy(ipack[5:9])
                 kwargs['reference_date'] = deepcopy(ipack[4])
                 kwargs['lead_time'] = np.int32(str(ipack[7])[-3:])
-                kwargs['_filelun'] = self.fortran_lun
-                kwargs['_starecindex'] = len(_starecdict[self.fortran_lun])-1 if len(_starecdict[self.fortran_lun]) > 0 else 0
+                kwargs['_stations'] = self._stations
                 return TdlpackRecord(**kwargs)
             else:
                 if not self.data_type: self.data_type = 'station'
@@ -466,6 +488,155 @@ class TdlpackFile(object):
             #raise
             pass #for now
 
+    def _get_ra_index(self):
+        """
+        Return the key index and the ID lookup dictionary of a random-access file.
+        """
+        if self._ra_index is None:
+            if self.format != 'random-access' or self.mode != 'r':
+                raise IOError("Key index is only available for random-access files opened for reading.")
+            if self.fortran_lun == -1:
+                raise IOError("File is not opened.")
+            self._ra_filehandle = builtins.open(self.name,'rb')
+            master,self._ra_index = _read_ra_key_index(self._ra_filehandle,self.byte_order)
+            self._ra_recl = int(master[2])*NBYPWD
+            self._ra_lookup = {}
+            for n,key in enumerate(self._ra_index[['id1','id2','id3','id4']].tolist()):
+                self._ra_lookup.setdefault(key,n)
+        return (self._ra_index,self._ra_lookup)
+
+    def _read_ra_entry(self,n,unpack=True):
+        """
+        Read the record of entry n of the key index directly from the random-access file.
+        """
+        index = self._ra_index
+        if self._stations is None and index['id1'][n] != _STATION_ID:
+            # Link data records to the station list of the file.
+            stations = np.flatnonzero(index['id1'] == _STATION_ID)
+            if stations.size > 0:
+                self._read_ra_entry(stations[0])
+        return self.read_physical_record(int(index['record'][n]),int(index['nvalue'][n]),
+                                         unpack=unpack)
+
+    def read_physical_record(self,record,nvalue,unpack=True):
+        """
+        Read a record from a random-access file by its physical record number.
+
+        Parameters
+        ----------
+
+        **`record : int`**
+
+        Physical record number of the first physical record of the TDLPACK record.
+
+        **`nvalue : int`**
+
+        Length of the TDLPACK record in words.
+
+        **`unpack : bool, optional`**
+
+        Unpack TDLPACK identification sections.  The default is True.
+
+        Returns
+        -------
+
+        **`record : instance`**
+
+        An instance of `pytdlpack.TdlpackStationRecord` or `pytdlpack.TdlpackRecord`.
+        """
+        _ipack = self._read_ra_words(record,nvalue).astype(np.int32)
+        rec = self._determine_record_type(_ipack,np.int32(nvalue*NBYPWD))
+        if type(rec) is TdlpackStationRecord:
+            rec.unpack()
+            self._stations = rec.stations
+        elif unpack:
+            rec.unpack()
+        return rec
+
+    def _read_ra_words(self,record,nvalue):
+        """
+        Return nvalue words starting at physical record number record, as stored in the
+        random-access file.
+        """
+        self._get_ra_index()
+        self._ra_filehandle.seek((record-1)*self._ra_recl)
+        return np.frombuffer(self._ra_filehandle.read(nvalue*NBYPWD),dtype=self.byte_order+'i4')
+
+    def keys(self):
+        """
+        Return the MOS-2000 IDs of the records in a random-access file.
+
+        Returns
+        -------
+
+        **`list`**
+
+        List of tuples of the 4 MOS-2000 ID words of each record, in the order of the
+        key records.
+        """
+        return self._get_ra_index()[0][['id1','id2','id3','id4']].tolist()
+
+    def fetch(self,date=None,id=None,lead=None,unpack=True):
+        """
+        Fetch records from a random-access file by means of date, lead time, id or any
+        combination thereof.  Records are read directly using the key index.
+
+        Parameters
+        ----------
+
+        **`date : int or list of int, optional`**
+
+        Reference date(s) in YYYYMMDDHH.
+
+        **`id : array_like, list or str, optional`**
+
+        MOS-2000 ID (4 words).  An ID word of -1 matches any value.
+
+        **`lead : int or list of int, optional`**
+
+        Lead time(s) in hours.
+
+        **`unpack : bool, optional`**
+
+        Unpack TDLPACK identification sections.  The default is True.
+
+        Returns
+        -------
+
+        **`list`**
+
+        List of matching records.
+        """
+        index = self._get_ra_index()[0]
+        match = np.ones(index.shape,dtype=bool)
+        if date is not None:
+            if type(date) is not list: date = [date]
+            match &= np.isin(self._get_ra_dates(),date)
+        if id is not None:
+            id = _id_key(id)
+            for n in range(4):
+                if id[n] >= 0: match &= index['id%d'%(n+1)] == id[n]
+        if lead is not None:
+            if type(lead) is not list: lead = [lead]
+            match &= np.isin(index['id3']%1000,lead) & (index['id1'] != _STATION_ID)
+        return [self._read_ra_entry(n,unpack=unpack) for n in np.flatnonzero(match)]
+
+    def _get_ra_dates(self):
+        """
+        Return the reference date of each record of the key index.  Dates are not part of
+        the key records, so they are read from the records on first use.  Station records
+        have a date of -1.
+        """
+        if self._ra_dates is None:
+            index = self._ra_index
+            dates = np.full(index.shape,-1,dtype=np.int32)
+            for n in np.flatnonzero(index['id1'] != _STATION_ID):
+                # Reference date is word 5 of the TDLPACK record.
+                self._ra_filehandle.seek((int(index['record'][n])-1)*self._ra_recl+4*NBYPWD)
+                dates[n] = np.frombuffer(self._ra_filehandle.read(NBYPWD),dtype=self.byte_order+'i4')[0]
+            self._ra_dates = dates
+        return self._ra_dates
+
     def backspace(self):
         """
         Position file backwards by one record.
@@ -491,10 +662,16 @@ class TdlpackFile(object):
         elif self.format == 'sequential':
             _ier = tdlpack.closefile(FORTRAN_STDOUT_LUN,self.fortran_lun,np.int32(2))
         if _ier == 0:
-            try:
-                del _starecdict[self.fortran_lun]
-            except(KeyError):
-                pass
+            if self.format == 'random-access':
+                ra_file_cache.discard(self.fortran_lun)
+            lun_pool.release(self.fortran_lun)
+            if self._ra_filehandle is not None:
+                self._ra_filehandle.close()
+            self._ra_filehandle = None
+            self._ra_index = None
+            self._ra_lookup = None
+            self._ra_dates = None
+            self._stations = None
             self.eof = False
             self.fortran_lun = -1
             self.position = 0
@@ -534,6 +711,10 @@ class TdlpackFile(object):
         if self.fortran_lun == -1:
             raise IOError("File is not opened.")
 
+        if self._ra_index is not None and not all and _id_key(id)[0] != 9999:
+            n = self._ra_lookup.get(_id_key(id))
+            return None if n is None else self._read_ra_entry(n,unpack=unpack)
+
         record = None
         records = []
         while True:
@@ -543,6 +724,7 @@ class TdlpackFile(object):
             if self.format == 'random-access':
                 id = np.int32(id)
                 _nvalue = np.int32(0)
+                ra_file_cache.touch(FORTRAN_STDOUT_LUN,self.fortran_lun,self.name,L3264B)
                 _ipack,_nvalue,_ier = tdlpack.rdtdlm(FORTRAN_STDOUT_LUN,self.fortran_lun,self.name,id,ND5,L3264B)
                 if _ier == 0:
                     _ioctet = _nvalue*NBYPWD
@@ -562,10 +744,13 @@ class TdlpackFile(object):
                     self.eof = True
                     break
 
-            if unpack: record.unpack()
-
             if type(record) is TdlpackStationRecord:
-                _starecdict[self.fortran_lun].append(record.stations)
+                # Station records are always unpacked so that the data records that
+                # follow can be linked to the station list.
+                record.unpack()
+                self._stations = record.stations
+            elif unpack:
+                record.unpack()
 
             if all:
                 records.append(record)
@@ -621,6 +806,7 @@ class TdlpackFile(object):
             if self.position == 0: self.data_type = 'station'
             _nwords = record.number_of_stations*2
             if self.format == 'random-access':
+                ra_file_cache.touch(FORTRAN_STDOUT_LUN,self.fortran_lun,self.name,L3264B,irw=2)
                 _ier = tdlpack.wrtdlm(FORTRAN_STDOUT_LUN,self.fortran_lun,self.name,
                                        record.id,record.ipack[0:_nwords],_nreplace,
                                        _ncheck,L3264B)
@@ -631,6 +817,7 @@ class TdlpackFile(object):
             if self.position == 0: self.data_type = 'grid'
             _nwords = np.int32(record.ioctet/NBYPWD)
             if self.format == 'random-access':
+                ra_file_cache.touch(FORTRAN_STDOUT_LUN,self.fortran_lun,self.name,L3264B,irw=2)
                 record.ipack[0] = record.ipack[0].byteswap()
                 _ier = tdlpack.wrtdlm(FORTRAN_STDOUT_LUN,self.fortran_lun,self.name,
                                        record.id,record.ipack[0:_nwords],_nreplace,
@@ -884,7 +1071,7 @@ class TdlpackRecord(object):
                 indices = tuple(indices)
         elif self.type == 'station':
             if isinstance(indices,str):
-                indices = tuple([_starecdict[self._filelun][self._starecindex].index(indices)])
+                indices = tuple([self._station_list().index(indices)])
 
         try:
             return self.data[indices]
@@ -899,10 +1086,58 @@ class TdlpackRecord(object):
                 indices = tuple(indices)
         elif self.type == 'station':
             if isinstance(indices,str):
-                indices = tuple([_starecdict[self._filelun][self._starecindex].index(indices)])
+                indices = tuple([self._station_list().index(indices)])
 
         self.data[indices] = values
 
+    def get_stations(self,stations,missing_value=None):
+        """
+        Returns data values for a list of stations with a single vectorized lookup.
+
+        Parameters
+        ----------
+
+        **`stations : list of str or array_like`**
+
+        Station call letters.
+
+        **`missing_value : float, optional`**
+
+        Value returned for stations that are not in the station list of the record.
+        If None (default), KeyError is raised for such stations.
+
+        Returns
+        -------
+
+        **`array_like`**
+
+        Numpy.float32 array of data values in the order of `stations`.
+        """
+        if self.type != 'station':
+            raise TypeError("get_stations() requires a station record")
+        if not self._data_unpacked:
+            self.unpack(data=True)
+        pos = self._station_list().positions(stations)
+        notfound = pos < 0
+        if np.any(notfound):
+            if missing_value is None:
+                missing = [s for s,nf in zip(stations,notfound) if nf]
+                raise KeyError("Stations not found: "+', '.join(str(s) for s in missing[:10])+
+                               (', ...' if len(missing) > 10 else ''))
+            values = self.data[np.where(notfound,0,pos)]
+            values[notfound] = missing_value
+            return values
+        return self.data[pos]
+
+    def _station_list(self):
+        """
+        Returns the StationList linked to this station record.
+        """
+        stations = getattr(self,'_stations',None)
+        if stations is None:
+            raise ValueError("No station list is linked to this record")
+        return stations
+
     def __repr__(self):
         strings = []
         keys = self.__dict__.keys()
@@ -1080,17 +1315,13 @@ class TdlpackRecord(object):
         **`lats,lons : array_like`**
 
         Numpy.float32 arrays of grid latitudes and longitudes.  If `self.grid = 'station'`, then None are returned.
+        The arrays are shared by all records on the same grid (see `pytdlpack.configure_latlon_cache`)
+        and are read-only.
         """
         lats = None
         lons = None
         if self.type == 'grid':
-            _ier = np.int32(0)
-            lats = np.zeros((self.nx,self.ny),dtype=np.float32,order='F')
-            lons = np.zeros((self.nx,self.ny),dtype=np.float32,order='F')
-            lats,lons,_ier = tdlpack.gridij_to_latlon(FORTRAN_STDOUT_LUN,self.nx,self.ny,
-                             self.map_proj,self.grid_length,self.origin_longitude,
-                             self.standard_latitude,self.lower_left_latitude,
-                             self.lower_left_longitude)
+            lats,lons = latlon_cache.get(self.grid_def,_compute_latlons)
         return (lats,lons)
 
 class TdlpackStationRecord(object):
@@ -1100,9 +1331,10 @@ class TdlpackStationRecord(object):
     Attributes
     ----------
 
-    **`station : list`**
+    **`stations : StationList`**
 
-    A list of station call letters.
+    Station call letters.  This is a sequence of str, backed by a NumPy `S8` array
+    (`stations.calls`).
 
     **`id : array_like`**
 
@@ -1128,22 +1360,17 @@ class TdlpackStationRecord(object):
         Parameters
         ----------
 
-        **`stations : str or list or tuple`**
+        **`stations : str or list or tuple or array_like`**
 
-        String of a single station or a list or tuple of stations.
+        String of a single station or a list, tuple or `S8` array of stations.
         """
         type(self).counter += 1
 
         if stations is not None:
-            if type(stations) is str:
-                self.stations = [stations]
-            elif type(stations) is list:
-                self.stations = stations
-            elif type(stations) is tuple:
-                self.stations = list(stations)
-            else:
-                pass # TODO: raise error... TypeError
-            self.number_of_stations = np.int32(len(stations))
+            if type(stations) not in (str,list,tuple,np.ndarray,StationList):
+                raise TypeError("stations must be a str, list, tuple, array or StationList")
+            self.stations = station_list_registry.intern(StationList(stations))
+            self.number_of_stations = np.int32(len(self.stations))
             self.id = np.int32([400001000,0,0,0])
             self.ioctet = np.int32(0)
             self.ipack = np.array((),dtype=np.int32)
@@ -1151,11 +1378,6 @@ class TdlpackStationRecord(object):
             for k,v in kwargs.items():
                 setattr(self,k,v)
 
-        #self.number_of_stations = np.int32(len(stations))
-        #self.id = np.int32([400001000,0,0,0])
-        #self.ioctet = np.int32(0)
-        #self.ipack = np.array((),dtype=np.int32)
-
     def __repr__(self):
         strings = []
         keys = self.__dict__.keys()
@@ -1168,29 +1390,15 @@ class TdlpackStationRecord(object):
         """
         Pack a Station Call Letter Record.
         """
-        #pdb.set_trace()
         self.ioctet = np.int32(self.number_of_stations*NCHAR)
-        self.ipack = np.ndarray(int(self.ioctet/(L3264B/NCHAR)),dtype=np.int32)
-        for n,s in enumerate(self.stations):
-            sta = s.ljust(int(NCHAR),' ')
-            self.ipack[n*2] = np.copy(np.fromstring(sta[0:int(NCHAR/2)],dtype=np.int32).byteswap())
-            self.ipack[(n*2)+1] = np.copy(np.fromstring(sta[int(NCHAR/2):int(NCHAR)],dtype=np.int32).byteswap())
+        self.ipack = self.stations.pack()
 
     def unpack(self):
         """
         Unpack a Station Call Letter Record.
         """
-        _stations = []
-        _unpack_string_fmt = '>'+str(NCHAR)+'s'
-        nrange = range(0,int(self.ioctet/(NCHAR/2)),2)
-        if _IS_PYTHON3:
-            nrange = list(range(0,int(self.ioctet/(NCHAR/2)),2))
-        for n in nrange:
-            tmp = struct.unpack(_unpack_string_fmt,self.ipack[n:n+2].byteswap())[0]
-            if _IS_PYTHON3:
-                tmp = tmp.decode()
-            _stations.append(tmp.strip(' '))
-        self.stations = list(deepcopy(_stations))
+        self.stations = station_list_registry.intern(StationList.frombuffer(self.ipack,
+                        int(self.ioctet/NCHAR)))
 
 class TdlpackTrailerRecord(object):
     """
@@ -1253,7 +1461,7 @@ def open(name, mode='r', format=None, ra_template=None):
     """
     _byteorder = np.int32(0)
     _filetype = np.int32(0)
-    _lun = np.int32(0)
+    _lun = np.int32(lun_pool.acquire()) # 0 means openfile assigns a new unit number.
     _ier = np.int32(0)
     name = os.path.abspath(name)
 
@@ -1269,16 +1477,17 @@ def open(name, mode='r', format=None, ra_template=None):
                 _maxent = np.int32(840)
                 _nbytes = np.int32(20000)
             _filetype = np.int32(1)
-            _lun,_byteorder,_filetype,_ier = tdlpack.openfile(FORTRAN_STDOUT_LUN,name,mode,L3264B,_byteorder,_filetype,
+            _lun,_byteorder,_filetype,_ier = tdlpack.openfile(FORTRAN_STDOUT_LUN,name,mode,L3264B,_lun,_byteorder,_filetype,
                                              ra_maxent=_maxent,ra_nbytes=_nbytes)
         elif format == 'sequential':
             _filetype = np.int32(2)
-            _lun,_byteorder,_filetype,_ier = tdlpack.openfile(FORTRAN_STDOUT_LUN,name,mode,L3264B,_byteorder,_filetype)
+            _lun,_byteorder,_filetype,_ier = tdlpack.openfile(FORTRAN_STDOUT_LUN,name,mode,L3264B,_lun,_byteorder,_filetype)
 
     elif mode == 'r' or mode == 'a':
         if os.path.isfile(name):
-            _lun,_byteorder,_filetype,_ier = tdlpack.openfile(FORTRAN_STDOUT_LUN,name,mode,L3264B,_byteorder,_filetype)
+            _lun,_byteorder,_filetype,_ier = tdlpack.openfile(FORTRAN_STDOUT_LUN,name,mode,L3264B,_lun,_byteorder,_filetype)
         else:
+            lun_pool.release(_lun)
             raise IOError("File not found.")
 
     if _ier == 0:
@@ -1298,11 +1507,13 @@ def open(name, mode='r', format=None, ra_template=None):
         kwargs['position'] = np.int32(0)
         if mode == 'r' or mode == 'a': kwargs['size'] = os.path.getsize(name)
     else:
+        lun_pool.release(_lun)
         raise IOError("Could not open TDLPACK file"+name+". Error return from tdlpack.openfile = "+str(_ier))
 
-    _starecdict[_lun] = []
-
-    return TdlpackFile(**kwargs)
+    f = TdlpackFile(**kwargs)
+    if f.format == 'random-access' and mode == 'r':
+        f._get_ra_index()
+    return f
 
 def create_grid_definition(name=None,proj=None,nx=None,ny=None,latll=None,lonll=None,
                            orientlon=None,stdlat=None,meshlength=None):
@@ -1435,6 +1646,82 @@ def _create_proj_string(griddict):
         projstring = None
     return projstring
 
+def _compute_latlons(griddict):
+    """
+    Compute latitudes and longitudes of all grid points for a grid definition.
+
+    Parameters
+    ----------
+
+    **`griddict : dict`**
+
+    Dictionary of TDLPACK grid definition parameters
+
+    Returns
+    -------
+
+    **`lats,lons : array_like`**
+
+    Numpy.float32 arrays of shape (nx,ny) of grid latitudes and longitudes.
+    """
+    return grid_latlons(griddict)
+
+def _id_key(id):
+    """
+    Return a MOS-2000 ID given as a list, array or str of 4 words as a tuple of int.
+    """
+    if isinstance(id,str):
+        id = list(filter(None,id.split(' ')))
+    return tuple(int(i) for i in id)
+
+def _read_ra_key_index(f,byte_order):
+    """
+    Reads all key records of a TDLPACK random-access file.
+
+    Parameters
+    ----------
+
+    **`f : file object`**
+
+    Random-access file opened for reading in binary mode.
+
+    **`byte_order : str`**
+
+    Byte order of the file ('<' or '>').
+
+    Returns
+    -------
+
+    **`master,index : array`**
+
+    `master` is the master key record.  `index` is a NumPy structured array with fields id1, id2, id3, id4 (MOS-2000 ID), record
+    (physical record number of the first physical record) and nvalue (length in words)
+    for each record in the file.  Entries of deleted records are not included.
+    """
+    dtype = byte_order+'i4'
+    f.seek(0)
+    master = np.frombuffer(f.read(6*NBYPWD),dtype=dtype)
+    recl = int(master[2])*NBYPWD
+    maxent = int(master[4])
+    keys = []
+    jrec = 2 # The first key record follows the master key record.
+    for _ in range(int(master[3])):
+        f.seek((jrec-1)*recl)
+        # Key records start with the number of entries, the number of physical records
+        # of the key record and the record number of the next key record.
+        keyrec = np.frombuffer(f.read((3+maxent*6)*NBYPWD),dtype=dtype)
+        keys.append(keyrec[3:3+keyrec[0]*6].reshape(-1,6))
+        jrec = int(keyrec[2])
+        if jrec in (9999,99999999): break
+    keys = np.concatenate(keys) if keys else np.zeros((0,6),dtype=dtype)
+    keys = keys[np.any(keys[:,0:4] != 0,axis=1)]
+    index = np.zeros(keys.shape[0],dtype=_RA_INDEX_DTYPE)
+    for n in range(4):
+        index['id%d'%(n+1)] = keys[:,n]
+    index['nvalue'] = keys[:,4]
+    index['record'] = keys[:,5]//1000
+    return (master,index)
+
 def _read_ra_master_key(file):
     """
     Reads the master key record of TDLPACK Random-Access files.
@@ -0,0 +1,362 @@
+"""
+Maintenance and conversion tools for TDLPACK random-access files.
+
+Records are copied as packed words; they are never unpacked or repacked.  The only
+difference between a packed data record in a sequential file and in a random-access file
+is the first word ('TDLP'), which is stored byte swapped in random-access files (see
+`pytdlpack.TdlpackFile.write`).
+"""
+import os
+import shutil
+import struct
+import tempfile
+import time
+
+import numpy as np
+
+import tdlpack
+
+from ._ra_writer import RandomAccessWriter, choose_layout
+from ._units import ra_file_cache
+
+ONE_MB = 1048576
+_STATION_ID = (400001000,0,0,0)
+_TDLP = b'TDLP'
+
+# Packed trailer record of sequential files (see MOS-2000 subroutine TRAIL): 6 words with
+# 9999 in the fifth.  _TRAILER_RECORD is the Fortran record with its header, 4-byte "trash"
+# word, ioctet and trailer.  Both are also used by TdlpackIO.
+_TRAILER = np.array([0,0,0,0,9999,0],dtype='>i4')
+_TRAILER_RECORD = (struct.pack('>3i',_TRAILER.nbytes+8,0,_TRAILER.nbytes)+_TRAILER.tobytes()+
+                   struct.pack('>i',_TRAILER.nbytes+8))
+
+def compact_ra_file(name,output=None,verify=True,nlookups=100):
+    """
+    Compact a random-access file.
+
+    Records that have been deleted or replaced leave unused space in a random-access
+    file, and files written a record at a time have many small key records.  The live
+    records are copied, without unpacking, into a new file with the same physical record
+    size, a contiguous layout and key records sized for the number of records (see
+    `pytdlpack.RandomAccessWriter`).
+
+    Parameters
+    ----------
+
+    **`name : str`**
+
+    Random-access file name.  The file must not be open for writing.
+
+    **`output : str, optional`**
+
+    Name of the compacted file.  If not given, the compacted file replaces `name`.  The
+    replacement is atomic: the compacted file is written and verified in the same
+    directory and then renamed to `name`.
+
+    **`verify : bool, optional`**
+
+    Verify that the compacted file contains the same records as the original.  The
+    default is True.
+
+    **`nlookups : int, optional`**
+
+    Number of records looked up by ID with the MOS-2000 random-access routines in each
+    file to measure the lookup time.  0 disables the measurement.  The default is 100.
+
+    Returns
+    -------
+
+    **`dict`**
+
+    Report with the number of records, the file sizes before and after and the space
+    reclaimed in bytes, the number of key records before and after and, unless
+    `nlookups` is 0, the mean time in seconds of a lookup by ID before and after.
+    """
+    from ._pytdlpack import open as _open
+    name = os.path.abspath(name)
+    if output is None:
+        fd,dest = tempfile.mkstemp(dir=os.path.dirname(name),
+                                   prefix='.'+os.path.basename(name)+'.',suffix='.tmp')
+        os.close(fd)
+    else:
+        dest = os.path.abspath(output)
+    try:
+        with _open(name) as src:
+            index = src._get_ra_index()[0]
+            master_before = src.ra_master_key
+            nvalue = index['nvalue']
+            with RandomAccessWriter(dest,index.shape[0],nbytes=src._ra_recl) as dst:
+                for n in range(index.shape[0]):
+                    words = src._read_ra_words(int(index['record'][n]),int(nvalue[n]))
+                    dst._write_words(index[['id1','id2','id3','id4']][n].tolist(),words)
+            if verify:
+                _verify(src,dest)
+        report = {'records':int(index.shape[0]),
+                  'size_before':os.path.getsize(name),
+                  'size_after':os.path.getsize(dest),
+                  'key_records_before':int(master_before[3]),
+                  'key_records_after':int(np.fromfile(dest,dtype='>i4',count=6)[3])}
+        report['reclaimed'] = report['size_before']-report['size_after']
+        if nlookups > 0 and index.shape[0] > 0:
+            sample = np.unique(np.linspace(0,index.shape[0]-1,min(nlookups,index.shape[0])).astype(int))
+            ids = [np.int32(index[['id1','id2','id3','id4']][n].tolist()) for n in sample]
+            nsize = int(nvalue[sample].max())
+            report['lookup_time_before'] = _lookup_time(name,ids,nsize)
+            report['lookup_time_after'] = _lookup_time(dest,ids,nsize)
+        if output is None:
+            shutil.copymode(name,dest)
+            os.replace(dest,name)
+    except BaseException:
+        if os.path.exists(dest): os.remove(dest)
+        raise
+    return report
+
+def _verify(src,dest):
+    """
+    Raise IOError if random-access file dest does not contain the same records as the
+    open random-access file src.
+    """
+    from ._pytdlpack import open as _open
+    index = src._get_ra_index()[0]
+    with _open(dest) as f:
+        new = f._get_ra_index()[0]
+        fields = ['id1','id2','id3','id4','nvalue']
+        if not np.array_equal(index[fields],new[fields]):
+            raise IOError("Verification of "+dest+" failed: keys differ.")
+        for n in range(index.shape[0]):
+            nvalue = int(index['nvalue'][n])
+            if not np.array_equal(src._read_ra_words(int(index['record'][n]),nvalue),
+                                  f._read_ra_words(int(new['record'][n]),nvalue)):
+                raise IOError("Verification of "+dest+" failed: record "+str(n+1)+" differs.")
+
+def _lookup_time(name,ids,nsize):
+    """
+    Return the mean time of reading the records with the given IDs from random-access
+    file name with the MOS-2000 random-access routines.
+    """
+    from ._pytdlpack import open as _open, FORTRAN_STDOUT_LUN, L3264B
+    with _open(name) as f:
+        # The first read opens the file and reads the master key record.
+        ra_file_cache.touch(FORTRAN_STDOUT_LUN,f.fortran_lun,f.name,L3264B)
+        tdlpack.rdtdlm(FORTRAN_STDOUT_LUN,f.fortran_lun,f.name,ids[0],nsize,L3264B)
+        t0 = time.time()
+        for id in ids:
+            ra_file_cache.touch(FORTRAN_STDOUT_LUN,f.fortran_lun,f.name,L3264B)
+            tdlpack.rdtdlm(FORTRAN_STDOUT_LUN,f.fortran_lun,f.name,id,nsize,L3264B)
+        return (time.time()-t0)/len(ids)
+
+def sequential_to_ra(src,dest,nbytes=None,mode='w',duplicates='raise'):
+    """
+    Convert a TDLPACK sequential file to a random-access file without unpacking records.
+
+    The sequential file is read twice as a stream: once to read the record headers (IDs
+    and sizes) and once to copy the records.  Memory use is bounded by the size of one
+    record.
+
+    Parameters
+    ----------
+
+    **`src : str`**
+
+    Sequential file name.
+
+    **`dest : str`**
+
+    Random-access file name.
+
+    **`nbytes : int, optional`**
+
+    Size of a physical record of the random-access file.  By default it is chosen from
+    the sizes of the records (see `pytdlpack.RandomAccessWriter`).
+
+    **`mode : {'w', 'x'}, optional`**
+
+    `'w'` overwrites an existing file; `'x'` raises an error if the file exists.
+
+    **`duplicates : {'raise', 'skip'}, optional`**
+
+    Random-access files are looked up by MOS-2000 ID, so only the first of several
+    records with the same ID (e.g. the same variable for another date, or another
+    station call letter record) can be read back.  With `'raise'` (the default) a
+    ValueError is raised before `dest` is created.  With `'skip'` only the first record
+    with a given ID is copied.
+
+    Returns
+    -------
+
+    **`dict`**
+
+    Number of records copied and number of records skipped.  Trailer records are not
+    copied.
+    """
+    if duplicates not in ('raise','skip'):
+        raise ValueError("duplicates must be 'raise' or 'skip'")
+    byte_order = _sequential_byte_order(src)
+    seen = set()
+    sizes = []
+    skipped = 0
+    for kind,id,nwords in _scan_sequential(src,byte_order):
+        if kind == 'trailer':
+            continue
+        if id in seen:
+            if duplicates == 'raise':
+                raise ValueError("Duplicate record ID in "+src+": "+str(id))
+            skipped += 1
+            continue
+        seen.add(id)
+        sizes.append(nwords*4)
+    if nbytes is None:
+        nbytes = choose_layout(len(sizes),sizes if sizes else 0)[0]
+    copied = 0
+    with RandomAccessWriter(dest,len(sizes),nbytes=nbytes,mode=mode) as w:
+        for kind,id,words in _read_sequential(src,byte_order):
+            if kind == 'trailer' or id in w._ids:
+                continue
+            if kind == 'data':
+                words = words.copy()
+                words[0] = words[0].byteswap()
+            w._write_words(id,words)
+            copied += 1
+    return {'records':copied,'skipped':skipped}
+
+def ra_to_sequential(src,dest,trailer=True,mode='w'):
+    """
+    Convert a TDLPACK random-access file to a sequential file without unpacking records.
+
+    Records are written in the order of the key records.  Memory use is bounded by the
+    size of one record.
+
+    Parameters
+    ----------
+
+    **`src : str`**
+
+    Random-access file name.
+
+    **`dest : str`**
+
+    Sequential file name.
+
+    **`trailer : bool, optional`**
+
+    Write a trailer record at the end of the file.  The default is True.
+
+    **`mode : {'w', 'x'}, optional`**
+
+    `'w'` overwrites an existing file; `'x'` raises an error if the file exists.
+
+    Returns
+    -------
+
+    **`dict`**
+
+    Number of records copied.
+    """
+    from ._pytdlpack import open as _open
+    if mode not in ('w','x'):
+        raise ValueError("mode must be 'w' or 'x'")
+    copied = 0
+    with _open(src) as f, open(dest,mode+'b',buffering=ONE_MB) as out:
+        index = f._get_ra_index()[0]
+        ids = index[['id1','id2','id3','id4']].tolist()
+        for n in range(index.shape[0]):
+            words = f._read_ra_words(int(index['record'][n]),int(index['nvalue'][n]))
+            words = words.astype('>i4')
+            if ids[n] != _STATION_ID and words[0:1].byteswap().tobytes() == _TDLP:
+                # The first word is byte swapped by TdlpackFile.write, but not in every
+                # random-access file.
+                words[0] = words[0].byteswap()
+            _write_sequential_record(out,words)
+            copied += 1
+        if trailer:
+            out.write(_TRAILER_RECORD)
+    return {'records':copied}
+
+def _sequential_byte_order(name):
+    """
+    Return the byte order of the Fortran record markers of a sequential file.
+    """
+    with open(name,'rb') as f:
+        head = f.read(4)
+    if len(head) < 4:
+        return '>'
+    marker = struct.unpack('>i',head)[0]
+    return '>' if 0 < marker <= os.path.getsize(name) else '<'
+
+def _scan_sequential(name,byte_order):
+    """
+    Iterate over the records of a sequential file, reading only the record headers.
+    Yields the record type ('data', 'station' or 'trailer'), the MOS-2000 ID and the
+    number of words of the packed record.
+    """
+    size = os.path.getsize(name)
+    with open(name,'rb',buffering=0) as f:
+        pos = 0
+        while pos+4 <= size:
+            f.seek(pos)
+            head = f.read(48)
+            if len(head) < 12:
+                break
+            marker,ntrash,nbytes = struct.unpack(byte_order+'3i',head[0:12])
+            words = np.frombuffer(head,dtype=byte_order+'i4',offset=12,
+                                  count=min(nbytes,len(head)-12)//4)
+            kind = _record_type(words,nbytes)
+            yield (kind,_record_id(kind,words),nbytes//4)
+            pos += marker+8
+
+def _read_sequential(name,byte_order):
+    """
+    Iterate over the records of a sequential file.  Yields the record type, the MOS-2000
+    ID and the packed words as a big-endian array.
+    """
+    dtype = byte_order+'i4'
+    with open(name,'rb',buffering=ONE_MB) as f:
+        while True:
+            head = f.read(4)
+            if len(head) < 4:
+                break
+            marker = struct.unpack(byte_order+'i',head)[0]
+            body = f.read(marker+4)
+            nbytes = struct.unpack(byte_order+'i',body[4:8])[0]
+            words = np.frombuffer(body,dtype=dtype,count=nbytes//4,offset=8).astype('>i4')
+            kind = _record_type(words,nbytes)
+            yield (kind,_record_id(kind,words),words)
+
+def _record_type(words,nbytes):
+    """
+    Return the type of a packed record of a sequential file given its first words, as
+    determined by TdlpackIO.
+    """
+    if _is_trailer(words,nbytes):
+        return 'trailer'
+    if words[0:1].astype('>i4').tobytes() == _TDLP:
+        return 'data'
+    return 'station'
+
+def _is_trailer(words,nbytes):
+    """
+    Return True if a packed record of nbytes bytes starting with words is a trailer record.
+    """
+    return nbytes == _TRAILER.nbytes and words[4] == _TRAILER[4]
+
+def _record_id(kind,words):
+    """
+    Return the MOS-2000 ID of a packed record given its type and first words.
+    """
+    if kind == 'data':
+        return tuple(int(i) for i in words[5:9])
+    if kind == 'station':
+        return _STATION_ID
+    return None
+
+def _write_sequential_record(out,words):
+    """
+    Write big-endian packed words as a Fortran unformatted record in the format of
+    MOS-2000 subroutine WRITEP.
+    """
+    nbytes = words.shape[0]*4
+    marker = struct.pack('>i',nbytes+8)
+    out.write(marker)
+    out.write(struct.pack('>2i',0,nbytes))
+    out.write(words.tobytes())
+    out.write(marker)
@@ -0,0 +1,273 @@
+"""
+Bulk writer for TDLPACK random-access files.
+
+`RandomAccessWriter` writes a new MOS-2000 random-access file directly, without going
+through the MOS-2000 random-access routines.  The key records for the expected number
+of records are reserved at the beginning of the file, data records are written
+contiguously after them and the key records and master key record are written once when
+the file is closed.  The size of the physical records and the number of entries per key
+record are chosen from the expected number and sizes of the records.
+
+The file layout is the same as that written by MOS-2000 (WRTDLM), so the file can be
+read by any MOS-2000 reader and more records can be appended with
+`pytdlpack.TdlpackFile.write`.
+"""
+import numpy as np
+
+# Maximum number of entries in a key record (parameter NW of the MOS-2000 random-access
+# routines).
+MAXENT_MAX = 840
+
+# Range of physical record sizes in bytes.  The upper limit keeps the number of entries
+# that fit in the first physical record of a key record below MAXENT_MAX.
+NBYTES_MIN = 2000
+NBYTES_MAX = 20000
+
+NBYPWD = 4
+_LAST_KEY_RECORD = 99999999
+
+def choose_layout(nrecords,record_size):
+    """
+    Choose the physical record size and the number of entries per key record of a
+    random-access file.
+
+    Parameters
+    ----------
+
+    **`nrecords : int`**
+
+    Expected number of records.
+
+    **`record_size : int or array_like`**
+
+    Expected size in bytes of the records, either a single typical size or the size of
+    each record.
+
+    Returns
+    -------
+
+    **`nbytes,maxent : int`**
+
+    Size of a physical record in bytes and the maximum number of entries in a key record.
+    The physical record size is the largest one that gives a file within 1% of the
+    smallest possible size.
+    """
+    nrecords = max(int(nrecords),0)
+    sizes,counts = np.unique(np.atleast_1d(np.asarray(record_size,dtype=np.int64)),
+                             return_counts=True)
+    if sizes.size == 1 and counts[0] == 1:
+        counts = counts*max(nrecords,1)
+    else:
+        counts = counts*(max(nrecords,1)/counts.sum())
+    # Candidates are a regular range of sizes plus whole fractions of the record sizes,
+    # for which the records exactly fill their physical records.
+    candidates = np.arange(NBYTES_MIN,NBYTES_MAX+1,200)
+    exact = ((-(-sizes[:,np.newaxis]//np.arange(1,17))+7)//8*8).ravel()
+    candidates = np.union1d(candidates,exact[(exact >= NBYTES_MIN) & (exact <= NBYTES_MAX)])
+    ksize = candidates//NBYPWD
+    nwords = -(-sizes//NBYPWD)
+    nphys = -(-nwords[np.newaxis,:]//ksize[:,np.newaxis])
+    data = (counts*nphys).sum(axis=1)*ksize
+    maxent = np.array([_maxent(nrecords,k) for k in ksize])
+    nkeyrec = np.maximum(-(-nrecords//maxent),1)
+    keys = nkeyrec*_key_physical_records(maxent,ksize)*ksize
+    total = data+keys
+    # Of the sizes within 1% of the smallest file, the largest (fewest reads per record)
+    # is chosen.
+    best = np.flatnonzero(total <= total.min()*1.01)[-1]
+    return (int(candidates[best]),int(maxent[best]))
+
+def _key_physical_records(maxent,ksize):
+    # Key records hold 3 words followed by 6 words per entry.
+    return -(-(maxent*6+3)//ksize)
+
+def _maxent(nrecords,ksize):
+    """
+    Return the number of key entries for the expected number of records, using all of
+    the physical records of the key record.
+    """
+    nent = min(max(nrecords,1),MAXENT_MAX)
+    nphys = _key_physical_records(nent,ksize)
+    return min((nphys*ksize-3)//6,MAXENT_MAX)
+
+class RandomAccessWriter(object):
+    """
+    Bulk writer for new TDLPACK random-access files.
+
+    Attributes
+    ----------
+
+    **`name : str`**
+
+    File name.
+
+    **`nbytes : int`**
+
+    Size of a physical record in bytes.
+
+    **`maxent : int`**
+
+    Maximum number of entries in a key record.
+
+    **`records : int`**
+
+    Number of records written.
+    """
+    def __init__(self,name,nrecords,record_size=None,nbytes=None,maxent=None,mode='w'):
+        """
+        Constructor
+
+        Parameters
+        ----------
+
+        **`name : str`**
+
+        File name.
+
+        **`nrecords : int`**
+
+        Expected number of records.  Key records for this number of records are reserved
+        at the beginning of the file.  More records can be written, at the cost of
+        additional key records placed after the data.
+
+        **`record_size : int or array_like, optional`**
+
+        Expected size in bytes of the packed records (`ioctet`), either a single typical
+        size or the size of each record.  Used to choose `nbytes` when it is not given.
+
+        **`nbytes : int, optional`**
+
+        Size of a physical record in bytes.  Rounded up to a multiple of 8.
+
+        **`maxent : int, optional`**
+
+        Maximum number of entries in a key record.
+
+        **`mode : {'w', 'x'}, optional`**
+
+        `'w'` overwrites an existing file; `'x'` raises an error if the file exists.
+        """
+        if mode not in ('w','x'):
+            raise ValueError("mode must be 'w' or 'x'")
+        if nbytes is None:
+            if record_size is None:
+                raise ValueError("Either record_size or nbytes must be given.")
+            nbytes,nent = choose_layout(nrecords,record_size)
+        else:
+            nbytes = ((int(nbytes)+7)//8)*8
+            nent = _maxent(max(int(nrecords),0),nbytes//NBYPWD)
+        if maxent is not None:
+            nent = min(int(maxent),MAXENT_MAX)
+        self.name = name
+        self.nbytes = nbytes
+        self.maxent = max(nent,1)
+        self.records = 0
+        self._ksize = nbytes//NBYPWD
+        self._keyphys = int(_key_physical_records(self.maxent,self._ksize))
+        nkeyrec = max(-(-int(nrecords)//self.maxent),1)
+        # Physical record numbers of the reserved key records.  Record 1 is the master
+        # key record.
+        self._reserved = [2+n*self._keyphys for n in range(nkeyrec)]
+        self._keyrecs = []
+        self._keys = []
+        self._ids = set()
+        self._next = 2+nkeyrec*self._keyphys
+        self._filehandle = open(name,mode+'b')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,atype,value,traceback):
+        self.close()
+
+    def __repr__(self):
+        strings = []
+        for k,v in self.__dict__.items():
+            if not k.startswith('_'):
+                strings.append('%s = %s\n'%(k,v))
+        return ''.join(strings)
+
+    def write(self,record):
+        """
+        Write a packed TDLPACK record.
+
+        Parameters
+        ----------
+
+        **`record : instance`**
+
+        An instance of `pytdlpack.TdlpackStationRecord` or `pytdlpack.TdlpackRecord`
+        that contains packed data.  Trailer records are not used in random-access files
+        and are ignored.
+        """
+        from ._pytdlpack import TdlpackRecord, TdlpackStationRecord
+        if type(record) is TdlpackStationRecord:
+            words = np.asarray(record.ipack[0:record.number_of_stations*2],dtype='>i4')
+        elif type(record) is TdlpackRecord:
+            words = np.asarray(record.ipack[0:int(record.ioctet//NBYPWD)],dtype='>i4').copy()
+            # The first word is stored byte swapped, as written by TdlpackFile.write.
+            words[0] = words[0].byteswap()
+        else:
+            return
+        self._write_words(record.id,words)
+
+    def _write_words(self,id,words):
+        """
+        Write a record given its MOS-2000 ID and its words as stored in the file.
+        """
+        if self._filehandle is None:
+            raise IOError("File is not opened.")
+        key = tuple(int(i) for i in id)
+        if key in self._ids:
+            raise ValueError("Duplicate record ID: "+str(key))
+        if not self._keys or len(self._keys[-1]) == self.maxent:
+            self._new_key_record()
+        nwords = words.shape[0]
+        nphys = -(-nwords//self._ksize)
+        self._filehandle.seek((self._next-1)*self.nbytes)
+        self._filehandle.write(np.asarray(words,dtype='>i4').tobytes())
+        pad = nphys*self._ksize-nwords
+        if pad > 0:
+            self._filehandle.write(bytes(pad*NBYPWD))
+        self._keys[-1].append(key+(nwords,self._next*1000+nphys))
+        self._ids.add(key)
+        self._next += nphys
+        self.records += 1
+
+    def _new_key_record(self):
+        if self._reserved:
+            self._keyrecs.append(self._reserved.pop(0))
+        else:
+            # More records than expected.  The key record is placed after the data so that
+            # the file can still be appended to by MOS-2000.
+            self._keyrecs.append(self._next)
+            self._next += self._keyphys
+        self._keys.append([])
+
+    def close(self):
+        """
+        Write the key records and master key record and close the file.
+        """
+        if self._filehandle is None:
+            return
+        if not self._keys:
+            self._new_key_record()
+        # Unused reserved key records are dropped from the chain.  They are only left
+        # when fewer records than expected were written.
+        nkeyrec = len(self._keys)
+        for n in range(nkeyrec):
+            nextrec = self._keyrecs[n+1] if n+1 < nkeyrec else _LAST_KEY_RECORD
+            keyrec = np.zeros(self._keyphys*self._ksize,dtype='>i4')
+            keyrec[0:3] = [len(self._keys[n]),self._keyphys,nextrec]
+            if self._keys[n]:
+                keyrec[3:3+len(self._keys[n])*6] = np.array(self._keys[n],dtype=np.int64).ravel()
+            self._filehandle.seek((self._keyrecs[n]-1)*self.nbytes)
+            self._filehandle.write(keyrec.tobytes())
+        master = np.zeros(self._ksize,dtype='>i4')
+        master[0:6] = [0,4,self._ksize,nkeyrec,self.maxent,self._keyrecs[-1]]
+        self._filehandle.seek(0)
+        self._filehandle.write(master.tobytes())
+        # Make sure the file ends on a physical record boundary.
+        self._filehandle.truncate((self._next-1)*self.nbytes)
+        self._filehandle.close()
+        self._filehandle = None
@@ -0,0 +1,300 @@
+"""
+Compact storage of station call letters.
+
+Station call letters are stored in a fixed-width NumPy `S8` array instead of a list of
+Python strings.  Packing to and unpacking from a TDLPACK station call letter record is
+done on the whole array through an `S8` view of the big-endian record buffer.
+"""
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
+import hashlib
+import threading
+import weakref
+
+import numpy as np
+
+NCHAR = 8
+_BLANK = ord(' ')
+
+class StationList(Sequence):
+    """
+    Immutable sequence of station call letters.
+
+    The station call letters are held in a NumPy `S8` array.  Indexing with an integer
+    returns a str and the full list of str is created only when needed (e.g. `tolist()`,
+    iteration or comparison with a list) and then kept.
+
+    Station lookups by name (`index`, `positions`) use a hash index and a sorted view of
+    the call letters that are built on first use and shared by every record linked to
+    this station list.
+
+    Attributes
+    ----------
+
+    **`calls : array_like`**
+
+    Read-only NumPy array of dtype `S8` of station call letters.
+    """
+    __slots__ = ('calls','_list','_index','_order','_sorted','_digest','__weakref__')
+    def __init__(self,stations=()):
+        """
+        Constructor
+
+        Parameters
+        ----------
+
+        **`stations : str, list, tuple, array_like or StationList`**
+
+        Station call letters.  Names longer than 8 characters are truncated.
+        """
+        if isinstance(stations,StationList):
+            calls = stations.calls
+        elif isinstance(stations,np.ndarray) and stations.dtype.kind == 'S':
+            calls = _strip(stations.astype('S8'))
+        else:
+            if isinstance(stations,str): stations = [stations]
+            calls = np.array([s.strip(' ').encode() for s in stations],dtype='S8')
+        calls.flags.writeable = False
+        self.calls = calls
+        self._list = None
+        self._index = None
+        self._order = None
+        self._sorted = None
+        self._digest = None
+
+    @classmethod
+    def frombuffer(cls,ipack,nsta):
+        """
+        Create a StationList from a packed TDLPACK station call letter record.
+
+        Parameters
+        ----------
+
+        **`ipack : array_like`**
+
+        NumPy integer array of the words of the packed record.  The call letters are the
+        big-endian bytes of the word values, so native int32 and '>i4' arrays holding
+        the same values give the same station list.
+
+        **`nsta : int`**
+
+        Number of stations in the record.
+
+        Returns
+        -------
+
+        **`StationList`**
+        """
+        nsta = int(nsta)
+        # Each station is 2 words of 4 characters stored big-endian.
+        calls = np.asarray(ipack[0:nsta*2]).astype('>i4').view('S8')
+        return cls(calls)
+
+    def pack(self):
+        """
+        Return the packed TDLPACK station call letter record.
+
+        Returns
+        -------
+
+        **`array_like`**
+
+        NumPy int32 array with 2 words per station.  Call letters are padded with
+        blanks to 8 characters.
+        """
+        chars = self.calls.view(np.uint8).reshape(-1,NCHAR).copy()
+        chars[chars == 0] = _BLANK
+        return chars.view('>i4').ravel().astype(np.int32)
+
+    @property
+    def digest(self):
+        """
+        SHA-1 digest of the station call letters.  Equal station lists have the same digest.
+        """
+        if self._digest is None:
+            self._digest = hashlib.sha1(self.calls.tobytes()).digest()
+        return self._digest
+
+    def tolist(self):
+        """
+        Return the station call letters as a list of str.
+        """
+        if self._list is None:
+            self._list = self.calls.astype('U8').tolist()
+        return self._list
+
+    def index(self,name,start=0,stop=None):
+        """
+        Return the position of station name.  ValueError is raised if not found.
+        """
+        if start != 0 or stop is not None:
+            found = np.flatnonzero(self.calls[start:stop] == _encode(name))
+            if found.size == 0:
+                raise ValueError("%r is not in station list"%(name,))
+            return int(found[0])+start
+        if self._index is None:
+            # Build in reverse so that the first occurrence of duplicate names is kept,
+            # as with list.index().
+            n = len(self)
+            self._index = dict(zip(reversed(self.tolist()),range(n-1,-1,-1)))
+        try:
+            return self._index[name.strip(' ') if isinstance(name,str) else name.decode()]
+        except KeyError:
+            raise ValueError("%r is not in station list"%(name,))
+
+    def positions(self,names):
+        """
+        Return the positions of many stations at once.
+
+        Parameters
+        ----------
+
+        **`names : list of str or array_like`**
+
+        Station call letters.
+
+        Returns
+        -------
+
+        **`array_like`**
+
+        NumPy int array of the position of each station.  Stations that are not in the
+        station list, including names longer than 8 characters, have position -1.
+        """
+        if self._order is None:
+            order = np.argsort(self.calls,kind='stable')
+            self._sorted = self.calls[order]
+            self._order = order
+        if isinstance(names,StationList):
+            names = names.calls
+        elif not (isinstance(names,np.ndarray) and names.dtype.kind == 'S'):
+            names = np.array([_encode(n) for n in names],dtype='S')
+        if len(self) == 0:
+            return np.full(names.shape,-1,dtype=np.intp)
+        long = None
+        if names.dtype.itemsize > NCHAR:
+            # Casting to S8 truncates longer names, which must not match a station.
+            long = np.char.str_len(names) > NCHAR
+            names = names.astype('S8')
+        k = np.searchsorted(self._sorted,names)
+        k[k == len(self)] = 0
+        found = self._sorted[k] == names
+        if long is not None:
+            found &= ~long
+        return np.where(found,self._order[k],-1)
+
+    def __len__(self):
+        return self.calls.shape[0]
+
+    def __getitem__(self,key):
+        if isinstance(key,slice):
+            return self.tolist()[key]
+        return self.calls[key].decode()
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __contains__(self,name):
+        return bool(np.any(self.calls == _encode(name)))
+
+    def __eq__(self,other):
+        if isinstance(other,StationList):
+            return np.array_equal(self.calls,other.calls)
+        if isinstance(other,(list,tuple)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    def __ne__(self,other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    __hash__ = None
+
+    def __array__(self,dtype=None):
+        return self.calls.astype('U8' if dtype is None else dtype)
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def __reduce__(self):
+        return (StationList,(self.calls,))
+
+class StationListRegistry(object):
+    """
+    Registry of station lists interned by content.
+
+    Identical station lists (e.g. the same station call letter record read from many
+    files, or many times from the same file) are represented by a single `StationList`
+    object, so that memory and the lazily built lookup indexes are shared.  The registry
+    only holds weak references; a station list is released when no file or record refers
+    to it anymore.
+
+    Attributes
+    ----------
+
+    **`hits : int`**
+
+    Number of station lists that were already registered.
+
+    **`misses : int`**
+
+    Number of station lists that were added to the registry.
+    """
+    def __init__(self):
+        """Contructor"""
+        self.hits = 0
+        self.misses = 0
+        self._lists = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._lists)
+
+    def intern(self,stations):
+        """
+        Return the registered station list equal to stations, registering it if necessary.
+
+        Parameters
+        ----------
+
+        **`stations : StationList`**
+
+        Station list.
+
+        Returns
+        -------
+
+        **`StationList`**
+        """
+        key = stations.digest
+        with self._lock:
+            existing = self._lists.get(key)
+            if existing is not None and existing == stations:
+                self.hits += 1
+                return existing
+            self._lists[key] = stations
+            self.misses += 1
+            return stations
+
+station_list_registry = StationListRegistry()
+
+def _encode(name):
+    return name.strip(' ').encode() if isinstance(name,str) else name
+
+def _strip(calls):
+    """
+    Replace leading and trailing blanks of S8 call letters with NUL bytes so that they
+    are stripped when read from the array.  calls is modified in place.  Leading blanks are rare, so those names are
+    handled individually.
+    """
+    calls = np.ascontiguousarray(calls)
+    chars = calls.view(np.uint8).reshape(-1,NCHAR)
+    blank = chars == _BLANK
+    trailing = np.logical_and.accumulate(blank[:,::-1],axis=1)[:,::-1]
+    chars[trailing] = 0
+    leading = blank[:,0] & ~trailing[:,0]
+    if np.any(leading):
+        calls[leading] = [c.strip(b' ') for c in calls[leading]]
+    return calls
@@ -0,0 +1,216 @@
+"""
+Management of Fortran logical unit numbers and open random-access files.
+
+Fortran unit numbers of closed files are returned to a pool and reused by the next file
+that is opened, so a long-running process can open and close any number of files.
+
+Random-access files are read and written through the MOS-2000 random-access file system,
+which keeps a fixed size table of open files (COMMON /ARGC/).  When a file that is not
+in the table is accessed, the MOS-2000 routines close the least recently used file and
+(re)open the file, which is expensive.  `RandomAccessFileCache` tracks the use of the
+table from Python, limits the number of files held open to a configurable size and
+keeps hit, miss and eviction counts.  The position of the last record read from an
+evicted file is kept and restored when the file is reopened, so reading the next record
+continues where it left off.
+"""
+import collections
+import threading
+
+import numpy as np
+
+import tdlpack
+
+# Value of NOPEN( ) for an unused slot of the random-access open file table.
+_UNUSED_SLOT = 9999
+
+# Physical record number of the first key record of a random-access file.
+_FIRST_KEY_RECORD = 2
+
+class LunPool(object):
+    """
+    Pool of released Fortran logical unit numbers.
+
+    Attributes
+    ----------
+
+    **`reused : int`**
+
+    Number of unit numbers handed out from the pool.
+    """
+    def __init__(self):
+        """Contructor"""
+        self.reused = 0
+        self._free = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._free)
+
+    def acquire(self):
+        """
+        Return a released unit number, or 0 if there are none.  A unit number of 0
+        tells `tdlpack.openfile` to assign a new unit number.
+        """
+        with self._lock:
+            if not self._free:
+                return 0
+            self.reused += 1
+            return self._free.pop()
+
+    def release(self,lun):
+        """
+        Return unit number lun to the pool.
+        """
+        lun = int(lun)
+        if lun <= 0:
+            return
+        with self._lock:
+            if lun not in self._free:
+                self._free.append(lun)
+
+class RandomAccessFileCache(object):
+    """
+    LRU cache of random-access files held open in the MOS-2000 open file table.
+
+    Attributes
+    ----------
+
+    **`max_open : int`**
+
+    Maximum number of random-access files held open at the same time.  This cannot be
+    larger than the size of the MOS-2000 open file table (`table_size`).
+
+    **`table_size : int`**
+
+    Size of the MOS-2000 open file table (parameter MAXOPN).
+
+    **`hits : int`**
+
+    Number of accesses to a file that was already open.
+
+    **`misses : int`**
+
+    Number of accesses that had to open the file.
+
+    **`evictions : int`**
+
+    Number of files closed to make room for another file.
+    """
+    def __init__(self,max_open=None):
+        """Contructor"""
+        self.table_size = int(tdlpack.argc.nopen.shape[0])
+        self.max_open = self.table_size if max_open is None else min(int(max_open),self.table_size)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._luns = collections.OrderedDict()
+        self._positions = {}
+        self._lock = threading.RLock()
+
+    def _table(self):
+        return set(int(n) for n in tdlpack.argc.nopen if n != _UNUSED_SLOT and n != 0)
+
+    def _slot(self,lun):
+        slots = np.flatnonzero(tdlpack.argc.nopen == lun)
+        return int(slots[0]) if slots.size > 0 else None
+
+    def touch(self,kstdout,lun,name,l3264b,irw=1):
+        """
+        Record an access to the random-access file on unit lun.  Must be called before
+        the file is accessed by the MOS-2000 random-access routines.  If the file is not
+        open and `max_open` files are open, the least recently used file is closed.  If
+        the file was closed by the cache, it is reopened here and the position of the last
+        record read is restored.
+        """
+        lun = int(lun)
+        with self._lock:
+            table = self._table()
+            if lun in table:
+                self.hits += 1
+            else:
+                self.misses += 1
+                while len(table) >= self.max_open:
+                    victim = self._lru(table,lun)
+                    if victim is None:
+                        break
+                    self._evict(kstdout,victim)
+                    table.discard(victim)
+                position = self._positions.pop(lun,None)
+                if position is not None:
+                    self._reopen(kstdout,lun,name,l3264b,irw,position)
+            self._luns[lun] = True
+            self._luns.move_to_end(lun)
+
+    def _lru(self,table,lun):
+        for victim in self._luns:
+            if victim != lun and victim in table and self._restorable(victim):
+                return victim
+        # Files opened outside of this cache or positioned past the first key record;
+        # let MOS-2000 choose.
+        return None
+
+    def _restorable(self,lun):
+        # The position can only be restored if it is within the key record that is read
+        # when the file is reopened.
+        slot = self._slot(lun)
+        return slot is not None and tdlpack.argc.lstrd[0,slot] in (0,_FIRST_KEY_RECORD)
+
+    def _evict(self,kstdout,lun):
+        slot = self._slot(lun)
+        position = tuple(int(n) for n in tdlpack.argc.lstrd[:,slot])
+        ier = tdlpack.clfilm(kstdout,lun)
+        if ier == 0:
+            self._positions[lun] = position
+            self.evictions += 1
+
+    def _reopen(self,kstdout,lun,name,l3264b,irw,position):
+        tdlpack.flopnm(kstdout,lun,name,irw,0,l3264b,0,0)
+        slot = self._slot(lun)
+        if slot is not None and tdlpack.argc.noprec[1,slot] == _FIRST_KEY_RECORD:
+            tdlpack.argc.lstrd[:,slot] = position
+
+    def discard(self,lun):
+        """
+        Forget unit lun.  Called after the file on unit lun has been closed.
+        """
+        with self._lock:
+            self._luns.pop(int(lun),None)
+            self._positions.pop(int(lun),None)
+
+    def stats(self):
+        """
+        Return a dict of cache metrics.
+        """
+        with self._lock:
+            return {'hits':self.hits,'misses':self.misses,'evictions':self.evictions,
+                    'open':len(self._table()),'max_open':self.max_open,
+                    'table_size':self.table_size}
+
+lun_pool = LunPool()
+ra_file_cache = RandomAccessFileCache()
+
+def configure_ra_files(max_open=None):
+    """
+    Configure the number of random-access files held open at the same time.
+
+    Parameters
+    ----------
+
+    **`max_open : int, optional`**
+
+    Maximum number of random-access files held open.  When more random-access files are
+    in use, the least recently used one is closed and transparently reopened the next
+    time it is accessed.  The value is limited to the size of the MOS-2000 open file
+    table (64).
+    """
+    if max_open is not None:
+        if int(max_open) < 1:
+            raise ValueError("max_open must be at least 1")
+        ra_file_cache.max_open = min(int(max_open),ra_file_cache.table_size)
+
+def ra_file_stats():
+    """
+    Returns a dict of random-access open file cache metrics: hits, misses, evictions,
+    the number of open files and the configured and maximum table sizes.
+    """
+    return ra_file_cache.stats()
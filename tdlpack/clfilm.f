@@ -117,8 +117,8 @@ C
 C        NON SYSTEM SUBROUTINES USED 
 C            CLFM 
 C 
-      PARAMETER (MAXOPN=2,
-     1           MAXFIL=20, 
+      PARAMETER (MAXOPN=64,
+     1           MAXFIL=256, 
      2           NW=840) 
 C
       CHARACTER*1024 CFILE,CLIST
@@ -21,6 +21,8 @@ C        AUGUST   2012   ENGLE      ADDED IRAEND AND MODIFIED CALLING
 C                                   SEQUENCE TO INCLUDE IRAEND.
 C        SEPT     2012   ENGLE,     ADDED NRAEND TO COMMON ARG; MODIFIED
 C                        J. WAGNER  CALL TO ARINIT;
+C        OCTOBER  2026              CHANGED MAXOPN FROM 2 TO 64 AND MAXFIL
+C                                   FROM 20 TO 256.
 C
 C        NOTE: ADDING THE CONVERT= SPECIFIER WILL BREAK THIS ROUTINE
 C              USING IBM XL FORTRAN.
@@ -189,8 +191,8 @@ C
 C        NON SYSTEM SUBROUTINES USED 
 C            CKRAEND, CLFILM, WRKEYM, RDKEYM, TDLPRM (/D ONLY)
 C 
-      PARAMETER (MAXOPN=2,
-     1           MAXFIL=20, 
+      PARAMETER (MAXOPN=64,
+     1           MAXFIL=256, 
      2           NW=840) 
 C
       CHARACTER*1024 CFILX,CFILE,CLIST
@@ -10,7 +10,7 @@ character(len=*), intent(in) :: mode
 integer, intent(in) :: l3264b
 integer, intent(inout) :: byteorder
 integer, intent(inout) :: ftype
-integer, intent(out) :: lun
+integer, intent(inout) :: lun
 integer, intent(out) :: ier
 integer, intent(in), optional :: ra_maxent
 integer, intent(in), optional :: ra_nbytes
@@ -38,11 +38,14 @@ caction="readwrite"
 cstatus=""
 
 ! ---------------------------------------------------------------------------------------- 
-! Get byte order of the system and set unit number.
+! Get byte order of the system and set unit number.  If lun > 0, the unit number was
+! provided by the caller (i.e. a unit number released by a closed file is reused).
 ! ---------------------------------------------------------------------------------------- 
-if(ienter.eq.0)call cksysend(6,"     ",isysend,ier)
-lun=lunx+ienter
-ienter=ienter+1
+if(isysend.eq.0)call cksysend(6,"     ",isysend,ier)
+if(lun.le.0)then
+   lun=lunx+ienter
+   ienter=ienter+1
+endif
 
 ! ---------------------------------------------------------------------------------------- 
 ! Perform the following for read (only) and append (can be read and/or write).
@@ -135,8 +135,8 @@ C
 C        NON SYSTEM SUBROUTINES USED 
 C            FLOPNM, RDTM, CKSYSEND 
 C 
-      PARAMETER (MAXOPN=2,
-     1           MAXFIL=20, 
+      PARAMETER (MAXOPN=64,
+     1           MAXFIL=256, 
      2           NW=840) 
 C
       CHARACTER*1024 CFILX,CFILE,CLIST
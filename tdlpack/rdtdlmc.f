@@ -129,8 +129,8 @@ C
 C        NON SYSTEM SUBROUTINES USED 
 C            FLOPNM, RDTM, CKSYSEND 
 C 
-      PARAMETER (MAXOPN=2,
-     1           MAXFIL=20, 
+      PARAMETER (MAXOPN=64,
+     1           MAXFIL=256, 
      2           NW=840) 
 C
       CHARACTER(LEN=L3264B/8), DIMENSION(NSIZE) :: RECORD
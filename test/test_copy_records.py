@@ -0,0 +1,52 @@
+import numpy as np
+import TdlpackIO
+
+
+def test_copy_records_query(request, tmp_path):
+    sampledata = request.config.rootdir / 'sampledata'
+    dest = str(tmp_path / 'subset.sq')
+    with TdlpackIO.open(str(sampledata / 'stations.sq')) as f:
+        dates = [2021090206, 2021090406]
+        assert f.copy_records(dest, date=dates) == 4
+        expected = f.fetch(date=dates)
+    with TdlpackIO.open(dest) as f:
+        assert f._index['type'] == ['station', 'data', 'data', 'trailer']
+        recs = f.read(4)
+    for rec, exp in zip(recs[1:3], expected):
+        np.testing.assert_array_equal(rec.ipack, exp.ipack)
+        # Data records are linked to the copied station call letter record.
+        rec.unpack(data=True)
+        assert rec.get_stations(recs[0].stations[0:2]).shape == (2,)
+
+
+def test_copy_records_byte_for_byte(request, tmp_path):
+    sampledata = request.config.rootdir / 'sampledata'
+    src = str(sampledata / 'gfspkd47.2017020100.sq')
+    dest = str(tmp_path / 'all.sq')
+    with TdlpackIO.open(src) as f:
+        assert f.copy_records(dest, records=range(1, f.records+1)) == f.records+1
+    with open(src, 'rb') as a, open(dest, 'rb') as b:
+        copied = b.read()
+        assert copied[:-40] == a.read()
+    assert copied[-40:] == TdlpackIO._TRAILER_RECORD
+
+
+def test_copy_records_mixed_station_and_grid(request, tmp_path):
+    sampledata = request.config.rootdir / 'sampledata'
+    src = tmp_path / 'mixed.sq'
+    with open(src, 'wb') as out:
+        for name in ('stations.sq', 'gfspkd47.2017020100.sq'):
+            with open(sampledata / name, 'rb') as f:
+                out.write(f.read())
+    dest = str(tmp_path / 'subset.sq')
+    with TdlpackIO.open(str(src)) as f:
+        assert f.records == 224
+        # Grid records that follow station records are copied without a station
+        # call letter record.
+        assert f.copy_records(dest, records=[125, 126]) == 3
+        with TdlpackIO.open(dest) as g:
+            assert g._index['type'] == ['data', 'data', 'trailer']
+        assert f.copy_records(dest, records=[2, 125, 224]) == 5
+    with TdlpackIO.open(dest) as f:
+        assert f._index['type'] == ['station', 'data', 'data', 'data', 'trailer']
+        assert [len(d) for d in f._index['dims'][1:4]] == [1, 2, 2]
@@ -0,0 +1,44 @@
+import shutil
+
+import numpy as np
+import pytdlpack
+
+
+def test_lun_recycled_on_close(request):
+    sampledata = request.config.rootdir / 'sampledata'
+    luns = set()
+    for _ in range(50):
+        f = pytdlpack.open(sampledata / 'gfspkd47.2017020100.sq')
+        luns.add(int(f.fortran_lun))
+        f.read()
+        f.close()
+    assert len(luns) == 1
+
+
+def test_ra_file_cache(request, tmp_path):
+    sampledata = request.config.rootdir / 'sampledata'
+    names = []
+    for n in range(4):
+        name = tmp_path / ('copy%d.ra' % n)
+        shutil.copy(sampledata / 'blend.analysisgrconst.co.ra', name)
+        names.append(str(name))
+    files = [pytdlpack.open(name) for name in names]
+    assert len(set(int(f.fortran_lun) for f in files)) == 4
+    pytdlpack.configure_ra_files(max_open=2)
+    try:
+        before = pytdlpack.ra_file_stats()
+        ids = []
+        for _ in range(2):
+            for f in files:
+                rec = f.read()
+                ids.append(tuple(rec.id))
+        stats = pytdlpack.ra_file_stats()
+        assert stats['open'] <= 2
+        assert stats['evictions'] > before['evictions']
+        assert stats['misses'] - before['misses'] == 8
+        # Files reopened after eviction continue reading where they left off.
+        assert ids[:4] == [ids[0]]*4 and ids[4:] == [ids[4]]*4 and ids[0] != ids[4]
+    finally:
+        for f in files:
+            f.close()
+        pytdlpack.configure_ra_files(max_open=64)
@@ -0,0 +1,49 @@
+import numpy as np
+import pytdlpack
+
+
+def test_nearest_to_coarser_grid():
+    # gfs95 points coincide with every other gfs47 point.
+    g47 = pytdlpack.grids['gfs47']
+    data = np.random.default_rng(0).random((2, g47['nx'], g47['ny'])).astype(np.float32)
+    remap = pytdlpack.GridRemapper('gfs47', 'gfs95', method='nearest')
+    out = remap(data)
+    assert out.shape == (2, 149, 85)
+    np.testing.assert_array_equal(out, data[:, ::2, ::2])
+
+
+def test_bilinear_matches_station_sampler():
+    remap = pytdlpack.GridRemapper('nam221', 'gfs47', method='bilinear')
+    g = pytdlpack.grids['nam221']
+    data = np.random.default_rng(1).random((g['nx'], g['ny'])).astype(np.float32)
+    lats, lons = pytdlpack.grid_to_latlon('gfs47', [150.0, 200.0], [100.0, 120.0])
+    sampler = pytdlpack.StationSampler('nam221', lats, lons, method='bilinear')
+    out = remap(data)
+    np.testing.assert_allclose(out[[149, 199], [99, 119]], sampler(data), atol=1e-4)
+    # Points outside of the source grid are missing.
+    assert out[0, 0] == 9999.0
+    assert not remap.inside.all()
+    # Only points inside of the source grid are stored.
+    assert remap.points.shape == (remap.inside.sum(),)
+    assert remap.index.shape == remap.weights.shape == (remap.inside.sum(), 4)
+
+
+def test_disk_cache_and_records(request, tmp_path):
+    sampledata = request.config.rootdir / 'sampledata'
+    with pytdlpack.open(sampledata / 'gfspkd47.2017020100.sq') as f:
+        rec = f.read()
+    remap = pytdlpack.GridRemapper('gfs47', 'gfs95',
+                                   method='bilinear', directory=str(tmp_path))
+    files = list(tmp_path.glob('remap_*.npz'))
+    assert len(files) == 1
+    # Tables are sparse: (npts, k) source indices and weights per destination point.
+    with np.load(str(files[0])) as npz:
+        assert sorted(npz.files) == ['index', 'points', 'weights']
+        assert npz['index'].shape == npz['weights'].shape == (remap.inside.sum(), 4)
+    new = remap.remap(rec)
+    assert new.type == 'grid' and new.data.shape == (149, 85)
+    # The record has its own copy of the grid definition.
+    assert new.grid_def == remap.dst and new.grid_def is not pytdlpack.grids['gfs95']
+    new.pack(dec_scale=1)
+    new.unpack(data=True)
+    assert (new.nx, new.ny) == (149, 85)
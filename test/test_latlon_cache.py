@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+import pytdlpack
+
+
+def test_latlons_shared_and_readonly(request):
+    sampledata = request.config.rootdir / 'sampledata'
+    pytdlpack.clear_latlon_cache()
+    with pytdlpack.open(sampledata / 'gfspkd47.2017020100.sq') as f:
+        rec1 = f.read()
+        rec2 = f.read()
+    lats1, lons1 = rec1.latlons()
+    lats2, lons2 = rec2.latlons()
+    assert lats1 is lats2 and lons1 is lons2
+    assert lats1.shape == (297, 169)
+    with pytest.raises(ValueError):
+        lats1[0, 0] = 0.0
+
+
+def test_latlons_disk_store(request, tmp_path):
+    sampledata = request.config.rootdir / 'sampledata'
+    pytdlpack.configure_latlon_cache(directory=str(tmp_path))
+    try:
+        pytdlpack.clear_latlon_cache()
+        with pytdlpack.open(sampledata / 'gfspkd47.2017020100.sq') as f:
+            rec = f.read()
+        lats, lons = rec.latlons()
+        pytdlpack.clear_latlon_cache()
+        lats_mm, lons_mm = rec.latlons()
+        assert isinstance(lats_mm, np.memmap)
+        np.testing.assert_array_equal(lats, lats_mm)
+        np.testing.assert_array_equal(lons, lons_mm)
+    finally:
+        pytdlpack.configure_latlon_cache(directory='')
+        pytdlpack.clear_latlon_cache()
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+import pytdlpack
+import tdlpack
+
+
+def _fortran_latlons(g):
+    lats, lons, ier = tdlpack.gridij_to_latlon(6, g['nx'], g['ny'], g['proj'], g['meshlength'],
+                                               g['orientlon'], g['stdlat'], g['latll'], g['lonll'])
+    return lats, lons
+
+
+@pytest.mark.parametrize('name', sorted(pytdlpack.grids))
+def test_grid_to_latlon_matches_fortran(name):
+    g = pytdlpack.grids[name]
+    flats, flons = _fortran_latlons(g)
+    i, j = np.meshgrid(np.arange(1, g['nx']+1), np.arange(1, g['ny']+1), indexing='ij')
+    lats, lons = pytdlpack.grid_to_latlon(name, i, j)
+    assert lats.shape == flats.shape
+    # The Fortran routines work in single precision.  Near the pole and where the
+    # ACOS in PSIJLL is ill-conditioned their longitudes are off by up to 3e-3 degrees,
+    # so the positions are compared in grid lengths instead of degrees: both must be
+    # within 1/100 of a grid length.
+    scale = np.degrees(1.)*g['meshlength']/6371200.
+    dlon = np.abs(lons-flons)
+    dlon = np.minimum(dlon, 360.-dlon)*np.cos(np.radians(lats))
+    assert np.abs(lats-flats).max() < 1e-2*scale
+    assert dlon.max() < 1e-2*scale
+    # Single precision input is computed in double precision and only rounded.
+    lats32, lons32 = pytdlpack.grid_to_latlon(name, i.astype(np.float32), j.astype(np.float32))
+    assert lats32.dtype == np.float32
+    np.testing.assert_allclose(lats32, lats, atol=1e-4)
+    dlon = np.abs(lons32-lons)
+    assert (np.minimum(dlon, 360.-dlon)*np.cos(np.radians(lats))).max() < 1e-4
+
+
+@pytest.mark.parametrize('name', sorted(pytdlpack.grids))
+def test_latlon_to_grid_matches_fortran(name):
+    g = pytdlpack.grids[name]
+    flats, flons = _fortran_latlons(g)
+    i, j = np.meshgrid(np.arange(1, g['nx']+1), np.arange(1, g['ny']+1), indexing='ij')
+    xi, yj = pytdlpack.latlon_to_grid(g, flats[::5, ::5].astype(np.float64), flons[::5, ::5].astype(np.float64))
+    np.testing.assert_allclose(xi, i[::5, ::5], atol=1e-2)
+    np.testing.assert_allclose(yj, j[::5, ::5], atol=1e-2)
+
+
+def test_projection_scalars_and_dtype():
+    lat, lon = pytdlpack.grid_to_latlon('nbmco', 1, 1)
+    assert lat.shape == () and lat.dtype == np.float64
+    assert abs(lat-19.2290) < 1e-3 and abs(lon-126.2766) < 1e-3
+    lats, lons = pytdlpack.grid_to_latlon('nbmco', np.float32([1, 2]), np.float32(1))
+    assert lats.dtype == np.float32 and lats.shape == (2,)
@@ -0,0 +1,46 @@
+import numpy as np
+import pytdlpack
+
+
+def test_compact_ra_file(request, tmp_path):
+    sampledata = request.config.rootdir / 'sampledata'
+    # Records are read one at a time and only their packed words are kept; ipack is
+    # allocated with ND5 words per record.
+    recs = []
+    with pytdlpack.open(sampledata / 'gfspkd47.2017020100.sq') as f:
+        while True:
+            r = f.read()
+            if f.eof:
+                break
+            if type(r) is pytdlpack.TdlpackRecord:
+                r.ipack = r.ipack[:r.ioctet//4].copy()
+                recs.append(r)
+    name = str(tmp_path / 'frag.ra')
+    with pytdlpack.RandomAccessWriter(name, len(recs), nbytes=2000, maxent=5) as w:
+        for r in recs:
+            w.write(r)
+
+    # Delete every other record of the first key record the way WRTM does when a
+    # replaced record does not fit: the ID and length words of the entry are zeroed.
+    words = np.fromfile(name, dtype='>i4')
+    keyrec = 500
+    for n in (0, 2, 4):
+        words[keyrec+3+n*6:keyrec+3+n*6+5] = 0
+    words.tofile(name)
+    live = [r for n, r in enumerate(recs) if n not in (0, 2, 4)]
+
+    report = pytdlpack.compact_ra_file(name, nlookups=10)
+    assert report['records'] == len(live)
+    assert report['key_records_before'] == 20
+    assert report['key_records_after'] == 1
+    assert report['reclaimed'] > 0
+    assert report['lookup_time_before'] > 0 and report['lookup_time_after'] > 0
+    assert not [p for p in tmp_path.iterdir() if p.name.endswith('.tmp')]
+
+    with pytdlpack.open(name) as f:
+        assert f.keys() == [tuple(r.id) for r in live]
+        for r in live:
+            rec = f.read(id=r.id)
+            rec.unpack(data=True)
+            r.unpack(data=True)
+            np.testing.assert_array_equal(rec.data, r.data)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+import pytdlpack
+import TdlpackIO
+
+
+def test_sequential_ra_round_trip(request, tmp_path):
+    sampledata = request.config.rootdir / 'sampledata'
+    src = str(sampledata / 'gfspkd47.2017020100.sq')
+    ra = str(tmp_path / 'gfs.ra')
+    sq = str(tmp_path / 'gfs.sq')
+    assert pytdlpack.sequential_to_ra(src, ra) == {'records': 100, 'skipped': 0}
+    assert pytdlpack.ra_to_sequential(ra, sq) == {'records': 100}
+
+    # Records read from the random-access file with the MOS-2000 routines are the
+    # same as those of the sequential file, except for the byte swapped first word.
+    with TdlpackIO.open(src) as f:
+        expected = f.read(100)
+    f = pytdlpack.open(ra)
+    f._ra_index = None
+    for exp in expected:
+        rec = f.read(id=[9999, 0, 0, 0])
+        assert rec.ipack[0] == exp.ipack[0].byteswap()
+        np.testing.assert_array_equal(rec.ipack[1:exp.ioctet//4], exp.ipack[1:])
+    f.close()
+
+    # The packed records of the round trip are identical and a trailer is added.
+    with TdlpackIO.open(sq) as f:
+        assert f.records == 101
+        assert f._index['type'][-1] == 'trailer'
+        for exp, rec in zip(expected, f.read(100)):
+            np.testing.assert_array_equal(rec.ipack, exp.ipack)
+    with open(sq, 'rb') as f:
+        assert f.read()[-40:] == TdlpackIO._TRAILER_RECORD
+
+
+def test_ra_to_sequential_first_word(request, tmp_path):
+    # Record 409353000 of this file is stored with its first word not byte swapped.
+    sampledata = request.config.rootdir / 'sampledata'
+    src = str(sampledata / 'blend.analysisgrconst.co.ra')
+    sq = str(tmp_path / 'blend.sq')
+    assert pytdlpack.ra_to_sequential(src, sq) == {'records': 7}
+    with TdlpackIO.open(sq) as f:
+        assert list(f._index['type']) == ['data']*7 + ['trailer']
+        recs = f.read(7)
+    with pytdlpack.open(src) as ra:
+        keys = ra.keys()
+        for key, rec in zip(keys, recs):
+            exp = ra.read(id=list(key))
+            exp.unpack(data=True)
+            rec.unpack(data=True)
+            assert tuple(rec.id) == key
+            np.testing.assert_array_equal(rec.data, exp.data)
+    # And back again.
+    ra = str(tmp_path / 'blend.ra')
+    assert pytdlpack.sequential_to_ra(sq, ra) == {'records': 7, 'skipped': 0}
+    with pytdlpack.open(ra) as f:
+        assert f.keys() == keys
+
+
+def test_sequential_to_ra_duplicates(request, tmp_path):
+    sampledata = request.config.rootdir / 'sampledata'
+    ra = str(tmp_path / 'stations.ra')
+    with pytest.raises(ValueError, match='Duplicate record ID'):
+        pytdlpack.sequential_to_ra(str(sampledata / 'stations.sq'), ra)
+    assert not (tmp_path / 'stations.ra').exists()
+    report = pytdlpack.sequential_to_ra(str(sampledata / 'stations.sq'), ra, duplicates='skip')
+    assert report == {'records': 2, 'skipped': 122}
+    with pytdlpack.open(ra) as f:
+        assert f.keys() == [(400001000, 0, 0, 0), (704218000, 0, 0, 0)]
+        rec = f.read(id=[704218000, 0, 0, 0])
+        rec.unpack(data=True)
+        assert len(rec.get_stations(['KACY'])) == 1
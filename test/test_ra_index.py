@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+import pytdlpack
+
+
+def test_ra_keys_and_fetch(request):
+    sampledata = request.config.rootdir / 'sampledata'
+    with pytdlpack.open(sampledata / 'blend.analysisgrconst.co.ra') as f:
+        keys = f.keys()
+        assert len(keys) == 7
+        assert keys[0] == (400350000, 0, 0, 0)
+        assert keys[1] in f and list(keys[1]) in f
+        assert (1, 2, 3, 4) not in f
+        assert f.read(id=[1, 2, 3, 4]) is None
+        recs = f.fetch(id=[409350000, -1, -1, -1])
+        assert [tuple(r.id) for r in recs] == [k for k in keys if k[0] == 409350000]
+        assert len(f.fetch(lead=0)) == 7
+        assert len(f.fetch(date=0)) == 7
+        assert f.fetch(date=2017020100) == []
+
+
+def test_ra_direct_read_matches_fortran(request):
+    sampledata = request.config.rootdir / 'sampledata'
+    with pytdlpack.open(sampledata / 'blend.analysisgrconst.co.ra') as f:
+        expected = []
+        while True:
+            rec = f.read(id=[9999, 0, 0, 0])
+            if f.eof:
+                break
+            rec.unpack(data=True)
+            expected.append(rec)
+        for exp, key in zip(expected, f.keys()):
+            rec = f.read(id=key)
+            rec.unpack(data=True)
+            np.testing.assert_array_equal(rec.id, exp.id)
+            np.testing.assert_array_equal(rec.data, exp.data)
+
+
+def test_ra_index_requires_read_mode(request, tmp_path):
+    with pytdlpack.open(str(tmp_path / 'new.ra'), mode='w', format='random-access') as f:
+        with pytest.raises(IOError):
+            f.keys()
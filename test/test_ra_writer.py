@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+import pytdlpack
+from pytdlpack._ra_writer import choose_layout, MAXENT_MAX
+
+
+def _records(sampledata):
+    # Records are read one at a time and only their packed words are kept; ipack is
+    # allocated with ND5 words per record.
+    recs = []
+    with pytdlpack.open(sampledata / 'gfspkd47.2017020100.sq') as f:
+        while True:
+            r = f.read()
+            if f.eof:
+                break
+            if type(r) is pytdlpack.TdlpackRecord:
+                r.unpack(data=True)
+                r.ipack = r.ipack[:r.ioctet//4].copy()
+                recs.append(r)
+    return recs
+
+
+def _read_sequential(name):
+    # Reads through the MOS-2000 routines, following the key record chain.  Returns the
+    # IDs and data of the records.
+    f = pytdlpack.open(name)
+    f._ra_index = None
+    out = []
+    while True:
+        rec = f.read(id=[9999, 0, 0, 0])
+        if f.eof:
+            break
+        rec.unpack(data=True)
+        out.append((rec.id.copy(), rec.data))
+    f.close()
+    return out
+
+
+def test_choose_layout():
+    nbytes, maxent = choose_layout(50000, 7000)
+    assert nbytes == 7000 and maxent == MAXENT_MAX
+    nbytes, maxent = choose_layout(7, 100)
+    assert nbytes % 8 == 0 and (maxent*6+3) <= nbytes//4
+
+
+@pytest.mark.parametrize('maxent', [None, 30])
+def test_bulk_write(request, tmp_path, maxent):
+    recs = _records(request.config.rootdir / 'sampledata')
+    name = str(tmp_path / 'bulk.ra')
+    with pytdlpack.RandomAccessWriter(name, 50, [r.ioctet for r in recs[:50]], maxent=maxent) as w:
+        for r in recs[:90]:
+            w.write(r)
+    assert w.records == 90
+    with pytest.raises(IOError):
+        w.write(recs[0])
+
+    # Records can be appended by MOS-2000.
+    with pytdlpack.open(name, mode='a') as f:
+        for r in recs[90:]:
+            f.write(r)
+
+    out = _read_sequential(name)
+    assert len(out) == len(recs)
+    for (id, data), exp in zip(out, recs):
+        np.testing.assert_array_equal(id, exp.id)
+        np.testing.assert_array_equal(data, exp.data)
+    with pytdlpack.open(name) as f:
+        assert f.keys() == [tuple(r.id) for r in recs]
+
+
+def test_bulk_write_duplicate(request, tmp_path):
+    recs = _records(request.config.rootdir / 'sampledata')
+    with pytdlpack.RandomAccessWriter(str(tmp_path / 'dup.ra'), 2, nbytes=2000) as w:
+        w.write(recs[0])
+        with pytest.raises(ValueError):
+            w.write(recs[0])
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+import pytdlpack
+
+
+def _station_points(name):
+    g = pytdlpack.grids[name]
+    i = np.array([1.0, 10.0, 10.5, 37.25, g['nx']])
+    j = np.array([1.0, 20.0, 20.5, 11.75, g['ny']])
+    lats, lons = pytdlpack.grid_to_latlon(name, i, j)
+    return g, i, j, lats, lons
+
+
+def test_nearest_matches_grid_values():
+    g, i, j, lats, lons = _station_points('gfs47')
+    data = np.random.default_rng(0).random((g['nx'], g['ny'])).astype(np.float32)
+    sampler = pytdlpack.StationSampler('gfs47', lats, lons, method='nearest')
+    values = sampler(data)
+    expected = data[np.rint(sampler.i).astype(int)-1, np.rint(sampler.j).astype(int)-1]
+    np.testing.assert_array_equal(values, expected)
+
+
+def test_bilinear_exact_for_linear_field():
+    g, i, j, lats, lons = _station_points('nam221')
+    ig, jg = np.meshgrid(np.arange(1, g['nx']+1), np.arange(1, g['ny']+1), indexing='ij')
+    data = np.stack([2.0*ig+3.0*jg, ig-jg]).astype(np.float32)
+    sampler = pytdlpack.StationSampler('nam221', lats, lons, method='bilinear')
+    values = sampler(data)
+    assert values.shape == (2, 5)
+    # Points just outside of the grid edge are moved onto it.
+    si = np.clip(sampler.i, 1, g['nx'])
+    sj = np.clip(sampler.j, 1, g['ny'])
+    np.testing.assert_allclose(values[0], 2.0*si+3.0*sj, rtol=1e-5)
+    np.testing.assert_allclose(values[1], si-sj, atol=1e-3)
+
+
+def test_missing_and_outside_points():
+    g = pytdlpack.grids['gfs47']
+    lat, lon = pytdlpack.grid_to_latlon('gfs47', [5.0, 7.5], [5.0, 5.0])
+    sampler = pytdlpack.StationSampler(g, [lat[0], lat[1], -60.0], [lon[0], lon[1], 0.0], method='bilinear')
+    data = np.ones((g['nx'], g['ny']), dtype=np.float32)
+    data[3:7, 3:7] = 9999.0
+    values = sampler(data)
+    assert values[0] == 9999.0
+    assert values[1] == pytest.approx(1.0)
+    assert values[2] == 9999.0
+    assert not sampler.inside[2]
+
+
+def test_sample_records(request):
+    sampledata = request.config.rootdir / 'sampledata'
+    with pytdlpack.open(sampledata / 'gfspkd47.2017020100.sq') as f:
+        recs = [f.read(), f.read()]
+    for rec in recs:
+        rec.unpack(data=True)
+    lats, lons = recs[0].latlons()
+    sampler = pytdlpack.StationSampler(recs[0].grid_def, lats[[10, 20], [30, 40]], lons[[10, 20], [30, 40]])
+    values = sampler.sample(recs)
+    assert values.shape == (2, 2)
+    np.testing.assert_array_equal(values[1], recs[1].data[[10, 20], [30, 40]])
+    sta = sampler.sample_record(recs[0])
+    assert sta.type == 'station' and sta.number_of_values == 2
+    sta.pack(dec_scale=2)
@@ -0,0 +1,112 @@
+import gc
+import pickle
+
+import numpy as np
+import pytest
+import pytdlpack
+
+
+def test_station_record_pack_unpack():
+    names = ['KACY', 'KBWI', 'KDCA ', 'ABCDEFGH', 'X']
+    sta = pytdlpack.TdlpackStationRecord(names)
+    sta.pack()
+    assert sta.ioctet == 40
+    # Each station is 2 big-endian words of blank padded call letters.
+    assert sta.ipack.astype('>i4').tobytes() == b''.join(n.ljust(8).encode() for n in names)
+    rec = pytdlpack.TdlpackStationRecord(ipack=sta.ipack, ioctet=sta.ioctet)
+    rec.unpack()
+    assert rec.stations == ['KACY', 'KBWI', 'KDCA', 'ABCDEFGH', 'X']
+    assert rec.stations.calls.dtype == np.dtype('S8')
+    assert rec.stations[2] == 'KDCA'
+    assert rec.stations[-2:] == ['ABCDEFGH', 'X']
+    assert rec.stations.index('KDCA') == 2
+    assert 'KBWI' in rec.stations and 'KXXX' not in rec.stations
+
+
+def test_station_list_from_file(request):
+    sampledata = request.config.rootdir / 'sampledata'
+    with pytdlpack.open(sampledata / 'stations.sq') as f:
+        sta = f.read()
+    assert isinstance(sta, pytdlpack.TdlpackStationRecord)
+    assert len(sta.stations) == sta.number_of_stations
+    assert list(sta.stations) == sta.stations.tolist()
+    assert np.asarray(sta.stations).dtype.kind == 'U'
+    ipack = sta.ipack[:sta.number_of_stations*2].copy()
+    sta.pack()
+    np.testing.assert_array_equal(sta.ipack, ipack)
+    assert pickle.loads(pickle.dumps(sta.stations)) == sta.stations
+
+
+def test_station_list_from_tdlpackio(request):
+    import TdlpackIO
+    sampledata = request.config.rootdir / 'sampledata'
+    with TdlpackIO.open(str(sampledata / 'stations.sq')) as f:
+        sta = f.read(num=1,unpack=True)[0]
+        f.seek(1)
+        raw = f._filehandle.read(f._index['size'][0])
+    # TdlpackIO hands over the record as a '>i4' buffer of the file bytes.
+    assert sta.ipack.dtype == np.dtype('>i4')
+    assert sta.ipack.tobytes() == raw
+    expected = [raw[i:i+8].decode().strip() for i in range(0,len(raw),8)]
+    assert len(sta.stations) == len(expected) == sta.number_of_stations
+    assert sta.stations == expected
+    assert sta.stations[:3] == ['CAAW', 'CABB', 'CABF']
+
+
+def test_station_list_frombuffer_byte_order():
+    names = ['KACY', 'KBWI', 'ABCDEFGH']
+    raw = b''.join(n.ljust(8).encode() for n in names)
+    words = np.frombuffer(raw, dtype='>i4')
+    # '>i4' and native int32 words with the same values decode the same.
+    assert pytdlpack.StationList.frombuffer(words, 3) == names
+    assert pytdlpack.StationList.frombuffer(words.astype(np.int32), 3) == names
+    assert pytdlpack.StationList.frombuffer(words.astype('<i4'), 3) == names
+    np.testing.assert_array_equal(pytdlpack.StationList(names).pack(), words)
+
+
+def test_station_positions_long_names():
+    stations = pytdlpack.StationList(['KACY', 'ABCDEFGH', 'KBWI'])
+    # Names longer than 8 characters are not truncated to match a station.
+    np.testing.assert_array_equal(stations.positions(['ABCDEFGHI', 'ABCDEFGH', 'KBWI', 'KACYXXXXX']),
+                                  [-1, 1, 2, -1])
+    np.testing.assert_array_equal(stations.positions(np.array([b'ABCDEFGHI', b'KACY'])), [-1, 0])
+    np.testing.assert_array_equal(stations.positions([]), np.zeros(0))
+    assert 'ABCDEFGHI' not in stations
+
+
+def test_station_lookup(request):
+    sampledata = request.config.rootdir / 'sampledata'
+    with pytdlpack.open(sampledata / 'stations.sq') as f:
+        sta = f.read()
+        rec = f.read()
+        rec.unpack(data=True)
+        names = sta.stations.tolist()
+        assert rec[names[100]] == rec.data[100]
+        assert sta.stations.index(names[-1]) == len(names)-1
+        pick = [names[i] for i in (5, 3000, 17, 5)]
+        np.testing.assert_array_equal(rec.get_stations(pick), rec.data[[5, 3000, 17, 5]])
+        np.testing.assert_array_equal(sta.stations.positions(pick + ['NOTASTA']), [5, 3000, 17, 5, -1])
+        values = rec.get_stations(['NOTASTA', names[1]], missing_value=9999.0)
+        np.testing.assert_array_equal(values, [9999.0, rec.data[1]])
+        with pytest.raises(KeyError):
+            rec.get_stations(['NOTASTA'])
+
+
+def test_station_lists_are_interned(request):
+    sampledata = request.config.rootdir / 'sampledata'
+    lists = []
+    for _ in range(3):
+        with pytdlpack.open(sampledata / 'stations.sq') as f:
+            sta = f.read()
+            rec = f.read()
+        lists.append(sta.stations)
+        # Records keep their station list after the file is closed.
+        rec.unpack(data=True)
+        assert rec[sta.stations[0]] == rec.data[0]
+    assert lists[0] is lists[1] is lists[2]
+    assert pytdlpack.TdlpackStationRecord(lists[0].tolist()).stations is lists[0]
+    registry = pytdlpack._stations.station_list_registry
+    n = len(registry)
+    del sta, rec, lists
+    gc.collect()
+    assert len(registry) < n
@@ -52,3 +52,121 @@ def test_grid_same_as_pytdlpack(request):
     rec.unpack(data=True)
 
     np.testing.assert_array_equal(da.data, rec.data.transpose())
+
+def test_file_indexed_once(request, monkeypatch):
+    import pickle
+    import TdlpackIO
+    sampledata = request.config.rootdir / 'sampledata'
+    calls = []
+    index_records = TdlpackIO._index_records
+    def counting_index_records(*args):
+        calls.append(args[2])
+        return index_records(*args)
+    monkeypatch.setattr(TdlpackIO, '_index_records', counting_index_records)
+    ds = xr.open_dataset(sampledata / 'stations.sq', engine='tdlpack', chunks={'date': 1})
+    assert len(ds.chunks['date']) == 123
+    ds.load()
+    assert len(calls) == 1
+    # a pickled dataset reopens the file without indexing it again
+    ds = xr.open_dataset(sampledata / 'stations.sq', engine='tdlpack', chunks={'date': 1})
+    assert len(calls) == 2
+    unpickled = pickle.loads(pickle.dumps(ds))
+    ds.close()
+    xr.testing.assert_equal(unpickled.load(), ds.load())
+    assert len(calls) == 2
+
+def test_chunk_selection_matches_full_load(request):
+    sampledata = request.config.rootdir / 'sampledata'
+    ds = xr.open_dataset(sampledata / 'gfspkd47.2017020100.sq', engine='tdlpack', filters=dict(cccfff=1000))
+    full = ds['001_000'].load()
+    da = xr.open_dataset(sampledata / 'gfspkd47.2017020100.sq', engine='tdlpack', filters=dict(cccfff=1000))['001_000']
+    xr.testing.assert_equal(da.isel(uuuu=slice(2, 9, 3), x=slice(10, 20)).load(), full.isel(uuuu=slice(2, 9, 3), x=slice(10, 20)))
+    xr.testing.assert_equal(da.isel(date=0, uuuu=5, y=7).load(), full.isel(date=0, uuuu=5, y=7))
+
+def test_mismatched_station_lists(request):
+    sampledata = request.config.rootdir / 'sampledata'
+    ds_catted = xr.open_dataset(sampledata / 'test1_2.sq', engine='tdlpack')
+    ds = xr.concat([xr.open_dataset(sampledata / 'test1.sq', engine='tdlpack'),
+                    xr.open_dataset(sampledata / 'test2.sq', engine='tdlpack')], dim='date')
+    assert list(ds_catted.station.values) == sorted(ds_catted.station.values)
+    xr.testing.assert_equal(ds_catted.load(), ds.load())
+
+def test_outer_and_vectorized_indexing(request, monkeypatch):
+    import TdlpackIO
+    sampledata = request.config.rootdir / 'sampledata'
+    full = xr.open_dataset(sampledata / 'stations.sq', engine='tdlpack').load()
+    read = []
+    get_record = TdlpackIO.open.get_record
+    def counting_get_record(self, rec, unpack=True):
+        read.append(rec)
+        return get_record(self, rec, unpack)
+    monkeypatch.setattr(TdlpackIO.open, 'get_record', counting_get_record)
+
+    ds = xr.open_dataset(sampledata / 'stations.sq', engine='tdlpack')
+    sel = ds.isel(date=[9, 0, 5], station=[3, 100, 7]).load()
+    xr.testing.assert_equal(sel, full.isel(date=[9, 0, 5], station=[3, 100, 7]))
+    assert len(read) == 3
+
+    read.clear()
+    points = dict(date=xr.DataArray([0, 5], dims='p'), station=xr.DataArray([3, 4], dims='p'))
+    xr.testing.assert_equal(ds.isel(points).load(), full.isel(points))
+    assert len(read) == 2
+
+def test_preferred_chunks(request):
+    sampledata = request.config.rootdir / 'sampledata'
+    record_bytes = 169 * 297 * 4
+    ds = xr.open_dataset(sampledata / 'gfspkd47.2017020100.sq', engine='tdlpack', filters=dict(cccfff=1000),
+                         chunks={}, preferred_chunk_bytes=5 * record_bytes)
+    assert ds['001_000'].encoding['preferred_chunks'] == {'date': 1, 'lead': 1, 'uuuu': 4, 'y': 169, 'x': 297}
+    assert dict(ds.chunks) == {'date': (1,), 'lead': (1,), 'uuuu': (4, 4, 4), 'y': (169,), 'x': (297,)}
+    ds = xr.open_dataset(sampledata / 'stations.sq', engine='tdlpack', chunks={}, preferred_chunk_bytes=3279 * 4 * 50)
+    assert dict(ds.chunks) == {'date': (41, 41, 41), 'lead': (1,), 'station': (3279,)}
+
+def test_filters_pushed_down(request):
+    import TdlpackIO
+    import TdlpackBackend
+    sampledata = request.config.rootdir / 'sampledata'
+    f = TdlpackIO.open(str(sampledata / 'gfspkd47.2017020100.sq'))
+    records = TdlpackBackend.filter_records(f._index, dict(cccfff=1000, uuuu=[500, 850]))
+    assert [f._index['id1'][n] for n in records] == [1000008, 1000008]
+    assert sorted(f._index['id2'][n] for n in records) == [500, 850]
+    assert len(TdlpackBackend.filter_records(f._index, dict(date='2017-02-02'))) == 0
+    f.close()
+    dsf = xr.open_dataset(sampledata / 'stations.sq', engine='tdlpack', filters=dict(date=slice('2021-09-07', '2021-09-09'), lead=timedelta(0)))
+    ds = xr.open_dataset(sampledata / 'stations.sq', engine='tdlpack').sel(date=slice('2021-09-07', '2021-09-09'))
+    xr.testing.assert_equal(dsf, ds)
+
+def test_lazy_latlons(request):
+    import pytdlpack
+    from pytdlpack._pytdlpack import latlon_cache
+    sampledata = request.config.rootdir / 'sampledata'
+    pytdlpack.clear_latlon_cache()
+    misses = latlon_cache.misses
+    ds = xr.open_dataset(sampledata / 'gfspkd47.2017020100.sq', engine='tdlpack', filters=dict(cccfff=1000))
+    assert latlon_cache.misses == misses
+    with pytdlpack.open(sampledata / 'gfspkd47.2017020100.sq') as f:
+        rec = f.read()
+    lats, lons = rec.latlons()
+    np.testing.assert_array_equal(ds.latitude.isel(y=[3, 7], x=10).values, lats.transpose()[[3, 7], 10])
+    np.testing.assert_array_equal(ds.longitude.values, lons.transpose() * -1)
+    assert latlon_cache.misses == misses + 1
+
+def test_open_catalog(request, monkeypatch):
+    import TdlpackIO
+    import TdlpackBackend
+    sampledata = request.config.rootdir / 'sampledata'
+    # records found in two files are not silently dropped
+    with pytest.raises(ValueError, match='duplicate records'):
+        TdlpackBackend.open_catalog([sampledata / 'test1.sq', sampledata / 'test1.sq'], workers=1)
+    expected = xr.open_dataset(sampledata / 'test1_2.sq', engine='tdlpack').load()
+    ds = TdlpackBackend.open_catalog([sampledata / 'test1.sq', sampledata / 'test2.sq'], workers=2, chunks={},
+                                     preferred_chunk_bytes=5 * 4 * 3)
+    assert dict(ds.chunks) == {'date': (2, 2), 'lead': (1,), 'station': (5,)}
+    dsf = TdlpackBackend.open_catalog([sampledata / 'test1.sq', sampledata / 'test2.sq'], workers=1,
+                                      filters=dict(date=slice('2020-01-14', '2020-01-15')))
+    # chunks read records with the indexes built when the catalog was opened
+    monkeypatch.setattr(TdlpackIO, '_index_records', None)
+    xr.testing.assert_identical(ds.load(), expected)
+    xr.testing.assert_identical(dsf.load(), expected.sel(date=slice('2020-01-14', '2020-01-15')))
+    ds.close()
+    dsf.close()
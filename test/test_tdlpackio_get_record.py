@@ -0,0 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import TdlpackIO
+
+
+def test_get_record_threads(request):
+    sampledata = request.config.rootdir / 'sampledata'
+    for name in ('gfspkd47.2017020100.sq', 'stations.sq'):
+        with TdlpackIO.open(str(sampledata / name)) as f:
+            expected = [r.ipack.tobytes() for r in f.read(f.records)]
+            # Threaded reads do not move the file position used by read().
+            f.seek(0)
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                recs = list(executor.map(f.get_record, range(f.records, 0, -1)))
+            assert [r.ipack.tobytes() for r in reversed(recs)] == expected
+            assert f.read(1)[0].ipack.tobytes() == expected[0]
+            data = [n+1 for n, t in enumerate(f._index['type']) if t == 'data']
+            rec = f.get_record(data[-1])
+            rec.unpack(data=True)
+            other = f.record(data[-1])
+            other.unpack(data=True)
+            assert np.array_equal(rec.data, other.data)
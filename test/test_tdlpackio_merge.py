@@ -0,0 +1,94 @@
+import numpy as np
+import TdlpackIO
+
+
+def test_merge_sorted_by_date_id_lead(request, tmp_path):
+    sampledata = request.config.rootdir / 'sampledata'
+    odd = str(tmp_path / 'odd.sq')
+    even = str(tmp_path / 'even.sq')
+    with TdlpackIO.open(str(sampledata / 'stations.sq')) as f:
+        nrec = f.records
+        f.copy_records(odd, records=range(3, nrec+1, 2))
+        f.copy_records(even, records=range(2, nrec+1, 2))
+        expected = {r.ipack.tobytes() for r in f.read(nrec) if hasattr(r, 'reference_date')}
+
+    dest = str(tmp_path / 'merged.sq')
+    # Inputs are given in reverse order of dates to exercise the merge.
+    assert TdlpackIO.merge([even, odd], dest) == nrec+1
+    with TdlpackIO.open(dest) as f:
+        types = f._index['type']
+        assert types[0] == 'station' and types[-1] == 'trailer'
+        assert types[1:-1] == ['data']*(nrec-1)
+        dates = f._index['date'][1:-1]
+        assert dates == sorted(dates)
+        recs = f.read(nrec)
+    assert {r.ipack.tobytes() for r in recs[1:]} == expected
+
+
+def test_merge_station_segments(request, tmp_path):
+    sampledata = request.config.rootdir / 'sampledata'
+    dest = str(tmp_path / 'merged.sq')
+    TdlpackIO.merge([str(sampledata / 'test1.sq'), str(sampledata / 'test2.sq'),
+                     str(sampledata / 'gfspkd47.2017020100.sq')], dest)
+    with TdlpackIO.open(dest) as f:
+        keys = [(f._index['date'][n], f._index['id1'][n], f._index['id2'][n],
+                 f._index['id3'][n], f._index['id4'][n])
+                for n in range(f.records) if f._index['type'][n] == 'data']
+        assert keys == sorted(keys)
+        # Every station data record is preceded by a station call letter record of its
+        # segment, and segments end with a trailer.
+        for n in range(f.records):
+            if f._index['type'][n] == 'data' and 'nsta' in f._index['dims'][n]:
+                assert f._index['linked_station_id_record'][n] > 0
+            if f._index['type'][n] == 'station' and n > 0:
+                assert f._index['type'][n-1] == 'trailer'
+        assert f._index['type'][-1] == 'trailer'
+
+
+def test_merge_one_file_at_a_time(request, tmp_path, monkeypatch):
+    sampledata = request.config.rootdir / 'sampledata'
+    names = [str(sampledata / name) for name in
+             ('test1.sq', 'test2.sq', 'gfspkd47.2017020100.sq', 'stations.sq')]
+    dest = str(tmp_path / 'merged.sq')
+    nrec = TdlpackIO.merge(names, dest)
+    with TdlpackIO.open(dest) as f:
+        assert f.records == nrec
+    with open(dest, 'rb') as f:
+        expected = f.read()
+
+    # Each file is indexed and closed before the next one is opened, and at most
+    # MERGE_MAX_OPEN_FILES files are open while copying.
+    opened = []
+
+    class tracking_open(TdlpackIO.open):
+        def __init__(self, *args, **kwargs):
+            assert all(f._filehandle.closed for f in opened)
+            super().__init__(*args, **kwargs)
+            opened.append(self)
+
+    monkeypatch.setattr(TdlpackIO, 'open', tracking_open)
+    monkeypatch.setattr(TdlpackIO, 'MERGE_MAX_OPEN_FILES', 1)
+    monkeypatch.setattr(TdlpackIO, 'MERGE_BLOCK_ROWS', 7)
+    dest2 = str(tmp_path / 'merged2.sq')
+    assert TdlpackIO.merge(names, dest2) == nrec
+    assert len(opened) == len(names)
+    with open(dest2, 'rb') as f:
+        assert f.read() == expected
+
+    # The merged file is sorted, so its keys are not sorted again.
+    def no_lexsort(keys):
+        raise AssertionError('lexsort called on sorted keys')
+
+    monkeypatch.setattr(TdlpackIO.np, 'lexsort', no_lexsort)
+    dest3 = str(tmp_path / 'merged3.sq')
+    assert TdlpackIO.merge([dest], dest3) == nrec
+    with open(dest3, 'rb') as f:
+        assert f.read() == expected
+
+
+def test_is_sorted():
+    keys = np.array([[1, 2, 3], [1, 2, 4], [1, 3, 0], [2, 0, 0]], dtype=np.int64)
+    assert TdlpackIO._is_sorted(keys)
+    assert TdlpackIO._is_sorted(keys[0:1])
+    assert not TdlpackIO._is_sorted(keys[::-1])
+    assert not TdlpackIO._is_sorted(keys[[0, 2, 1, 3]])
@@ -0,0 +1,40 @@
+import pytest
+import TdlpackIO
+
+
+@pytest.mark.parametrize('filename', ['stations.sq', 'gfspkd47.2017020100.sq', 'test1.sq'])
+def test_parallel_index_matches_serial(request, monkeypatch, filename):
+    path = str(request.config.rootdir / 'sampledata' / filename)
+    with TdlpackIO.open(path) as f:
+        serial = f._index
+        records = f.records
+    # Index small files in many shards so that shard boundaries fall inside records.
+    monkeypatch.setattr(TdlpackIO, 'PARALLEL_INDEX_MIN_SIZE', 0)
+    monkeypatch.setattr(TdlpackIO, 'PARALLEL_INDEX_SHARD_MIN_SIZE', 1000)
+    with TdlpackIO.open(path, workers=3) as f:
+        assert f.records == records
+        for k in serial:
+            assert f._index[k] == serial[k], k
+
+
+def test_parallel_index_station_links(request, tmp_path, monkeypatch):
+    # Two station segments; the data records of the second segment are linked to the
+    # station record of the second segment across shard boundaries.
+    path = str(request.config.rootdir / 'sampledata' / 'stations.sq')
+    dest = str(tmp_path / 'two.sq')
+    with open(path, 'rb') as f:
+        contents = f.read()
+    with open(dest, 'wb') as f:
+        f.write(contents*2)
+    with TdlpackIO.open(dest) as f:
+        serial = f._index['linked_station_id_record']
+    monkeypatch.setattr(TdlpackIO, 'PARALLEL_INDEX_MIN_SIZE', 0)
+    monkeypatch.setattr(TdlpackIO, 'PARALLEL_INDEX_SHARD_MIN_SIZE', 1000)
+    with TdlpackIO.open(dest, workers=4) as f:
+        links = f._index['linked_station_id_record']
+        stations = [n+1 for n, t in enumerate(f._index['type']) if t == 'station']
+        assert len(stations) == 2
+        data = [n for n, t in enumerate(f._index['type']) if t == 'data']
+        assert {links[n] for n in data if n+1 < stations[1]} == {stations[0]}
+        assert {links[n] for n in data if n+1 > stations[1]} == {stations[1]}
+        assert links == serial